@@ -1,22 +1,62 @@
+import asyncio
 import signal
 import sys
 import uvicorn
 import os
 from night_salon.utils.config import Config
-from utils.logger import logger
+from night_salon.utils.logger import logger
+
+APP = "night_salon.server.server:app"
+
+
+def save_snapshots():
+    """Snapshot this process's worlds, if the server was loaded here"""
+    server = sys.modules.get("night_salon.server.server")
+    if server is not None and server.config.snapshot_dir:
+        saved = server.worlds.save_all()
+        logger.info(f"Saved {saved} world snapshots")
 
 
 def signal_handler(sig, frame):
     logger.info("Shutting down...")
+    save_snapshots()
     sys.exit(0)
 
 
+async def serve_with_tcp(config: Config):
+    """Run uvicorn and the TCP transport in one event loop, sharing server state"""
+    from night_salon.server.server import websocket_manager
+    from night_salon.server.tcp_transport import TcpTransport
+
+    server = uvicorn.Server(
+        uvicorn.Config(APP, host=config.host, port=config.port, log_config=None)
+    )
+    tcp_transport = TcpTransport(websocket_manager, config.tcp_host, config.tcp_port)
+    await tcp_transport.start()
+    try:
+        await server.serve()
+    finally:
+        await tcp_transport.close()
+
+
 def main():
     signal.signal(signal.SIGINT, signal_handler)
     config = Config()
 
+    if config.shard_count > 1:
+        from night_salon.server.sharding import run_sharded
+
+        if config.tcp_port:
+            logger.warning("TCP_PORT is ignored when running with SHARDS > 1")
+        run_sharded(config)
+        return
+
+    if config.tcp_port:
+        asyncio.run(serve_with_tcp(config))
+        return
+
     uvicorn.run(
-        "night_salon.server.server:app",
+        APP,
         host=config.host,
         port=config.port,
         log_config=None,
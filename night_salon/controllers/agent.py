@@ -36,6 +36,6 @@ class AgentController:
 
         return {
             "agent_id": self.agent.id,
-            "state": self.agent.state,
+            "state": self.agent.snapshot_state(),
             "actions": plan["actions"],
         }
@@ -0,0 +1,128 @@
+from typing import Optional
+
+import numpy as np
+
+ASSIGNMENT_MODES = ("random", "greedy", "auction")
+
+
+def greedy_assignment(
+    agent_positions: np.ndarray,
+    location_positions: np.ndarray,
+    forbidden: Optional[np.ndarray] = None,
+) -> np.ndarray:
+    """Give each agent, in order, the nearest location nobody has taken yet
+
+    `forbidden` optionally holds one location index per agent (-1 for none)
+    that agent must not get. Returns the location index per agent, or -1
+    once locations run out. Runs in O(N * L) time with O(L) extra memory.
+    """
+    assignment = np.full(len(agent_positions), -1, dtype=np.int64)
+    remaining = np.ones(len(location_positions), dtype=bool)
+    for agent_index, position in enumerate(agent_positions):
+        deltas = location_positions - position
+        distances = np.einsum("ij,ij->i", deltas, deltas)
+        distances[~remaining] = np.inf
+        if forbidden is not None and forbidden[agent_index] >= 0:
+            distances[forbidden[agent_index]] = np.inf
+        choice = int(distances.argmin())
+        if not np.isfinite(distances[choice]):
+            continue
+        assignment[agent_index] = choice
+        remaining[choice] = False
+    return assignment
+
+
+def auction_assignment(
+    costs: np.ndarray,
+    epsilon: Optional[float] = None,
+    max_rounds: int = 10_000,
+) -> np.ndarray:
+    """Minimise total cost with Bertsekas' auction algorithm (Jacobi bidding)
+
+    `costs` is an (agents, locations) matrix with at least as many columns as
+    rows; np.inf marks forbidden pairs. All unassigned agents bid at once each
+    round and prices only rise, so the result is within N * epsilon of the
+    optimum. Square problems scale epsilon down in phases so early rounds
+    converge fast; with spare locations a single phase from zero prices is
+    both fast and required for optimality (unassigned locations must keep
+    the lowest price). Returns the location index per agent, or -1 where no
+    bid succeeded within `max_rounds`.
+    """
+    count, columns = costs.shape
+    assignment = np.full(count, -1, dtype=np.int64)
+    if count == 0 or columns == 0:
+        return assignment
+
+    finite = np.isfinite(costs)
+    spread = float(costs[finite].max() - costs[finite].min()) if finite.any() else 0.0
+    spread = max(spread, 1e-6)
+    final_epsilon = epsilon if epsilon is not None else spread * 1e-3 / count
+    benefit = np.where(finite, -costs, -np.inf)
+    prices = np.zeros(columns)
+    active = finite.any(axis=1)
+
+    phase_epsilon = final_epsilon if count < columns else max(spread / 4, final_epsilon)
+    while True:
+        assignment[:] = -1
+        owner = np.full(columns, -1, dtype=np.int64)
+        for _ in range(max_rounds):
+            bidders = np.flatnonzero((assignment == -1) & active)
+            if not len(bidders):
+                break
+            values = benefit[bidders] - prices
+            rows = np.arange(len(bidders))
+            best = values.argmax(axis=1)
+            best_value = values[rows, best]
+            values[rows, best] = -np.inf
+            second_value = values.max(axis=1)
+            # A sole feasible option still needs a finite increment
+            second_value = np.where(
+                np.isfinite(second_value), second_value, best_value - spread
+            )
+
+            feasible = np.isfinite(best_value)
+            active[bidders[~feasible]] = False
+            bidders, best = bidders[feasible], best[feasible]
+            bids = prices[best] + (best_value - second_value)[feasible] + phase_epsilon
+
+            # Highest bid per location wins; outbid owners rejoin the auction
+            order = np.lexsort((-bids, best))
+            targets = best[order]
+            first = np.ones(len(order), dtype=bool)
+            first[1:] = targets[1:] != targets[:-1]
+            winners = order[first]
+            won = best[winners]
+            previous = owner[won]
+            assignment[previous[previous >= 0]] = -1
+            owner[won] = bidders[winners]
+            assignment[bidders[winners]] = won
+            prices[won] = bids[winners]
+
+        if phase_epsilon <= final_epsilon:
+            return assignment
+        phase_epsilon = max(phase_epsilon / 4, final_epsilon)
+
+
+def distance_costs(
+    agent_positions: np.ndarray, location_positions: np.ndarray
+) -> np.ndarray:
+    """Euclidean distance matrix between agents and locations"""
+    deltas = agent_positions[:, None, :] - location_positions[None, :, :]
+    return np.sqrt(np.einsum("ijk,ijk->ij", deltas, deltas))
+
+
+def solve_assignment(
+    mode: str,
+    agent_positions: np.ndarray,
+    location_positions: np.ndarray,
+    forbidden: np.ndarray,
+) -> np.ndarray:
+    """Location index per agent for `greedy` or `auction` mode, -1 for none
+
+    Pure NumPy on its arguments, so it can run in a worker thread."""
+    if mode == "auction":
+        costs = distance_costs(agent_positions, location_positions)
+        has_forbidden = forbidden >= 0
+        costs[np.flatnonzero(has_forbidden), forbidden[has_forbidden]] = np.inf
+        return auction_assignment(costs)
+    return greedy_assignment(agent_positions, location_positions, forbidden)
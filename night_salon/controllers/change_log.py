@@ -0,0 +1,59 @@
+import sys
+import uuid
+from collections import deque
+from typing import Iterator, Optional, Tuple
+
+_ENTRY_SIZE = sys.getsizeof((0, "", ()))
+
+
+class ChangeLog:
+    """Bounded log of which parts of the environment changed at which version
+
+    Every recorded mutation bumps `version` by one and appends
+    (version, kind, key). Only keys are logged, not values: readers collect
+    the keys changed since their version and read the current values, so a
+    location that changed a hundred times is sent once. Old entries fall off
+    the end; a reader whose version is older than the oldest entry still
+    held, or from another `epoch` (a restart or a restored snapshot), has to
+    start over from a full state.
+    """
+
+    def __init__(self, max_entries: int = 100_000):
+        self.epoch = uuid.uuid4().hex[:12]
+        self.version = 0
+        self._entries = deque(maxlen=max_entries)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def record(self, kind: str, key) -> int:
+        self.version += 1
+        self._entries.append((self.version, kind, key))
+        return self.version
+
+    @property
+    def oldest(self) -> int:
+        """Oldest version a reader can still catch up from"""
+        if len(self._entries) < self._entries.maxlen:
+            return 0  # Nothing has been dropped yet
+        return self._entries[0][0] - 1
+
+    def covers(self, since: int, epoch: Optional[str] = None) -> bool:
+        """Whether changes after `since` can be replayed from the log"""
+        return (
+            (epoch is None or epoch == self.epoch)
+            and self.oldest <= since <= self.version
+        )
+
+    def since(self, version: int) -> Iterator[Tuple[str, object]]:
+        """(kind, key) of every entry newer than `version`, oldest first"""
+        newer = []
+        for entry_version, kind, key in reversed(self._entries):
+            if entry_version <= version:
+                break
+            newer.append((kind, key))
+        return reversed(newer)
+
+    def memory_usage(self) -> int:
+        """Approximate bytes held by the log, not counting the key strings"""
+        return sys.getsizeof(self._entries) + len(self._entries) * _ENTRY_SIZE
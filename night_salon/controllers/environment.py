@@ -1,18 +1,77 @@
+import sys
+import time
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple
+
+import numpy as np
+
 from night_salon.models.environment import Area, Location, LocationType
-from night_salon.models import EnvironmentState, Agent, AreaData
+from night_salon.models import EnvironmentState, Agent, AreaData, KinematicsStore
+from night_salon.controllers.assignment import (
+    ASSIGNMENT_MODES,
+    solve_assignment,
+)
+from night_salon.controllers import snapshot
+from night_salon.controllers.change_log import ChangeLog
+from night_salon.controllers.location_pool import FreeLocationPool
+from night_salon.controllers.proximity import ProximityDetector
 from night_salon.utils.logger import logger
+from night_salon.utils.memory import estimate_sizeof
+from night_salon.utils.metrics import REGISTRY
 from night_salon.utils.string_utils import normalize_name
 
+RESERVATIONS = REGISTRY.counter(
+    "night_salon_reservations_total",
+    "Location reservation attempts by outcome",
+    labels=("result",),
+)
+_RESERVED = RESERVATIONS.labels("reserved")
+_UNAVAILABLE = RESERVATIONS.labels("unavailable")
+_UNKNOWN_AGENT = RESERVATIONS.labels("unknown_agent")
+
+
+@dataclass
+class DestinationPlan:
+    """A batch assignment between plan_destinations and finish_destinations"""
+
+    agents: List[Agent]
+    positioned: List[Agent] = field(default_factory=list)  # Rows of the problem
+    located: List[Tuple[str, str]] = field(default_factory=list)  # Its columns
+    problem: Optional[tuple] = None  # solve_assignment arguments
+
 
 class EnvironmentController:
     """Manages environment state and agent interactions"""
 
-    def __init__(self):
+    def __init__(
+        self,
+        proximity_radius: float = 2.0,
+        assignment_mode: str = "random",
+        max_auction_cells: int = 4_000_000,
+        change_log_size: int = 100_000,
+    ):
         self.environment = EnvironmentState()
         self.environment.areas = {}  # Start with empty areas
         self.agents = {}
+        self.kinematics = KinematicsStore()  # Positions/velocities of registered agents
+        self.proximity = ProximityDetector(
+            self.kinematics, proximity_radius, exit_radius=proximity_radius * 1.25
+        )
         # Track planned locations to prevent conflicts
         self.planned_locations = {}  # Maps area_key -> {location_id: agent_id}
+        # Index of locations that are neither occupied nor planned, for O(1) sampling
+        self.free_locations = FreeLocationPool()
+        self._pool_areas = set()  # Area keys whose locations are eligible for the pool
+        # Reverse indexes so per-event lookups stay constant-time as the world grows
+        self._location_areas = {}  # Maps location_id -> area_key
+        self._agent_reservations = {}  # Maps agent_id -> {location_id: area_key}
+        self._area_key_cache = {}  # Maps Area -> resolved area_key (or None)
+        self._agent_area_keys = {}  # Maps agent_id -> area key the agent is listed under
+        # Default strategy for batch destination assignment, see assign_destinations
+        self.assignment_mode = assignment_mode
+        self.max_auction_cells = max_auction_cells  # Cap on the auction's cost matrix
+        # State version and the keys each mutation touched, see get_changes
+        self.changes = ChangeLog(change_log_size)
 
         # Seed the environment with all areas from the Area enum
         self._initialize_areas()
@@ -31,13 +90,20 @@ class EnvironmentController:
             self.planned_locations[area.value] = {}
             logger.info(f"Initialized area: {area.name}")
 
+    @property
+    def version(self):
+        return self.changes.version
+
     def add_camera(self, camera):
         self.environment.cameras.append(camera)
+        self.changes.record("extras", None)
 
     def add_area(self, area_name, area_type):
+        affected_types = {area_type}
         # Check if area already exists
         if area_name in self.environment.areas:
             # Update existing area
+            affected_types.add(self.environment.areas[area_name].type)
             self.environment.areas[area_name].type = area_type
             self.environment.areas[area_name].valid = True
         else:
@@ -49,6 +115,11 @@ class EnvironmentController:
                 valid=True,  # Mark as valid since it's explicitly being added
             )
             self.environment.areas[area_name] = area_data
+        self._area_key_cache.clear()
+        self.changes.record("area", area_name)
+        # A new area can change which key its type resolves to, so recheck pool eligibility
+        for affected_type in affected_types:
+            self._refresh_pool_areas(affected_type)
         logger.info(f"Added area: {area_name} with type: {area_type}")
 
     def add_location_to_area(
@@ -66,16 +137,22 @@ class EnvironmentController:
             id=location_id, name=location_name, type=location_type.value
         )
         area.locations[location_id] = location
+        self._location_areas.setdefault(location_id, area_name)
+        self._refresh_free_location(area_name, location_id)
+        self.changes.record("location", (area_name, location_id))
         logger.info(f"Added location {location_id} to area {area_name}")
 
     def add_item(self, item):
         self.environment.items.append(item)
+        self.changes.record("extras", None)
 
     def add_agent(self, agent: Agent):
         """Register a new agent in the environment"""
         logger.info(f"Added agent: {agent.id}")
         self.agents[agent.id] = agent
+        agent.bind_kinematics(self.kinematics)
         self._update_agent_area(agent)
+        self.changes.record("agent", agent.id)
 
     def remove_agent(self, agent_id: str):
         """Remove an agent from the environment"""
@@ -85,27 +162,32 @@ class EnvironmentController:
             self._remove_agent_from_location(agent)
             # Release any planned locations
             self.release_planned_location(agent)
+            self.proximity.forget_slot(agent.slot)
+            agent.release_kinematics()
             del self.agents[agent_id]
+            self.changes.record("agent", agent_id)
+
+    def detect_proximity(self):
+        """Run one proximity tick and return enter/exit ProximityEvents"""
+        return self.proximity.update()
 
     def _update_agent_area(self, agent: Agent):
         """Update agent's area in the environment state"""
-        for area_data in self.environment.areas.values():
-            if agent.id in area_data.agents:
-                area_data.agents.remove(agent.id)
+        self._remove_agent_from_area(agent)
 
         # Add agent to their current area
         area_key = agent.area.value
         if area_key in self.environment.areas:
-            self.environment.areas[area_key].agents.append(agent.id)
+            self.environment.areas[area_key].agents[agent.id] = None
+            self._agent_area_keys[agent.id] = area_key
         else:
-            logger.warning(f"Area {area_key} not found in environment areas")
+            logger.warning("Area %s not found in environment areas", area_key)
 
     def _remove_agent_from_area(self, agent: Agent):
-        """Remove agent from their current area"""
-        area_key = agent.area.value
+        """Remove agent from the area they are currently listed under"""
+        area_key = self._agent_area_keys.pop(agent.id, None)
         if area_key in self.environment.areas:
-            if agent.id in self.environment.areas[area_key].agents:
-                self.environment.areas[area_key].agents.remove(agent.id)
+            self.environment.areas[area_key].agents.pop(agent.id, None)
 
     def _remove_agent_from_location(self, agent: Agent):
         """Remove agent from their current location"""
@@ -115,20 +197,14 @@ class EnvironmentController:
         if not location_id:
             return
 
-        # Try multiple possible area keys for more robust lookups
-        found_area = False
-        area_key = None
-
-        for possible_key in [normalize_name(area.name), area.name, area.value]:
-            if possible_key in self.environment.areas:
-                area_key = possible_key
-                found_area = True
-                break
+        area_key = self._get_area_key(area)
 
-        if found_area and location_id in self.environment.areas[area_key].locations:
+        if area_key and location_id in self.environment.areas[area_key].locations:
             location = self.environment.areas[area_key].locations[location_id]
             if location.occupied_by == agent.id:
                 location.occupied_by = None
+                self._refresh_free_location(area_key, location_id)
+                self.changes.record("location", (area_key, location_id))
 
     def _update_agent_location(self, agent: Agent, area: Area, location_id: str = None):
         """Update both the area and specific location for an agent"""
@@ -157,25 +233,33 @@ class EnvironmentController:
                 # Check if already occupied by another agent
                 if location.occupied_by and location.occupied_by != agent.id:
                     logger.warning(
-                        f"Location {location_id} in {area.name} is already occupied. "
-                        f"Agent {agent.id} will be in the area but not in the specific location."
+                        "Location %s in %s is already occupied. "
+                        "Agent %s will be in the area but not in the specific location.",
+                        location_id,
+                        area.name,
+                        agent.id,
                     )
                 elif not is_planned and area_key in self.planned_locations and location_id in self.planned_locations[area_key]:
                     # Location is planned by another agent
                     logger.warning(
-                        f"Location {location_id} in {area.name} is planned by another agent. "
-                        f"Agent {agent.id} will be in the area but not in the specific location."
+                        "Location %s in %s is planned by another agent. "
+                        "Agent %s will be in the area but not in the specific location.",
+                        location_id,
+                        area.name,
+                        agent.id,
                     )
                 else:
                     # Occupy the location
                     location.occupied_by = agent.id
                     agent.state["location"] = location_id
+                    self.free_locations.discard(location_id)
+                    self.changes.record("location", (area_key, location_id))
                     
                     # If this was a planned location, release the plan
                     if is_planned:
-                        del self.planned_locations[area_key][location_id]
+                        self._unreserve(area_key, location_id)
             else:
-                logger.warning(f"Location {location_id} not found in {area.name}")
+                logger.warning("Location %s not found in %s", location_id, area.name)
                 agent.state["location"] = None
         else:
             # If no specific location, just remove them from any current location
@@ -185,6 +269,7 @@ class EnvironmentController:
         # If the area changed, update the area assignments
         if old_area != area:
             self._update_agent_area(agent)
+        self.changes.record("agent", agent.id)
 
     def get_available_locations(self, area: Area):
         """Return only locations that are neither occupied nor planned"""
@@ -207,30 +292,193 @@ class EnvironmentController:
             
         return result
 
+    def sample_available_location(self, exclude_location_id=None):
+        """Pick a random free location from any valid area in O(1)
+
+        Returns an (Area, location_id) tuple, or None if nothing is free."""
+        entry = self.free_locations.sample(exclude=exclude_location_id)
+        if not entry:
+            return None
+        location_id, area_key = entry
+        return self.environment.areas[area_key].type, location_id
+
+    def _refresh_pool_areas(self, area_type):
+        """Recompute pool eligibility for every area of the given type
+
+        Only valid areas that `_get_area_key` resolves to are eligible, since
+        reservations for an Area are always made against that key."""
+        resolved_key = self._get_area_key(area_type)
+        for area_key, area_data in self.environment.areas.items():
+            if area_data.type != area_type:
+                continue
+            if area_data.valid and area_key == resolved_key:
+                self._pool_areas.add(area_key)
+            else:
+                self._pool_areas.discard(area_key)
+            for location_id in area_data.locations:
+                self._refresh_free_location(area_key, location_id)
+
+    def _rebuild_free_locations(self):
+        """Recompute pool eligibility and the whole free pool in one pass"""
+        self._area_key_cache.clear()
+        areas = self.environment.areas
+        self._pool_areas = {
+            area_key
+            for area_key, area_data in areas.items()
+            if area_data.valid and area_key == self._get_area_key(area_data.type)
+        }
+        self.free_locations.reset(
+            (location_id, area_key)
+            for area_key in self._pool_areas
+            for location_id, location in areas[area_key].locations.items()
+            if not location.occupied_by
+            and location_id not in self.planned_locations.get(area_key, ())
+        )
+
+    def _refresh_free_location(self, area_key, location_id):
+        """Add or remove a single location from the free pool based on its state"""
+        location = self.environment.areas[area_key].locations.get(location_id)
+        if (
+            location
+            and area_key in self._pool_areas
+            and not location.occupied_by
+            and location_id not in self.planned_locations.get(area_key, {})
+        ):
+            self.free_locations.add(location_id, area_key)
+        else:
+            self.free_locations.discard(location_id)
+
     def get_environment_state(self):
         """Return current environment state"""
         return {
             "areas": {
                 area_key: {
-                    "name": area_data.name,
-                    "type": area_data.type.value,
+                    **self.area_state(area_data),
                     "agents": list(area_data.agents),
                     "locations": {
-                        loc_id: {
-                            "name": location.name,
-                            "type": location.type.value,
-                            "occupied_by": location.occupied_by,
-                        }
+                        loc_id: self.location_state(location)
                         for loc_id, location in area_data.locations.items()
                     },
                 }
                 for area_key, area_data in self.environment.areas.items()
             },
-            "agents": {k: v.state for k, v in self.agents.items()},
+            "agents": {k: v.snapshot_state() for k, v in self.agents.items()},
             "cameras": self.environment.cameras,
             "items": self.environment.items,
         }
 
+    def get_changes(self, since=None, epoch=None):
+        """State changes after version `since`, or the full state
+
+        Changed areas, locations and agents are returned with their current
+        values (None once removed); area entries leave out their agent
+        lists, which follow from each agent's "area". When `since` is None,
+        from another epoch, or older than the change log reaches back, the
+        response is the full `get_environment_state()` with "full" set."""
+        log = self.changes
+        response = {"epoch": log.epoch, "version": log.version}
+        if since is None or not log.covers(since, epoch):
+            return {**response, "full": True, "state": self.get_environment_state()}
+
+        areas, locations, agents, extras = {}, {}, {}, False
+        for kind, key in log.since(since):
+            if kind == "location":
+                locations[key] = None
+            elif kind == "agent":
+                agents[key] = None
+            elif kind == "area":
+                areas[key] = None
+            else:
+                extras = True
+
+        environment_areas = self.environment.areas
+        changes = {
+            "areas": {
+                area_key: self.area_state(environment_areas[area_key])
+                if area_key in environment_areas
+                else None
+                for area_key in areas
+            },
+            "locations": {},
+            "agents": {
+                agent_id: self.agents[agent_id].snapshot_state()
+                if agent_id in self.agents
+                else None
+                for agent_id in agents
+            },
+        }
+        for area_key, location_id in locations:
+            area_data = environment_areas.get(area_key)
+            location = area_data.locations.get(location_id) if area_data else None
+            changes["locations"].setdefault(area_key, {})[location_id] = (
+                self.location_state(location) if location else None
+            )
+        if extras:
+            changes["cameras"] = self.environment.cameras
+            changes["items"] = self.environment.items
+        return {**response, "full": False, "changes": changes}
+
+    @staticmethod
+    def area_state(area_data):
+        """An area's entry in state dumps, without its agents and locations"""
+        return {
+            "name": area_data.name,
+            "type": area_data.type.value,
+            "valid": area_data.valid,
+        }
+
+    @staticmethod
+    def location_state(location):
+        """A location's entry in state dumps"""
+        return {
+            "name": location.name,
+            "type": location.type,
+            "occupied_by": location.occupied_by,
+        }
+
+    def memory_usage(self):
+        """Approximate bytes held by this environment, by component
+
+        Containers are estimated from samples, so this stays cheap enough to
+        call periodically on large worlds. Agent and location id strings are
+        counted once, with the agents and locations; the indexes only add
+        their own tables."""
+        areas = self.environment.areas.values()
+        return {
+            "agents": estimate_sizeof(self.agents, exclude=[self.kinematics]),
+            "kinematics": self.kinematics.memory_usage(),
+            "change_log": self.changes.memory_usage(),
+            "locations": sum(estimate_sizeof(area.locations) for area in areas),
+            "reservations": sum(
+                sys.getsizeof(planned) for planned in self.planned_locations.values()
+            )
+            + sum(
+                sys.getsizeof(reservations)
+                for reservations in self._agent_reservations.values()
+            )
+            + sys.getsizeof(self._agent_reservations),
+            "indexes": self.free_locations.memory_usage()
+            + sys.getsizeof(self._location_areas)
+            + sys.getsizeof(self._agent_area_keys)
+            + sum(sys.getsizeof(area.agents) for area in areas),
+        }
+
+    def save_snapshot(self, path):
+        """Write the environment to a binary snapshot file (see snapshot.py)"""
+        snapshot.write_snapshot(snapshot.encode_snapshot(self), path)
+
+    def restore_snapshot(self, path):
+        """Load a snapshot into this controller, which must still be empty
+
+        Returns the unix time the snapshot was saved."""
+        started = time.perf_counter()
+        saved_at = snapshot.restore_snapshot(self, path)
+        logger.info(
+            f"Restored {len(self.agents)} agents and {len(self._location_areas)} "
+            f"locations from {path} in {(time.perf_counter() - started) * 1000:.1f} ms"
+        )
+        return saved_at
+
     def get_locations_for_area(self, area_name):
         """Get all locations for a specific area with normalized name lookup"""
         normalized_name = normalize_name(area_name)
@@ -271,18 +519,16 @@ class EnvironmentController:
         """Reserve a location for an agent to move to later"""
         area_key = self._get_area_key(area)
         if not area_key:
-            logger.warning(f"Area {area.name} not found, cannot plan location")
+            logger.warning("Area %s not found, cannot plan location", area.name)
             return False
             
         if not self.is_location_available(area, location_id):
-            logger.warning(f"Location {location_id} in {area.name} is not available for planning")
+            logger.warning("Location %s in %s is not available for planning", location_id, area.name)
             return False
             
         # Reserve the location
-        if area_key not in self.planned_locations:
-            self.planned_locations[area_key] = {}
-        self.planned_locations[area_key][location_id] = agent.id
-        logger.info(f"Agent {agent.id} planned location {location_id} in {area.name}")
+        self._reserve(area_key, location_id, agent.id)
+        logger.info("Agent %s planned location %s in %s", agent.id, location_id, area.name)
         return True
         
     def release_planned_location(self, agent, area=None, location_id=None):
@@ -292,43 +538,268 @@ class EnvironmentController:
             area_key = self._get_area_key(area)
             if area_key and area_key in self.planned_locations and location_id in self.planned_locations[area_key]:
                 if self.planned_locations[area_key][location_id] == agent.id:
-                    del self.planned_locations[area_key][location_id]
-                    logger.info(f"Agent {agent.id} released planned location {location_id} in {area.name}")
+                    self._unreserve(area_key, location_id)
+                    logger.info("Agent %s released planned location %s in %s", agent.id, location_id, area.name)
             return
             
         # Otherwise, release all planned locations for this agent
-        for area_key, locations in self.planned_locations.items():
-            to_remove = []
-            for loc_id, agent_id in locations.items():
-                if agent_id == agent.id:
-                    to_remove.append(loc_id)
-            
-            for loc_id in to_remove:
-                del self.planned_locations[area_key][loc_id]
-                logger.info(f"Agent {agent.id} released planned location {loc_id}")
+        reservations = self._agent_reservations.get(agent.id, {})
+        for loc_id, area_key in list(reservations.items()):
+            self._unreserve(area_key, loc_id)
+            logger.info("Agent %s released planned location %s", agent.id, loc_id)
+
+    def get_reservations(self, agent_id):
+        """Return {location_id: area_key} for every location planned by an agent"""
+        return dict(self._agent_reservations.get(agent_id, {}))
+
+    def _reserve(self, area_key, location_id, agent_id):
+        """Record a reservation in planned_locations and the per-agent index"""
+        self.planned_locations.setdefault(area_key, {})[location_id] = agent_id
+        self._agent_reservations.setdefault(agent_id, {})[location_id] = area_key
+        self.free_locations.discard(location_id)
+
+    def _unreserve(self, area_key, location_id):
+        """Drop a reservation from both indexes and return the location to the pool"""
+        agent_id = self.planned_locations.get(area_key, {}).pop(location_id, None)
+        reservations = self._agent_reservations.get(agent_id)
+        if reservations is not None:
+            reservations.pop(location_id, None)
+            if not reservations:
+                del self._agent_reservations[agent_id]
+        self._refresh_free_location(area_key, location_id)
+
+    def assign_destinations(self, agent_ids, mode=None):
+        """Reserve a distinct free destination for each agent in one batch
+
+        `random` hands out a shuffled copy of the free pool in a single
+        O(N + L) pass. `greedy` (nearest free location per agent) and
+        `auction` (near-optimal total distance) use agent positions and the
+        coordinates learned for each location; agents or locations without
+        them fall back to random. Each agent's existing reservations are
+        released first, and agents are never sent to the location they are
+        standing on. Returns a list of (agent_id, Area, location_id); agents
+        left without a free location are omitted.
+
+        Runs in one go; callers on the event loop use plan_destinations,
+        solve_assignment in a worker thread, then finish_destinations."""
+        plan = self.plan_destinations(agent_ids, mode)
+        columns = solve_assignment(*plan.problem) if plan.problem else None
+        return self.finish_destinations(plan, columns)
+
+    def plan_destinations(self, agent_ids, mode=None) -> DestinationPlan:
+        """Release the agents' reservations and set up the distance problem
+
+        The plan's `problem` is None in random mode or when no agent or
+        location has coordinates; otherwise it holds the arguments for
+        solve_assignment, copied so solving never touches the controller."""
+        mode = mode or self.assignment_mode
+        if mode not in ASSIGNMENT_MODES:
+            raise ValueError(f"Unknown assignment mode: {mode}")
+
+        agents = [self.agents[agent_id] for agent_id in agent_ids if agent_id in self.agents]
+        for agent in agents:
+            self.release_planned_location(agent)
+        plan = DestinationPlan(agents)
+        if mode != "random":
+            self._plan_by_distance(plan, self.free_locations.shuffled(), mode)
+        return plan
+
+    def finish_destinations(self, plan: DestinationPlan, columns=None):
+        """Reserve the solved destinations, then random ones for the rest
+
+        Pairs whose agent was removed, got another reservation, or moved onto
+        the location, or whose location stopped being free while the problem
+        was solved, are dropped and those agents fall back to random."""
+        agents = [
+            agent
+            for agent in plan.agents
+            if self.agents.get(agent.id) is agent
+            and agent.id not in self._agent_reservations
+        ]
+        present = {agent.id for agent in agents}
+        planned = []
+        assigned = set()
+        if columns is not None:
+            for agent, column in zip(plan.positioned, columns):
+                if column < 0 or agent.id not in present:
+                    continue
+                entry = plan.located[column]
+                if (
+                    entry[0] not in self.free_locations
+                    or entry[0] == agent.state.get("current_location")
+                ):
+                    continue
+                self._plan_entry(agent.id, entry, planned)
+                assigned.add(agent.id)
+        remaining = [agent for agent in agents if agent.id not in assigned]
+        self._assign_randomly(remaining, self.free_locations.shuffled(), planned)
+
+        _RESERVED.inc(len(planned))
+        if len(planned) < len(agents):
+            _UNAVAILABLE.inc(len(agents) - len(planned))
+            logger.warning(
+                "Only %s free locations for %s agents in batch assignment",
+                len(planned),
+                len(agents),
+            )
+        return planned
+
+    def _assign_randomly(self, agents, candidates, planned):
+        """Pop shuffled candidates for each agent, skipping its own location"""
+        deferred = []  # Candidates skipped because they were an agent's own location
+        for agent in agents:
+            current_location = agent.state.get("current_location")
+            entry = None
+            for index, candidate in enumerate(deferred):
+                if candidate[0] != current_location:
+                    entry = deferred.pop(index)
+                    break
+            while entry is None and candidates:
+                candidate = candidates.pop()
+                if candidate[0] == current_location:
+                    deferred.append(candidate)
+                else:
+                    entry = candidate
+            if entry is None:
+                continue  # Only this agent's own location is left; others may still fit
+            self._plan_entry(agent.id, entry, planned)
+
+    def _plan_by_distance(self, plan, candidates, mode):
+        """Fill in the plan's distance problem for positioned agents and located candidates"""
+        last_updated = self.kinematics.last_updated
+        positioned = [
+            agent for agent in plan.agents if not np.isnan(last_updated[agent.slot])
+        ]
+        located = [
+            (candidate, self._location_coordinates(candidate)) for candidate in candidates
+        ]
+        located = [(candidate, coordinates) for candidate, coordinates in located if coordinates]
+        if not positioned or not located:
+            return
+        # The solvers need at least as many locations as agents
+        positioned = positioned[: len(located)]
+
+        agent_positions = self.kinematics.position[
+            [agent.slot for agent in positioned]
+        ].astype(np.float64)
+        location_positions = np.array(
+            [coordinates for _, coordinates in located], dtype=np.float64
+        )
+        column_of = {candidate[0]: column for column, (candidate, _) in enumerate(located)}
+        forbidden = np.array(
+            [column_of.get(agent.state.get("current_location"), -1) for agent in positioned]
+        )
+
+        if mode == "auction" and len(positioned) * len(located) > self.max_auction_cells:
+            logger.warning(
+                "Auction over %sx%s pairs exceeds %s cells, using greedy assignment",
+                len(positioned),
+                len(located),
+                self.max_auction_cells,
+            )
+            mode = "greedy"
+        plan.positioned = positioned
+        plan.located = [candidate for candidate, _ in located]
+        plan.problem = (mode, agent_positions, location_positions, forbidden)
+
+    def _plan_entry(self, agent_id, entry, planned):
+        location_id, area_key = entry
+        self._reserve(area_key, location_id, agent_id)
+        planned.append((agent_id, self.environment.areas[area_key].type, location_id))
+
+    def _location_coordinates(self, entry):
+        location_id, area_key = entry
+        return self.environment.areas[area_key].locations[location_id].coordinates
+
+    def record_location_coordinates(self, location_id, coordinates):
+        """Remember where a location is, as reported by an arriving agent"""
+        area_key = self._location_areas.get(location_id)
+        if area_key is None or len(coordinates) < 3:
+            return
+        location = self.environment.areas[area_key].locations.get(location_id)
+        if location is not None:
+            location.coordinates = tuple(float(value) for value in coordinates[:3])
+
+    def apply_assignments(self, assignments):
+        """Reserve explicit agent -> location assignments
+
+        Like `assign_destinations`, the listed agents' existing reservations are
+        released first. Returns (planned, errors): planned is a list of
+        (agent_id, Area, location_id) and errors holds {agent_id,
+        location_name, message} for each rejected assignment."""
+        assignments = list(assignments)
+        for agent_id, _ in assignments:
+            if agent_id in self.agents:
+                self.release_planned_location(self.agents[agent_id])
+
+        planned = []
+        errors = []
+        claimed = set()
+        for agent_id, location_id in assignments:
+            error = None
+            area_key = self._location_areas.get(location_id)
+            if agent_id not in self.agents:
+                error = "Unknown agent"
+            elif area_key is None:
+                error = "Unknown location"
+            elif location_id in claimed:
+                error = "Location assigned twice in this request"
+            elif location_id not in self.free_locations:
+                error = "Location is not available"
+
+            if error:
+                errors.append(
+                    {"agent_id": agent_id, "location_name": location_id, "message": error}
+                )
+                continue
+
+            claimed.add(location_id)
+            self._plan_entry(agent_id, (location_id, area_key), planned)
+        return planned, errors
+
+    def get_area_for_location(self, location_id):
+        """Return the Area type of the area containing a location, or None"""
+        area_key = self._location_areas.get(location_id)
+        if area_key is None:
+            return None
+        return self.environment.areas[area_key].type
 
     def _get_area_key(self, area):
         """Helper to get the correct area key from an Area object"""
+        try:
+            return self._area_key_cache[area]
+        except KeyError:
+            pass
+
+        area_key = None
         for possible_key in [normalize_name(area.name), area.name, area.value]:
             if possible_key in self.environment.areas:
-                return possible_key
-        return None
+                area_key = possible_key
+                break
+        # Cached until add_area changes the set of known keys
+        self._area_key_cache[area] = area_key
+        return area_key
 
     def prepare_agent_move(self, agent_id, area, location_id):
         """Prepare an agent's move by checking and reserving the target location.
         Returns True if the location is available and was reserved, False otherwise."""
         agent = self.agents.get(agent_id)
         if not agent:
-            logger.warning(f"Cannot prepare move for unknown agent {agent_id}")
+            _UNKNOWN_AGENT.inc()
+            logger.warning("Cannot prepare move for unknown agent %s", agent_id)
             return False
             
         # Check if location is available
         if not self.is_location_available(area, location_id):
-            logger.warning(f"Cannot move agent {agent_id} to {location_id} in {area.name}, location is not available")
+            _UNAVAILABLE.inc()
+            logger.warning("Cannot move agent %s to %s in %s, location is not available", agent_id, location_id, area.name)
             return False
             
         # Plan/reserve the location
         success = self.plan_location(agent, area, location_id)
         if success:
-            logger.info(f"Reserved location {location_id} in {area.name} for agent {agent_id}")
+            _RESERVED.inc()
+            logger.info("Reserved location %s in %s for agent %s", location_id, area.name, agent_id)
+        else:
+            _UNAVAILABLE.inc()
         return success
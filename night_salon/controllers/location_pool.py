@@ -0,0 +1,86 @@
+import random
+import sys
+from typing import Dict, List, Optional, Tuple
+
+_PAIR_SIZE = sys.getsizeof(("", ""))
+
+
+class FreeLocationPool:
+    """Indexed set of free locations supporting O(1) add, discard and sampling
+
+    Entries are kept in a dense list so a random one can be picked by index,
+    with a location_id -> index map so removal can swap the last entry into
+    the freed slot. Location ids are treated as unique across the world, the
+    same assumption the event handler makes when resolving arrivals.
+    """
+
+    def __init__(self):
+        self._entries: List[Tuple[str, str]] = []  # [(location_id, area_key)]
+        self._index: Dict[str, int] = {}  # location_id -> position in _entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, location_id):
+        return location_id in self._index
+
+    def add(self, location_id: str, area_key: str):
+        """Mark a location as free, updating its area if already present"""
+        position = self._index.get(location_id)
+        if position is not None:
+            self._entries[position] = (location_id, area_key)
+            return
+        self._index[location_id] = len(self._entries)
+        self._entries.append((location_id, area_key))
+
+    def discard(self, location_id: str):
+        """Remove a location from the pool if present"""
+        position = self._index.pop(location_id, None)
+        if position is None:
+            return
+        last = self._entries.pop()
+        if position < len(self._entries):
+            self._entries[position] = last
+            self._index[last[0]] = position
+
+    def clear(self):
+        self._entries.clear()
+        self._index.clear()
+
+    def reset(self, entries):
+        """Replace the pool with (location_id, area_key) pairs, later pairs winning"""
+        free = dict(entries)
+        self._entries = list(free.items())
+        self._index = {location_id: position for position, location_id in enumerate(free)}
+
+    def memory_usage(self) -> int:
+        """Approximate bytes held by the pool, not counting the id strings"""
+        return (
+            sys.getsizeof(self._entries)
+            + len(self._entries) * _PAIR_SIZE
+            + sys.getsizeof(self._index)
+        )
+
+    def sample(self, exclude: Optional[str] = None) -> Optional[Tuple[str, str]]:
+        """Return a uniformly random (location_id, area_key), skipping `exclude`"""
+        size = len(self._entries)
+        excluded = self._index.get(exclude) if exclude is not None else None
+
+        if excluded is None:
+            if not size:
+                return None
+            return self._entries[random.randrange(size)]
+
+        if size <= 1:
+            return None
+        # Draw from the remaining size - 1 entries by shifting past the excluded slot
+        position = random.randrange(size - 1)
+        if position >= excluded:
+            position += 1
+        return self._entries[position]
+
+    def shuffled(self) -> List[Tuple[str, str]]:
+        """Return every free (location_id, area_key) in random order"""
+        entries = list(self._entries)
+        random.shuffle(entries)
+        return entries
@@ -0,0 +1,209 @@
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from night_salon.models import KinematicsStore, ProximityEvent
+
+# The cell itself plus the 13 neighbours in the "forward" half of the 3x3x3 block.
+# Every pair of adjacent cells is visited exactly once through one of them.
+_NEIGHBOR_OFFSETS = np.array(
+    [
+        (dx, dy, dz)
+        for dx in (-1, 0, 1)
+        for dy in (-1, 0, 1)
+        for dz in (-1, 0, 1)
+        if (dx, dy, dz) >= (0, 0, 0)
+    ],
+    dtype=np.int64,
+)
+
+
+def _encode_pairs(first: np.ndarray, second: np.ndarray) -> np.ndarray:
+    """Pack (low_slot, high_slot) pairs into sortable int64 codes"""
+    return (first.astype(np.int64) << 32) | second.astype(np.int64)
+
+
+def _decode_pairs(codes: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    return codes >> 32, codes & 0xFFFFFFFF
+
+
+def pairs_within(positions: np.ndarray, cutoff: float) -> Tuple[np.ndarray, np.ndarray]:
+    """Return index pairs (i < j) of points closer than `cutoff`
+
+    Points are bucketed into a uniform grid with cell size `cutoff`, so only
+    the surrounding cells are searched per point. Points are sorted by cell
+    and each occupied cell gets a (start, count) row, so neighbour lookup
+    runs once per cell over sorted keys and is a direct index per point.
+    Every step runs as a vectorized pass, keeping the cost near-linear for
+    evenly spread agents.
+    """
+    count = len(positions)
+    if count < 2:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty
+
+    cells = np.floor(positions / cutoff).astype(np.int64)
+    cells -= cells.min(axis=0)
+    # Pad each axis by one cell so neighbour keys never wrap into another row
+    dims = cells.max(axis=0) + 3
+    cells += 1
+    strides = np.array([dims[1] * dims[2], dims[2], 1], dtype=np.int64)
+    keys = cells @ strides
+    key_offsets = _NEIGHBOR_OFFSETS @ strides
+
+    # Work in cell order: points of one cell are contiguous
+    order = np.argsort(keys, kind="stable")
+    sorted_positions = positions[order]
+    cell_keys, cell_starts, point_cells = np.unique(
+        keys[order], return_index=True, return_inverse=True
+    )
+    cell_counts = np.diff(np.append(cell_starts, count))
+    last_cell = len(cell_keys) - 1
+    points = np.arange(count)
+    cutoff_sq = cutoff * cutoff
+    found_first, found_second = [], []
+
+    for key_offset in key_offsets:
+        if key_offset:
+            wanted = cell_keys + key_offset
+            neighbor = np.minimum(np.searchsorted(cell_keys, wanted), last_cell)
+            occupied = cell_keys[neighbor] == wanted
+            neighbor_starts = np.where(occupied, cell_starts[neighbor], 0)
+            neighbor_counts = np.where(occupied, cell_counts[neighbor], 0)
+        else:
+            neighbor_starts, neighbor_counts = cell_starts, cell_counts
+        counts = neighbor_counts[point_cells]
+        total = int(counts.sum())
+        if not total:
+            continue
+
+        first = np.repeat(points, counts)
+        starts = np.repeat(neighbor_starts[point_cells] - (np.cumsum(counts) - counts), counts)
+        second = starts + np.arange(total)
+        if not key_offset:
+            # Same cell: keep each unordered pair once
+            keep = first < second
+            first, second = first[keep], second[keep]
+        deltas = sorted_positions[first] - sorted_positions[second]
+        close = np.einsum("ij,ij->i", deltas, deltas) <= cutoff_sq
+        first, second = order[first[close]], order[second[close]]
+        found_first.append(np.minimum(first, second))
+        found_second.append(np.maximum(first, second))
+
+    if not found_first:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty
+    return np.concatenate(found_first), np.concatenate(found_second)
+
+
+class ProximityDetector:
+    """Server-side proximity detection over a KinematicsStore
+
+    Each `update` call is one tick: it finds all agent pairs within range and
+    diffs them against the previous tick to produce enter/exit transitions.
+    Pairs stay in proximity until they separate past `exit_radius`, which
+    avoids flapping for agents hovering at the boundary.
+    """
+
+    def __init__(
+        self, store: KinematicsStore, radius: float = 2.0, exit_radius: float = None
+    ):
+        self.store = store
+        self.radius = radius
+        self.exit_radius = max(exit_radius or radius, radius)
+        self._pairs = np.empty(0, dtype=np.int64)  # Sorted codes of current pairs
+        self._pair_agents = {}  # Maps pair code -> (agent_id, target_id)
+        self._last_tick = -np.inf
+        self._forgotten = set()  # Slots forgotten since the last capture
+
+    def forget_slot(self, slot: int):
+        """Drop pairs involving a slot, e.g. when its agent leaves the world"""
+        self._forgotten.add(slot)
+        if not len(self._pairs):
+            return
+        first, second = _decode_pairs(self._pairs)
+        involved = (first == slot) | (second == slot)
+        for code in self._pairs[involved].tolist():
+            self._pair_agents.pop(code, None)
+        self._pairs = self._pairs[~involved]
+
+    def update(self) -> List[ProximityEvent]:
+        """Run one detection tick and return the resulting enter/exit events"""
+        frame = self.capture()
+        if frame is None:
+            return []
+        return self.finish(frame, pairs_within(frame[1], self.exit_radius))
+
+    def capture(self) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """(slots, positions) copied for one tick, or None if nobody moved
+        since the previous one
+
+        The copies let `pairs_within(positions, exit_radius)` run in a worker
+        thread while the loop keeps updating the store; `finish` then diffs
+        its result on the loop."""
+        store = self.store
+        slots = store.positioned_slots()
+        if len(slots) and np.nanmax(store.last_updated[slots]) <= self._last_tick:
+            return None
+        if len(slots):
+            self._last_tick = float(np.nanmax(store.last_updated[slots]))
+        self._forgotten = set()
+        return slots, store.position[slots]
+
+    def finish(self, frame, pairs) -> List[ProximityEvent]:
+        """Diff the pairs found for a captured frame against the previous tick"""
+        store = self.store
+        slots, positions = frame
+        first, second = pairs
+        if self._forgotten:
+            # Agents removed (and slots maybe reused) since the capture drop out
+            valid = ~np.isin(slots, list(self._forgotten))
+            keep = valid[first] & valid[second]
+            first, second = first[keep], second[keep]
+
+        deltas = positions[first] - positions[second]
+        distances = np.sqrt(np.einsum("ij,ij->i", deltas, deltas))
+        in_range = _encode_pairs(slots[first], slots[second])
+
+        # Enter at `radius`; already-close pairs persist until `exit_radius`
+        entering_range = in_range[distances <= self.radius]
+        current = np.union1d(
+            entering_range, np.intersect1d(in_range, self._pairs, assume_unique=True)
+        )
+
+        entered = np.setdiff1d(current, self._pairs, assume_unique=True)
+        exited = np.setdiff1d(self._pairs, current, assume_unique=True)
+        self._pairs = current
+
+        order = np.argsort(in_range)
+        entered_distances = distances[order][np.searchsorted(in_range[order], entered)]
+        low, high = _decode_pairs(exited)
+        exit_deltas = store.position[low] - store.position[high]
+        exited_distances = np.sqrt(np.einsum("ij,ij->i", exit_deltas, exit_deltas))
+
+        events = []
+        agent_ids = store.agent_ids
+        low, high = _decode_pairs(entered)
+        for code, low_slot, high_slot, distance in zip(
+            entered.tolist(), low.tolist(), high.tolist(), entered_distances.tolist()
+        ):
+            agents = self._pair_agents[code] = (agent_ids[low_slot], agent_ids[high_slot])
+            events.append(self._event(agents, "enter", distance))
+
+        for code, distance in zip(exited.tolist(), exited_distances.tolist()):
+            agents = self._pair_agents.pop(code, None)
+            if agents is not None:
+                events.append(self._event(agents, "exit", distance))
+
+        return events
+
+    @staticmethod
+    def _event(agents, event_type, distance) -> ProximityEvent:
+        agent_id, target_id = agents
+        return ProximityEvent(
+            type="proximity_event",
+            agent_id=agent_id,
+            target_id=target_id,
+            event_type=event_type,
+            distance=distance,
+        )
@@ -0,0 +1,453 @@
+"""Versioned binary snapshots of an EnvironmentController
+
+Layout (little-endian, every section 8-byte aligned so it can be viewed in
+place from an mmap):
+
+  header   magic "NSSNAP\\0\\0", format version (u16), flags (u16),
+           section count (u32), saved-at unix time (f64)
+  table    per section: name (8s), offset (u64), length (u64), count (u64)
+  sections strings   every string once, UTF-8, NUL separated
+           areas     fixed-width records, strings as indexes into `strings`
+           locs      one record per location, coordinates NaN when unknown
+           planned   (area, location, agent) reservations
+           members   (area, agent) in each area's listing order
+           agents    identity and kinematics rows
+           agentjs   JSON list of per-agent free-form fields and state
+           extras    JSON cameras and items
+
+Readers look sections up by name and ignore unknown ones, so sections can
+be added without a version bump; the version changes when an existing
+record layout does. Only the primary state is stored; the free-location
+pool and the reverse indexes are rebuilt on restore.
+"""
+
+import itertools
+import json
+import mmap
+import os
+import struct
+import time
+from operator import attrgetter
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from night_salon.models import Agent
+from night_salon.models.agent import Action
+from night_salon.models.environment import Area, AreaData, Location
+
+MAGIC = b"NSSNAP\0\0"
+FORMAT_VERSION = 1
+HEADER = struct.Struct("<8sHHId")
+SECTION = struct.Struct("<8sQQQ")
+ALIGNMENT = 8
+
+AREA_DTYPE = np.dtype(
+    [("key", "<u4"), ("name", "<u4"), ("type", "<u4"), ("valid", "u1")]
+)
+LOCATION_DTYPE = np.dtype(
+    [
+        ("area", "<u4"),
+        ("id", "<u4"),
+        ("name", "<u4"),
+        ("type", "<u4"),
+        ("occupied_by", "<i4"),  # -1 when free
+        ("coordinates", "<f8", 3),
+    ]
+)
+PLANNED_DTYPE = np.dtype([("area", "<u4"), ("location", "<u4"), ("agent", "<u4")])
+MEMBER_DTYPE = np.dtype([("area", "<u4"), ("agent", "<u4")])
+AGENT_DTYPE = np.dtype(
+    [
+        ("id", "<u4"),
+        ("area", "<u4"),
+        ("action", "<u4"),
+        ("position", "<f4", 3),
+        ("velocity", "<f4", 3),
+        ("speed", "<f4"),
+        ("last_updated", "<f8"),
+    ]
+)
+_OCCUPIED_BY = attrgetter("occupied_by")
+_COORDINATES = attrgetter("coordinates")
+# Agent.state keys rebuilt from the agent's own fields on restore
+_MIRRORED_STATE = frozenset(
+    (
+        "agent_id",
+        "area",
+        "current_action",
+        "objective",
+        "thought",
+        "destination",
+        "memory",
+        "relationships",
+    )
+)
+
+
+class SnapshotError(ValueError):
+    """Raised for files that are not snapshots or use an unknown version"""
+
+
+class _StringTable:
+    """Assigns each distinct string an index, in first-seen order"""
+
+    def __init__(self):
+        self.index: Dict[str, int] = {}
+
+    def __call__(self, value: str) -> int:
+        return self.index.setdefault(value, len(self.index))
+
+    def column(self, values) -> np.ndarray:
+        index = self.index
+        setdefault = index.setdefault
+        # len(index) is evaluated before insertion, so new strings get the next id
+        return np.array(
+            [setdefault(value, len(index)) for value in values], dtype=np.uint32
+        )
+
+    def encode(self) -> bytes:
+        joined = "\0".join(self.index)
+        if joined.count("\0") != max(0, len(self.index) - 1):
+            raise SnapshotError("Cannot store strings containing NUL")
+        return joined.encode("utf-8")
+
+
+class SnapshotCapture:
+    """Copies of everything a snapshot stores, taken in one go on the event loop
+
+    Holds only values and containers that later mutations of the controller
+    do not touch (location ids, names and types are never reassigned), so
+    `encode_capture` can run in a worker thread while the loop carries on."""
+
+    def __init__(self, env):
+        areas = env.environment.areas
+        self.areas = [
+            (area_key, area_data.name, area_data.type.value, area_data.valid)
+            for area_key, area_data in areas.items()
+        ]
+        self.locations = [list(area_data.locations.values()) for area_data in areas.values()]
+        # The mutable Location attributes, read at C speed
+        self.occupied_by = [
+            list(map(_OCCUPIED_BY, locations)) for locations in self.locations
+        ]
+        self.coordinates = [
+            list(map(_COORDINATES, locations)) for locations in self.locations
+        ]
+        self.planned = [
+            (area_key, dict(reservations))
+            for area_key, reservations in env.planned_locations.items()
+        ]
+        self.members = [
+            (area_key, list(area_data.agents)) for area_key, area_data in areas.items()
+        ]
+        agents = list(env.agents.values())
+        self.agents = [
+            (
+                agent.id,
+                agent.area.value,
+                agent.current_action.name,
+                [
+                    agent.objective,
+                    agent.thought,
+                    agent.destination,
+                    dict(agent.memory),
+                    dict(agent.relationships),
+                    {
+                        key: value
+                        for key, value in agent.state.items()
+                        if key not in _MIRRORED_STATE
+                    },
+                ],
+            )
+            for agent in agents
+        ]
+        slots = np.array([agent.slot for agent in agents], dtype=np.intp)
+        kinematics = env.kinematics
+        # Fancy indexing copies the rows
+        self.position = kinematics.position[slots]
+        self.velocity = kinematics.velocity[slots]
+        self.speed = kinematics.speed[slots]
+        self.last_updated = kinematics.last_updated[slots]
+        self.extras = {
+            "cameras": list(env.environment.cameras),
+            "items": list(env.environment.items),
+        }
+
+
+def encode_snapshot(env) -> bytes:
+    """Serialize a controller's state in one step, blocking until done"""
+    return encode_capture(SnapshotCapture(env))
+
+
+def encode_capture(capture: SnapshotCapture) -> bytes:
+    """Serialize a capture; safe to run outside the event loop"""
+    strings = _StringTable()
+
+    area_rows = np.zeros(len(capture.areas), dtype=AREA_DTYPE)
+    area_index = {}
+    for position, (area_key, name, area_type, valid) in enumerate(capture.areas):
+        area_index[area_key] = position
+        area_rows[position] = (strings(area_key), strings(name), strings(area_type), valid)
+
+    # Built column by column; per-row tuples cost several times more
+    all_locations = [location for locations in capture.locations for location in locations]
+    locations = np.zeros(len(all_locations), dtype=LOCATION_DTYPE)
+    locations["area"] = np.repeat(
+        np.arange(len(capture.areas), dtype=np.uint32),
+        [len(area_locations) for area_locations in capture.locations],
+    )
+    locations["id"] = strings.column([location.id for location in all_locations])
+    locations["name"] = strings.column([location.name for location in all_locations])
+    locations["type"] = strings.column([location.type for location in all_locations])
+    locations["occupied_by"] = -1
+    occupied = [
+        (position, agent_id)
+        for position, agent_id in enumerate(itertools.chain(*capture.occupied_by))
+        if agent_id
+    ]
+    if occupied:
+        positions, agent_ids = zip(*occupied)
+        locations["occupied_by"][list(positions)] = strings.column(agent_ids)
+    locations["coordinates"] = np.nan
+    located = [
+        (position, coordinates)
+        for position, coordinates in enumerate(itertools.chain(*capture.coordinates))
+        if coordinates
+    ]
+    if located:
+        positions, coordinates = zip(*located)
+        locations["coordinates"][list(positions)] = coordinates
+
+    planned = np.array(
+        [
+            (area_index[area_key], strings(location_id), strings(agent_id))
+            for area_key, reservations in capture.planned
+            if area_key in area_index
+            for location_id, agent_id in reservations.items()
+        ],
+        dtype=PLANNED_DTYPE,
+    )
+
+    members = np.array(
+        [
+            (area_index[area_key], strings(agent_id))
+            for area_key, agent_ids in capture.members
+            for agent_id in agent_ids
+        ],
+        dtype=MEMBER_DTYPE,
+    )
+
+    agent_rows = np.zeros(len(capture.agents), dtype=AGENT_DTYPE)
+    agent_rows["id"] = strings.column([agent[0] for agent in capture.agents])
+    agent_rows["area"] = strings.column([agent[1] for agent in capture.agents])
+    agent_rows["action"] = strings.column([agent[2] for agent in capture.agents])
+    agent_rows["position"] = capture.position
+    agent_rows["velocity"] = capture.velocity
+    agent_rows["speed"] = capture.speed
+    agent_rows["last_updated"] = capture.last_updated
+    agent_fields = [agent[3] for agent in capture.agents]
+
+    sections = [
+        (b"strings", strings.encode(), len(strings.index)),
+        (b"areas", area_rows.tobytes(), len(area_rows)),
+        (b"locs", locations.tobytes(), len(locations)),
+        (b"planned", planned.tobytes(), len(planned)),
+        (b"members", members.tobytes(), len(members)),
+        (b"agents", agent_rows.tobytes(), len(agent_rows)),
+        (b"agentjs", _dump_json(agent_fields), len(agent_fields)),
+        (b"extras", _dump_json(capture.extras), 1),
+    ]
+    return _pack(sections)
+
+
+def _dump_json(value) -> bytes:
+    return json.dumps(value, separators=(",", ":"), default=str).encode("utf-8")
+
+
+def _pack(sections: List[Tuple[bytes, bytes, int]]) -> bytes:
+    offset = _align(HEADER.size + SECTION.size * len(sections))
+    table = []
+    body = bytearray()
+    for name, data, count in sections:
+        table.append(SECTION.pack(name, offset + len(body), len(data), count))
+        body += data
+        body += b"\0" * (_align(len(body)) - len(body))
+    header = HEADER.pack(MAGIC, FORMAT_VERSION, 0, len(sections), time.time())
+    prefix = header + b"".join(table)
+    return prefix + b"\0" * (offset - len(prefix)) + bytes(body)
+
+
+def _align(size: int) -> int:
+    return (size + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def write_snapshot(data: bytes, path: str) -> None:
+    """Atomically replace `path` with an encoded snapshot"""
+    temporary = f"{path}.tmp"
+    with open(temporary, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporary, path)
+
+
+def read_header(buffer) -> Tuple[int, float, Dict[str, Tuple[int, int, int]]]:
+    """(version, saved_at, {section: (offset, length, count)}) of a snapshot"""
+    if len(buffer) < HEADER.size:
+        raise SnapshotError("File too short for a snapshot header")
+    magic, version, _, section_count, saved_at = HEADER.unpack_from(buffer, 0)
+    if magic != MAGIC:
+        raise SnapshotError("Not an environment snapshot")
+    if version != FORMAT_VERSION:
+        raise SnapshotError(f"Unsupported snapshot version {version}")
+    sections = {}
+    for position in range(section_count):
+        name, offset, length, count = SECTION.unpack_from(
+            buffer, HEADER.size + position * SECTION.size
+        )
+        if offset + length > len(buffer):
+            raise SnapshotError(f"Section {name!r} runs past the end of the file")
+        sections[name.rstrip(b"\0").decode()] = (offset, length, count)
+    return version, saved_at, sections
+
+
+def restore_snapshot(env, path: str) -> float:
+    """Load a snapshot file into a freshly created controller
+
+    The file is memory-mapped and its record sections are read in place.
+    Returns the time the snapshot was saved."""
+    with open(path, "rb") as f:
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        return decode_snapshot(env, buffer)
+    finally:
+        try:
+            buffer.close()
+        except BufferError:
+            pass  # A traceback still holds a view; the mmap closes when freed
+
+
+def decode_snapshot(env, buffer) -> float:
+    """Rebuild a controller's state from snapshot bytes (or an mmap)"""
+    if env.agents or any(area.locations for area in env.environment.areas.values()):
+        raise ValueError("Snapshots can only be restored into an empty controller")
+    _, saved_at, sections = read_header(buffer)
+
+    def records(name, dtype):
+        offset, _, count = sections[name]
+        # Columns are copied out with tolist(), so no view outlives the mmap
+        return np.frombuffer(buffer, dtype=dtype, count=count, offset=offset)
+
+    def raw(name) -> bytes:
+        offset, length, _ = sections[name]
+        return buffer[offset : offset + length]
+
+    strings = raw("strings").decode("utf-8").split("\0")
+    if sections["strings"][2] == 0:
+        strings = []
+
+    # Areas, replacing the defaults seeded by the constructor
+    area_records = records("areas", AREA_DTYPE)
+    area_keys = [strings[index] for index in area_records["key"].tolist()]
+    env.environment.areas = {}
+    env.planned_locations = {}
+    for key, name, area_type, valid in zip(
+        area_keys,
+        area_records["name"].tolist(),
+        area_records["type"].tolist(),
+        area_records["valid"].tolist(),
+    ):
+        env.environment.areas[key] = AreaData(
+            name=strings[name], type=Area(strings[area_type]), valid=bool(valid)
+        )
+        env.planned_locations[key] = {}
+    del area_records
+
+    # Locations
+    location_records = records("locs", LOCATION_DTYPE)
+    area_locations = [env.environment.areas[key].locations for key in area_keys]
+    location_areas = env._location_areas
+    coordinates = location_records["coordinates"]
+    known = np.flatnonzero(~np.isnan(coordinates).any(axis=1))
+    coordinate_rows = [None] * len(location_records)
+    for position, row in zip(known.tolist(), coordinates[known].tolist()):
+        coordinate_rows[position] = tuple(row)
+    for area, location_id, name, location_type, occupied_by, location_coordinates in zip(
+        location_records["area"].tolist(),
+        location_records["id"].tolist(),
+        location_records["name"].tolist(),
+        location_records["type"].tolist(),
+        location_records["occupied_by"].tolist(),
+        coordinate_rows,
+    ):
+        location_id = strings[location_id]
+        area_locations[area][location_id] = Location(
+            location_id,
+            strings[name],
+            strings[location_type],
+            strings[occupied_by] if occupied_by >= 0 else None,
+            location_coordinates,
+        )
+        location_areas.setdefault(location_id, area_keys[area])
+    del location_records, coordinates
+
+    # Agents and their kinematics rows
+    agent_records = records("agents", AGENT_DTYPE)
+    offset, length, _ = sections["agentjs"]
+    agent_fields = json.loads(raw("agentjs")) if length else []
+    kinematics = env.kinematics
+    slots = []
+    for agent_id, area, action, fields in zip(
+        agent_records["id"].tolist(),
+        agent_records["area"].tolist(),
+        agent_records["action"].tolist(),
+        agent_fields,
+    ):
+        objective, thought, destination, memory, relationships, state = fields
+        agent = Agent(
+            id=strings[agent_id],
+            area=Area(strings[area]),
+            current_action=Action[strings[action]],
+            objective=objective,
+            thought=thought,
+            destination=destination,
+            state=state,
+            memory=memory,
+            relationships=relationships,
+            kinematics=kinematics,
+        )
+        env.agents[agent.id] = agent
+        slots.append(agent.slot)
+    slots = np.array(slots, dtype=np.intp)
+    kinematics.position[slots] = agent_records["position"]
+    kinematics.velocity[slots] = agent_records["velocity"]
+    kinematics.speed[slots] = agent_records["speed"]
+    kinematics.last_updated[slots] = agent_records["last_updated"]
+    del agent_records
+
+    member_records = records("members", MEMBER_DTYPE)
+    for area, agent_id in zip(
+        member_records["area"].tolist(), member_records["agent"].tolist()
+    ):
+        agent_id = strings[agent_id]
+        env.environment.areas[area_keys[area]].agents[agent_id] = None
+        env._agent_area_keys[agent_id] = area_keys[area]
+    del member_records
+
+    # Reservations, then the free pool derived from everything above
+    planned_records = records("planned", PLANNED_DTYPE)
+    for area, location_id, agent_id in zip(
+        planned_records["area"].tolist(),
+        planned_records["location"].tolist(),
+        planned_records["agent"].tolist(),
+    ):
+        env._reserve(area_keys[area], strings[location_id], strings[agent_id])
+    del planned_records
+
+    extras = json.loads(raw("extras"))
+    env.environment.cameras = extras["cameras"]
+    env.environment.items = extras["items"]
+
+    env._rebuild_free_locations()
+    return saved_at
@@ -1,4 +1,5 @@
 from night_salon.models.agent import Agent, Action, ACTION_MAPPING
+from night_salon.models.kinematics import KinematicsStore
 from night_salon.models.environment import (
     Location,
     EnvironmentState,
@@ -11,4 +12,8 @@ from night_salon.models.events import (
     SetupEvent,
     LocationReachedEvent,
     ProximityEvent,
+    EVENT_ADAPTER,
+    EVENT_MODELS,
+    MoveAssignment,
+    MoveAssignmentsRequest,
 )
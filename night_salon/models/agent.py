@@ -1,8 +1,14 @@
 from dataclasses import dataclass, field
 from enum import Enum, auto
-import time
+import math
 
 from night_salon.models.environment import Area, Location
+from night_salon.models.kinematics import (
+    KINEMATIC_FIELDS,
+    KinematicsStore,
+    default_store,
+    to_dict,
+)
 
 
 class Action(Enum):
@@ -31,17 +37,25 @@ class Agent:
     destination: str = None
     state: dict = field(
         default_factory=lambda: {
-            "position": {"x": 0, "y": 0, "z": 0},
-            "velocity": {"x": 0, "y": 0, "z": 0},
-            "speed": 0,
-            "last_updated": None,
             "location": None,
         }
     )
     memory: dict = field(default_factory=lambda: {})
     relationships: dict = field(default_factory=lambda: {})
+    # Position, velocity, speed and last_updated live in a shared columnar store
+    kinematics: KinematicsStore = field(default=None, repr=False, compare=False)
+    slot: int = field(default=-1, init=False, repr=False, compare=False)
 
     def __post_init__(self):
+        initial = {
+            key: self.state.pop(key) for key in KINEMATIC_FIELDS if key in self.state
+        }
+        if self.kinematics is None:  # An empty store is falsy, so test for None
+            self.kinematics = default_store
+        self.slot = self.kinematics.allocate(self.id)
+        if initial:
+            self._update_kinematics(initial)
+
         self.state.update(
             {
                 "agent_id": self.id,
@@ -59,8 +73,13 @@ class Agent:
     # TODO remove location from staet
     def update_state(self, new_state: dict):
         """Safely update agent state with validation"""
-        self.state.update(new_state)
-        self.state["last_updated"] = time.time()
+        kinematics = {
+            key: new_state[key] for key in KINEMATIC_FIELDS if key in new_state
+        }
+        self.state.update(
+            {key: value for key, value in new_state.items() if key not in kinematics}
+        )
+        self._update_kinematics(kinematics)
 
         # Sync dataclass Fields with state
         if "location" in new_state:
@@ -83,3 +102,66 @@ class Agent:
 
     def is_at_location(self, location_id: str):
         return self.get_location() == location_id
+
+    def bind_kinematics(self, store: KinematicsStore):
+        """Move this agent's kinematics row into another store"""
+        if store is self.kinematics:
+            return
+        slot = store.allocate(self.id)
+        store.copy_row(self.kinematics, self.slot, slot)
+        self.kinematics.release(self.slot)
+        self.kinematics, self.slot = store, slot
+
+    def release_kinematics(self):
+        """Free this agent's kinematics slot; the agent is unusable afterwards"""
+        self.kinematics.release(self.slot)
+        self.slot = -1
+
+    def _update_kinematics(self, values: dict):
+        self.kinematics.update(
+            self.slot,
+            position=values.get("position"),
+            velocity=values.get("velocity"),
+            speed=values.get("speed"),
+            timestamp=values.get("last_updated"),
+        )
+
+    @property
+    def position(self):
+        """Read-through view of this agent's row in the kinematics store"""
+        return self.kinematics.position[self.slot]
+
+    @position.setter
+    def position(self, value):
+        self.kinematics.update(self.slot, position=value)
+
+    @property
+    def velocity(self):
+        return self.kinematics.velocity[self.slot]
+
+    @velocity.setter
+    def velocity(self, value):
+        self.kinematics.update(self.slot, velocity=value)
+
+    @property
+    def speed(self) -> float:
+        return float(self.kinematics.speed[self.slot])
+
+    @speed.setter
+    def speed(self, value: float):
+        self.kinematics.update(self.slot, speed=value)
+
+    @property
+    def last_updated(self):
+        timestamp = float(self.kinematics.last_updated[self.slot])
+        return None if math.isnan(timestamp) else timestamp
+
+    def snapshot_state(self) -> dict:
+        """Agent state merged with its kinematics in the original nested-dict form"""
+        return {
+            **self.state,
+            "position": to_dict(self.position),
+            "velocity": to_dict(self.velocity),
+            "speed": self.speed,
+            "last_updated": self.last_updated,
+        }
@@ -1,6 +1,6 @@
 from enum import Enum
 from dataclasses import dataclass, field
-from typing import Dict, List, Optional
+from typing import Dict, Optional, Tuple
 
 
 @dataclass
@@ -11,6 +11,8 @@ class Location:
     name: str
     type: str
     occupied_by: Optional[str] = None
+    # Learned from the first location_reached that reports coordinates
+    coordinates: Optional[Tuple[float, float, float]] = None
 
 
 class LocationType(str, Enum):
@@ -34,7 +36,8 @@ class AreaData:
     name: str
     type: Area
     locations: Dict[str, Location] = field(default_factory=dict)
-    agents: List[str] = field(default_factory=list)
+    # Insertion-ordered set of agent ids (dict keys), for O(1) add/remove
+    agents: Dict[str, None] = field(default_factory=dict)
     valid: bool = False  # Track whether this area exists in Unity
 
 
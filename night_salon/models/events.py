@@ -1,5 +1,5 @@
-from typing import Dict, List, Optional
-from pydantic import BaseModel
+from typing import Annotated, Dict, List, Literal, Optional, Union
+from pydantic import BaseModel, Discriminator, Tag, TypeAdapter, field_validator
 from dataclasses import field
 
 
@@ -20,7 +20,7 @@ class AreaData(BaseModel):
 class SetupEvent(BaseModel):
     """Event for initial setup of the environment"""
 
-    type: str = "setup"
+    type: Literal["setup"] = "setup"
     agent_ids: List[str] = []
     areas: List[AreaData] = []
     cameras: List[str] = []
@@ -30,15 +30,61 @@ class SetupEvent(BaseModel):
 class LocationReachedEvent(AgentEvent):
     """Event when an agent reaches a new location"""
 
+    type: Literal["location_reached"] = "location_reached"
     agent_id: str = ""
     location_name: str = ""
     coordinates: List[float] = []
     sub_location: Optional[str] = None
 
+    @field_validator("coordinates", mode="before")
+    @classmethod
+    def _missing_coordinates(cls, value):
+        # Clients send null when the agent's position is unknown
+        return [] if value is None else value
+
 
 class ProximityEvent(AgentEvent):
     """Event when agents come in proximity"""
 
+    type: Literal["proximity_event"] = "proximity_event"
     target_id: str = ""
     event_type: str = ""
     distance: float = 0.0
+
+
+# Client events by wire type. EVENT_ADAPTER dispatches on the tag ("messageType"),
+# so the order here does not affect validation speed
+EVENT_MODELS = {
+    "setup": SetupEvent,
+    "location_reached": LocationReachedEvent,
+    "proximity_event": ProximityEvent,
+}
+
+
+def _event_tag(value):
+    """Discriminator for raw messages ("messageType") and models ("type")"""
+    if isinstance(value, dict):
+        return value.get("messageType", value.get("type"))
+    return getattr(value, "type", None)
+
+
+# Built once at import; picks the model from the tag instead of trying each one
+EVENT_ADAPTER = TypeAdapter(
+    Annotated[
+        Union[tuple(Annotated[model, Tag(tag)] for tag, model in EVENT_MODELS.items())],
+        Discriminator(_event_tag),
+    ]
+)
+
+
+class MoveAssignment(BaseModel):
+    """An explicit destination for one agent"""
+
+    agent_id: str
+    location_name: str
+
+
+class MoveAssignmentsRequest(BaseModel):
+    """Request body for sending a set of explicit moves in one batch"""
+
+    assignments: List[MoveAssignment] = []
@@ -0,0 +1,158 @@
+import sys
+import time
+from typing import List, Optional
+
+import numpy as np
+
+# Agent fields that live in a KinematicsStore rather than in Agent.state
+KINEMATIC_FIELDS = ("position", "velocity", "speed", "last_updated")
+
+AXES = ("x", "y", "z")
+
+
+def to_vector(value) -> np.ndarray:
+    """Coerce a {"x", "y", "z"} dict or a coordinate sequence to a 3-vector"""
+    if isinstance(value, dict):
+        return np.array([value.get(axis, 0.0) for axis in AXES], dtype=np.float32)
+    vector = np.zeros(3, dtype=np.float32)
+    values = np.asarray(value, dtype=np.float32).ravel()[:3]
+    vector[: len(values)] = values
+    return vector
+
+
+def to_dict(vector) -> dict:
+    """Convert a 3-vector back to the {"x", "y", "z"} form used in agent state"""
+    return {axis: float(component) for axis, component in zip(AXES, vector)}
+
+
+class KinematicsStore:
+    """Struct-of-arrays storage for agent positions, velocities and speeds
+
+    Each agent owns a dense integer slot into contiguous arrays, so a row costs
+    36 bytes (float32 position/velocity/speed plus a float64 timestamp) and
+    whole-population queries run as vectorized NumPy operations. A NaN
+    `last_updated` marks an agent whose position has never been reported.
+    """
+
+    def __init__(self, capacity: int = 64):
+        capacity = max(1, capacity)
+        self.position = np.zeros((capacity, 3), dtype=np.float32)
+        self.velocity = np.zeros((capacity, 3), dtype=np.float32)
+        self.speed = np.zeros(capacity, dtype=np.float32)
+        self.last_updated = np.full(capacity, np.nan, dtype=np.float64)
+        self.active = np.zeros(capacity, dtype=bool)
+        self.agent_ids: List[Optional[str]] = [None] * capacity
+        self._free_slots: List[int] = []
+        self._size = 0  # High-water mark of allocated slots
+
+    def __len__(self):
+        return self._size - len(self._free_slots)
+
+    @property
+    def capacity(self) -> int:
+        return len(self.speed)
+
+    def allocate(self, agent_id: str) -> int:
+        """Reserve a slot for an agent, reusing released slots first"""
+        if self._free_slots:
+            slot = self._free_slots.pop()
+        else:
+            if self._size == self.capacity:
+                self._grow(self.capacity * 2)
+            slot = self._size
+            self._size += 1
+
+        self.position[slot] = 0.0
+        self.velocity[slot] = 0.0
+        self.speed[slot] = 0.0
+        self.last_updated[slot] = np.nan
+        self.active[slot] = True
+        self.agent_ids[slot] = agent_id
+        return slot
+
+    def release(self, slot: int):
+        """Return a slot to the free list"""
+        if not self.active[slot]:
+            return
+        self.active[slot] = False
+        self.agent_ids[slot] = None
+        self.last_updated[slot] = np.nan
+        self._free_slots.append(slot)
+
+    def copy_row(self, source: "KinematicsStore", source_slot: int, slot: int):
+        """Copy one agent's kinematics from another store"""
+        self.position[slot] = source.position[source_slot]
+        self.velocity[slot] = source.velocity[source_slot]
+        self.speed[slot] = source.speed[source_slot]
+        self.last_updated[slot] = source.last_updated[source_slot]
+
+    def update(
+        self, slot: int, position=None, velocity=None, speed=None, timestamp=None
+    ):
+        """Write any provided kinematics for a slot
+
+        Only a written position stamps last_updated, so a slot stays
+        unpositioned until coordinates are actually reported."""
+        if position is not None:
+            self.position[slot] = to_vector(position)
+            self.last_updated[slot] = time.time() if timestamp is None else timestamp
+        if velocity is not None:
+            self.velocity[slot] = to_vector(velocity)
+            if speed is None:
+                speed = float(np.linalg.norm(self.velocity[slot]))
+        if speed is not None:
+            self.speed[slot] = speed
+
+    def _grow(self, capacity: int):
+        extra = capacity - self.capacity
+        self.position = np.concatenate(
+            [self.position, np.zeros((extra, 3), dtype=np.float32)]
+        )
+        self.velocity = np.concatenate(
+            [self.velocity, np.zeros((extra, 3), dtype=np.float32)]
+        )
+        self.speed = np.concatenate([self.speed, np.zeros(extra, dtype=np.float32)])
+        self.last_updated = np.concatenate(
+            [self.last_updated, np.full(extra, np.nan, dtype=np.float64)]
+        )
+        self.active = np.concatenate([self.active, np.zeros(extra, dtype=bool)])
+        self.agent_ids.extend([None] * extra)
+
+    def memory_usage(self) -> int:
+        """Bytes held by the arrays and the slot table (ids are owned by agents)"""
+        arrays = (self.position, self.velocity, self.speed, self.last_updated, self.active)
+        return sum(array.nbytes for array in arrays) + sys.getsizeof(self.agent_ids)
+
+    def positioned_slots(self) -> np.ndarray:
+        """Slots of active agents that have reported at least one position"""
+        size = self._size
+        mask = self.active[:size] & ~np.isnan(self.last_updated[:size])
+        return np.flatnonzero(mask)
+
+    def centroid(self) -> Optional[np.ndarray]:
+        """Mean position of all positioned agents"""
+        slots = self.positioned_slots()
+        if not len(slots):
+            return None
+        return self.position[slots].mean(axis=0)
+
+    def bounding_box(self):
+        """(min_corner, max_corner) over all positioned agents"""
+        slots = self.positioned_slots()
+        if not len(slots):
+            return None
+        positions = self.position[slots]
+        return positions.min(axis=0), positions.max(axis=0)
+
+    def within_radius(self, center, radius: float) -> List[str]:
+        """Ids of positioned agents within `radius` of `center`"""
+        slots = self.positioned_slots()
+        if not len(slots):
+            return []
+        offsets = self.position[slots] - to_vector(center)
+        inside = np.einsum("ij,ij->i", offsets, offsets) <= radius * radius
+        return [self.agent_ids[slot] for slot in slots[inside]]
+
+
+# Store used by agents that have not been registered with an EnvironmentController
+default_store = KinematicsStore()
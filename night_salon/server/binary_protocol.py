@@ -0,0 +1,165 @@
+"""Compact binary encoding for high-frequency messages
+
+Clients opt in at connect time (``/ws?protocol=binary``). Setup and other
+infrequent messages stay JSON; move_to_location and location_reached are
+sent as fixed-layout little-endian structs, each prefixed with a 4-byte
+little-endian length like the TCP framing in ``scripts/test_tcp_basic.py``.
+A single binary frame may carry several records back to back.
+
+Agent and location names are replaced by small integers. They are assigned
+while handling ``setup`` and returned to binary clients in the setup ack as
+``{"agent_ids": {name: id}, "location_ids": {name: id}}``.
+"""
+
+import struct
+from typing import Any, Dict, List, Optional
+
+PROTOCOL_NAME = "binary"
+
+MOVE_TO_LOCATION = 1
+LOCATION_REACHED = 2
+ACK = 3
+
+HAS_COORDINATES = 0x01
+
+LENGTH_PREFIX = struct.Struct("<I")
+# type, agent id, location id
+MOVE_RECORD = struct.Struct("<BII")
+# type, agent id, location id, flags, x, y, z
+REACHED_RECORD = struct.Struct("<BIIB3f")
+ACK_RECORD = struct.Struct("<B")
+
+
+class ProtocolError(ValueError):
+    """Raised for malformed binary frames"""
+
+
+class WireIdTable:
+    """Bidirectional name <-> small integer mapping for agents and locations"""
+
+    def __init__(self):
+        self.agent_ids: Dict[str, int] = {}
+        self.location_ids: Dict[str, int] = {}
+        self._agent_names: List[str] = []
+        self._location_names: List[str] = []
+
+    def register_agent(self, name: str) -> int:
+        if name not in self.agent_ids:
+            self.agent_ids[name] = len(self._agent_names)
+            self._agent_names.append(name)
+        return self.agent_ids[name]
+
+    def register_location(self, name: str) -> int:
+        if name not in self.location_ids:
+            self.location_ids[name] = len(self._location_names)
+            self._location_names.append(name)
+        return self.location_ids[name]
+
+    def agent_name(self, agent_id: int) -> str:
+        try:
+            return self._agent_names[agent_id]
+        except IndexError:
+            raise ProtocolError(f"Unknown agent id {agent_id}") from None
+
+    def location_name(self, location_id: int) -> str:
+        try:
+            return self._location_names[location_id]
+        except IndexError:
+            raise ProtocolError(f"Unknown location id {location_id}") from None
+
+    def to_dict(self) -> Dict[str, Dict[str, int]]:
+        return {
+            "agent_ids": dict(self.agent_ids),
+            "location_ids": dict(self.location_ids),
+        }
+
+
+def _frame(record: bytes) -> bytes:
+    return LENGTH_PREFIX.pack(len(record)) + record
+
+
+class BinaryProtocol:
+    """Encodes and decodes binary records using a shared WireIdTable"""
+
+    def __init__(self, ids: WireIdTable):
+        self.ids = ids
+        self.ack = _frame(ACK_RECORD.pack(ACK))
+
+    def encode_message(self, message: Dict[str, Any]) -> Optional[bytes]:
+        """Encode a move command or a batch of them, or None if not representable"""
+        message_type = message.get("messageType")
+        if message_type == "move_to_location":
+            return self._encode_move(message)
+        if message_type == "batch":
+            records = [self._encode_move(event) for event in message.get("events", [])]
+            if records and all(records):
+                return b"".join(records)
+        return None
+
+    def _encode_move(self, command: Dict[str, Any]) -> Optional[bytes]:
+        if command.get("messageType") != "move_to_location":
+            return None
+        agent_id = self.ids.agent_ids.get(command.get("agent_id"))
+        location_id = self.ids.location_ids.get(command.get("location_name"))
+        if agent_id is None or location_id is None:
+            # Names the client has no id for must go out as JSON
+            return None
+        return _frame(MOVE_RECORD.pack(MOVE_TO_LOCATION, agent_id, location_id))
+
+    def encode_location_reached(
+        self, agent_name: str, location_name: str, coordinates=None
+    ) -> bytes:
+        """Encode a location_reached record (used by clients and tests)"""
+        flags = HAS_COORDINATES if coordinates else 0
+        x, y, z = (list(coordinates or []) + [0.0, 0.0, 0.0])[:3]
+        record = REACHED_RECORD.pack(
+            LOCATION_REACHED,
+            self.ids.agent_ids[agent_name],
+            self.ids.location_ids[location_name],
+            flags,
+            x,
+            y,
+            z,
+        )
+        return _frame(record)
+
+    def decode_frame(self, data: bytes) -> List[Dict[str, Any]]:
+        """Decode every record in a frame into the equivalent JSON event dicts"""
+        view = memoryview(data)
+        events = []
+        offset = 0
+        while offset < len(view):
+            if offset + LENGTH_PREFIX.size > len(view):
+                raise ProtocolError("Truncated length prefix")
+            (length,) = LENGTH_PREFIX.unpack_from(view, offset)
+            offset += LENGTH_PREFIX.size
+            if length == 0 or offset + length > len(view):
+                raise ProtocolError("Truncated record")
+            events.append(self._decode_record(view[offset : offset + length]))
+            offset += length
+        return events
+
+    def _decode_record(self, record: memoryview) -> Dict[str, Any]:
+        message_type = record[0]
+        if message_type == LOCATION_REACHED:
+            if len(record) != REACHED_RECORD.size:
+                raise ProtocolError("Bad location_reached record size")
+            _, agent_id, location_id, flags, x, y, z = REACHED_RECORD.unpack(record)
+            event = {
+                "messageType": "location_reached",
+                "agent_id": self.ids.agent_name(agent_id),
+                "location_name": self.ids.location_name(location_id),
+            }
+            if flags & HAS_COORDINATES:
+                event["coordinates"] = [x, y, z]
+            return event
+        if message_type == MOVE_TO_LOCATION:
+            if len(record) != MOVE_RECORD.size:
+                raise ProtocolError("Bad move_to_location record size")
+            _, agent_id, location_id = MOVE_RECORD.unpack(record)
+            return {
+                "messageType": "move_to_location",
+                "agent_id": self.ids.agent_name(agent_id),
+                "location_name": self.ids.location_name(location_id),
+            }
+        raise ProtocolError(f"Unknown record type {message_type}")
@@ -0,0 +1,104 @@
+import json
+from typing import Any, Dict, Optional
+
+from night_salon.server.connection import Frame
+
+try:
+    import orjson
+except ImportError:  # Optional speedup, fall back to the standard library
+    orjson = None
+
+
+class StdlibCodec:
+    """JSON codec backed by the standard library"""
+
+    name = "json"
+
+    def dumps(self, obj: Any) -> bytes:
+        return json.dumps(obj, separators=(",", ":")).encode("utf-8")
+
+    def loads(self, data: Frame) -> Any:
+        if isinstance(data, memoryview):
+            data = data.tobytes()
+        return json.loads(data)
+
+
+class OrjsonCodec:
+    """JSON codec backed by orjson, used when it is installed"""
+
+    name = "orjson"
+
+    def dumps(self, obj: Any) -> bytes:
+        return orjson.dumps(obj)
+
+    def loads(self, data: Frame) -> Any:
+        # orjson.JSONDecodeError subclasses json.JSONDecodeError, so callers
+        # can keep catching the stdlib exception
+        return orjson.loads(data)
+
+
+CODECS = {StdlibCodec.name: StdlibCodec, OrjsonCodec.name: OrjsonCodec}
+
+
+def get_codec(name: Optional[str] = None):
+    """Return the named codec; None or "auto" picks the fastest available one"""
+    if name in (None, "", "auto"):
+        name = OrjsonCodec.name if orjson is not None else StdlibCodec.name
+    if name == OrjsonCodec.name and orjson is None:
+        raise ValueError("orjson codec requested but orjson is not installed")
+    if name not in CODECS:
+        raise ValueError(f"Unknown JSON codec: {name}")
+    return CODECS[name]()
+
+
+class FrameEncoder:
+    """Encodes outbound messages into WebSocket frame payloads
+
+    Text frames are sent as str and binary frames as bytes. Constant payloads
+    such as the success ack are encoded once, and move_to_location commands
+    are assembled from cached per-agent and per-location fragments instead of
+    being serialized from a dict every time.
+    """
+
+    def __init__(self, codec=None, binary_frames: bool = False):
+        self.codec = codec or get_codec()
+        self.binary_frames = binary_frames
+        self.ack = self.encode({"status": "success"})
+        self._move_prefix = self._fragment(
+            '{"messageType":"move_to_location","agent_id":'
+        )
+        self._agent_fragments: Dict[str, Frame] = {}
+        self._location_fragments: Dict[str, Frame] = {}
+
+    def _fragment(self, text: str) -> Frame:
+        return text.encode("utf-8") if self.binary_frames else text
+
+    def _encode_value(self, value: Any) -> Frame:
+        payload = self.codec.dumps(value)
+        return payload if self.binary_frames else payload.decode("utf-8")
+
+    def encode(self, message: Dict[str, Any]) -> Frame:
+        """Encode a message, using the cached template for move commands"""
+        if (
+            message.get("messageType") == "move_to_location"
+            and len(message) == 3
+            and "agent_id" in message
+            and "location_name" in message
+        ):
+            return self.move_to_location(message["agent_id"], message["location_name"])
+        return self._encode_value(message)
+
+    def move_to_location(self, agent_id: str, location_name: str) -> Frame:
+        """Build a move_to_location frame from pre-encoded fragments"""
+        agent = self._agent_fragments.get(agent_id)
+        if agent is None:
+            agent = self._agent_fragments[agent_id] = self._encode_value(agent_id)
+
+        location = self._location_fragments.get(location_name)
+        if location is None:
+            location = self._location_fragments[location_name] = (
+                self._fragment(',"location_name":')
+                + self._encode_value(location_name)
+                + self._fragment("}")
+            )
+        return self._move_prefix + agent + location
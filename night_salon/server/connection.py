@@ -0,0 +1,20 @@
+from typing import Protocol, Union
+
+Frame = Union[str, bytes]
+
+
+class Connection(Protocol):
+    """Transport-agnostic client connection used by WebSocketManager
+
+    Starlette's WebSocket satisfies this interface directly; other transports
+    (such as the TCP transport) provide their own implementation so they can
+    reuse the same event routing.
+    """
+
+    async def accept(self) -> None: ...
+
+    async def send_text(self, data: str) -> None: ...
+
+    async def send_bytes(self, data: bytes) -> None: ...
+
+    async def close(self, code: int = 1000) -> None: ...
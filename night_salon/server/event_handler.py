@@ -1,5 +1,8 @@
+from night_salon.controllers.assignment import solve_assignment
 from night_salon.controllers.environment import EnvironmentController
 from night_salon.models import (
+    EVENT_ADAPTER,
+    EVENT_MODELS,
     Agent,
     SetupEvent,
     LocationReachedEvent,
@@ -9,69 +12,140 @@ from night_salon.models import (
     Location,
 )
 from night_salon.utils.logger import logger
-import random
+from night_salon.utils.metrics import REGISTRY
+from typing import Any, Callable, Dict, FrozenSet
+from types import SimpleNamespace
 import asyncio
+import inspect
+import time
+
+
+HANDLER_DURATION = REGISTRY.histogram(
+    "night_salon_handler_duration_seconds",
+    "Time spent validating and handling one event",
+    labels=("event_type",),
+)
+HANDLER_ERRORS = REGISTRY.counter(
+    "night_salon_handler_errors_total",
+    "Events whose validation or handler raised",
+    labels=("event_type",),
+)
+
+# Maps event type -> handler(event, env_controller); filled by @handles below
+EVENT_HANDLERS: Dict[str, Callable[[Any, EnvironmentController], Any]] = {}
+
+# Field defaults per event type, for building trusted events without pydantic
+_TRUSTED_DEFAULTS = {
+    event_type: {
+        name: field.get_default(call_default_factory=True)
+        for name, field in model.model_fields.items()
+        if not field.is_required()
+    }
+    for event_type, model in EVENT_MODELS.items()
+}
+
+
+def handles(event_type: str):
+    """Register the decorated function as the handler for an event type"""
+    if event_type not in EVENT_MODELS:
+        raise ValueError(f"No event model for {event_type}")
+
+    def register(handler):
+        EVENT_HANDLERS[event_type] = handler
+        return handler
+
+    return register
 
 
 class EventHandler:
     """Handles different types of system events from clients"""
 
+    # Event types that skip pydantic entirely: the handler gets a plain
+    # attribute namespace over the message. Trusted clients only; see
+    # Config.trusted_event_types.
+    trusted_event_types: FrozenSet[str] = frozenset()
+
+    @staticmethod
+    def trust_event_types(event_types) -> None:
+        """Opt event types into the unvalidated fast path"""
+        event_types = frozenset(event_types)
+        unknown = event_types - EVENT_MODELS.keys()
+        if unknown:
+            raise ValueError(f"Unknown event types: {', '.join(sorted(unknown))}")
+        if "setup" in event_types:
+            # Its nested area models are only built by validation
+            raise ValueError("setup events cannot skip validation")
+        EventHandler.trusted_event_types = event_types
+
     @staticmethod
     async def handle_event(
         event_type: str, data: dict, env_controller: EnvironmentController
     ):
-        logger.info(f"Received event type: {event_type}")
-        logger.debug(f"Event data: {data}")
+        logger.info("Received event type: %s", event_type)
+        logger.debug("Event data: %s", data)
+        handler = EVENT_HANDLERS.get(event_type)
+        if handler is None:
+            logger.warning("Received unknown event type: %s", event_type)
+            return None
+
+        started = time.perf_counter()
         try:
             event = EventHandler._create_event_object(event_type, data)
-            if not event:
-                logger.warning(f"Received unknown event type: {event_type}")
-                return None
-                
-            logger.info(f"Processing {event_type} event")
-            
-            # Route event to appropriate handler
-            if event_type == "setup":
-                return await EventHandler._handle_setup(event, env_controller)
-            elif event_type == "location_reached":
-                return EventHandler._handle_location_reached(event, env_controller)
-            elif event_type == "proximity_event":
-                EventHandler._handle_proximity_event(event, env_controller)
-                return None
-                
+            logger.debug("Processing %s event", event_type)
+            result = handler(event, env_controller)
+            if inspect.isawaitable(result):
+                result = await result
+            return result
         except Exception as e:
-            logger.error(f"Error handling {event_type} event: {str(e)}", exc_info=True)
+            HANDLER_ERRORS.labels(event_type).inc()
+            logger.error("Error handling %s event: %s", event_type, e, exc_info=True)
             raise
+        finally:
+            HANDLER_DURATION.labels(event_type).observe(time.perf_counter() - started)
+
+    @staticmethod
+    async def handle_batch(events: list, env_controller: EnvironmentController):
+        """Handle a list of events in one pass.
+
+        Returns (move_commands, errors) where errors holds the index and message
+        of every event that failed, so one bad event doesn't drop the batch."""
+        move_commands = []
+        errors = []
+        for index, event in enumerate(events):
+            try:
+                if not isinstance(event, dict):
+                    raise ValueError("Event must be an object")
+                event_type = event.get("messageType")
+                if event_type == "batch":
+                    raise ValueError("Nested batches are not supported")
+                result = await EventHandler.handle_event(event_type, event, env_controller)
+            except Exception as e:
+                errors.append({"index": index, "message": str(e)})
+                continue
+
+            if isinstance(result, list):
+                move_commands.extend(result)
+            elif result:
+                move_commands.append(result)
+        return move_commands, errors
 
     @staticmethod
     def _create_event_object(event_type: str, data: dict):
-        """Create the appropriate event object based on event type"""
-        event_map = {
-            "setup": lambda: SetupEvent(
-                type="setup",
-                agent_ids=data.get("agent_ids", []),
-                areas=data.get("areas", []),
-                cameras=data.get("cameras", []),
-                items=data.get("items", []),
-            ),
-            "location_reached": lambda: LocationReachedEvent(
-                type="location_reached",
-                agent_id=data["agent_id"],
-                location_name=data["location_name"],
-                coordinates=data.get("coordinates"),
-            ),
-            "proximity_event": lambda: ProximityEvent(
-                type="proximity_event",
-                agent_id=data["agent_id"],
-                target_id=data["target_id"],
-                event_type=data["event_type"],
-                distance=data["distance"],
-            ),
-        }
-        
-        return event_map[event_type]() if event_type in event_map else None
+        """Build the event model for a message, validating unless the type is trusted
+
+        `data` is normally the raw message, whose "messageType" selects the
+        model in the prebuilt discriminated union. Payloads without it, or
+        tagged differently, are retagged with `event_type` first."""
+        if event_type in EventHandler.trusted_event_types:
+            # Even model_construct costs as much as validating, so skip models
+            return SimpleNamespace(**{**_TRUSTED_DEFAULTS[event_type], **data})
+        if data.get("messageType", data.get("type")) != event_type:
+            # Both keys, since the discriminator reads "messageType" first
+            data = {**data, "messageType": event_type, "type": event_type}
+        return EVENT_ADAPTER.validate_python(data)
 
     @staticmethod
+    @handles("setup")
     async def _handle_setup(event: SetupEvent, env_controller: EnvironmentController):
         """Initialize environment with agents, areas and cameras"""
         logger.info(f"Initializing setup with {len(event.agent_ids)} agents")
@@ -83,7 +157,7 @@ class EventHandler:
         logger.info("Environment setup completed")
         
         # Generate initial move commands for all agents after setup
-        move_commands = EventHandler._generate_initial_movement_commands(event.agent_ids, env_controller)
+        move_commands = await EventHandler._generate_initial_movement_commands(event.agent_ids, env_controller)
         
         logger.info(f"Generated {len(move_commands)} initial movement commands after setup")
         return move_commands
@@ -132,28 +206,26 @@ class EventHandler:
         logger.debug(f"Added {len(items)} items")
 
     @staticmethod
-    def _generate_initial_movement_commands(agent_ids, env_controller):
-        """Generate initial movement commands for all agents"""
-        move_commands = []
-        for agent_id in agent_ids:
-            if agent_id in env_controller.agents:
-                command = EventHandler.generate_random_movement_command(agent_id, env_controller)
-                if command:
-                    # Record the time for this initial move command
-                    agent = env_controller.agents[agent_id]
-                    agent.state["last_move_time"] = asyncio.get_event_loop().time()
-                    move_commands.append(command)
-                    logger.info(f"Generated initial move command for agent {agent_id} to {command['location_name']}")
+    async def _generate_initial_movement_commands(agent_ids, env_controller):
+        """Assign every agent a distinct destination in one step"""
+        move_commands = await EventHandler.generate_bulk_movement_commands(
+            agent_ids, env_controller
+        )
+        now = asyncio.get_event_loop().time()
+        for command in move_commands:
+            # Record the time for this initial move command
+            env_controller.agents[command["agent_id"]].state["last_move_time"] = now
         return move_commands
 
     @staticmethod
+    @handles("location_reached")
     def _handle_location_reached(event: LocationReachedEvent, env_controller: EnvironmentController):
         """Update agent location in environment"""
-        logger.info(f"Agent {event.agent_id} reached {event.location_name}")
+        logger.info("Agent %s reached %s", event.agent_id, event.location_name)
         agent = env_controller.agents.get(event.agent_id)
         
         if not agent:
-            logger.warning(f"Agent {event.agent_id} not found")
+            logger.warning("Agent %s not found", event.agent_id)
             return None
             
         try:
@@ -164,8 +236,7 @@ class EventHandler:
             return EventHandler.generate_random_movement_command(event.agent_id, env_controller)
         except Exception as e:
             logger.error(
-                f"Error updating location for agent {event.agent_id}: {str(e)}",
-                exc_info=True,
+                "Error updating location for agent %s: %s", event.agent_id, e, exc_info=True
             )
             
         return None
@@ -178,12 +249,14 @@ class EventHandler:
         
         env_controller._update_agent_location(agent, area, location_id)
         
-        logger.debug(f"Updated area for {event.agent_id} to {area.name}")
+        logger.debug("Updated area for %s to %s", event.agent_id, area.name)
         if location_id:
-            logger.debug(f"Updated location for {event.agent_id} to {location_id}")
+            logger.debug("Updated location for %s to %s", event.agent_id, location_id)
             
         if event.coordinates:
-            agent.state["position"] = event.coordinates
+            agent.position = event.coordinates
+            if location_id:
+                env_controller.record_location_coordinates(location_id, event.coordinates)
             
         agent.state["last_move_time"] = asyncio.get_event_loop().time()
         agent.state["current_location"] = event.location_name
@@ -191,22 +264,26 @@ class EventHandler:
     @staticmethod
     def _find_area_for_location(location_id, env_controller):
         """Find which area contains the given location"""
-        for area_name, area_data in env_controller.environment.areas.items():
-            if location_id in area_data.locations:
-                logger.debug(f"Location {location_id} belongs to {area_name}")
-                return area_data.type
-                
-        logger.warning(f"Unknown location: {location_id}, defaulting to HALLWAY")
+        area = env_controller.get_area_for_location(location_id)
+        if area:
+            logger.debug("Location %s belongs to %s", location_id, area.name)
+            return area
+
+        logger.warning("Unknown location: %s, defaulting to HALLWAY", location_id)
         return Area.HALLWAY
 
     @staticmethod
+    @handles("proximity_event")
     def _handle_proximity_event(
         event: ProximityEvent, env_controller: EnvironmentController
     ):
         """Log proximity events between agents"""
         logger.info(
-            f"Proximity event: {event.agent_id} {event.event_type} with {event.target_id} "
-            f"at distance {event.distance:.2f}"
+            "Proximity event: %s %s with %s at distance %.2f",
+            event.agent_id,
+            event.event_type,
+            event.target_id,
+            event.distance,
         )
 
     @staticmethod
@@ -216,63 +293,80 @@ class EventHandler:
         """Generate a command to move an agent to a random location"""
         agent = env_controller.agents.get(agent_id)
         if not agent:
-            logger.warning(f"Agent {agent_id} not found")
+            logger.warning("Agent %s not found", agent_id)
             return None
 
         # Get current location of agent
         current_location = agent.state.get("current_location")
-        
-        # Find available locations
-        available_locations = EventHandler._get_available_locations(current_location, env_controller)
-        
-        if not available_locations:
+
+        # Sample a free location other than the current one from the controller's index
+        destination = env_controller.sample_available_location(current_location)
+
+        if not destination:
             logger.warning("No valid unoccupied locations available for random movement")
             return None
 
-        # Select and reserve a random location
-        return EventHandler._create_movement_command(agent_id, available_locations, env_controller)
+        # Reserve the selected location
+        area, location_id = destination
+        return EventHandler._create_movement_command(agent_id, area, location_id, env_controller)
 
     @staticmethod
-    def _get_available_locations(current_location, env_controller):
-        """Get all available locations the agent can move to"""
-        available_locations = []
-        
-        for area_name, area_data in env_controller.environment.areas.items():
-            if not area_data.valid:
-                continue
-            
-            try:
-                area_enum = Area[area_data.name.upper()]
-            except (KeyError, ValueError):
-                # Skip areas that don't map to our enum
-                continue
-                
-            # Get truly available locations (neither occupied nor planned)
-            area_locations = env_controller.get_available_locations(area_enum)
-            
-            for loc_id in area_locations:
-                # Don't include current location as an option
-                if loc_id != current_location:
-                    available_locations.append((area_enum, loc_id))
-                    
-        return available_locations
+    async def generate_bulk_movement_commands(
+        agent_ids, env_controller: EnvironmentController, mode=None
+    ):
+        """Assign destinations to many agents at once and return the commands
+
+        The greedy and auction solvers take O(N * L) time, so they run in a
+        worker thread; reservations are made on the loop before and after."""
+        plan = env_controller.plan_destinations(agent_ids, mode)
+        columns = None
+        if plan.problem is not None:
+            columns = await asyncio.get_running_loop().run_in_executor(
+                None, solve_assignment, *plan.problem
+            )
+        planned = env_controller.finish_destinations(plan, columns)
+        logger.info("Planned bulk moves for %s agents", len(planned))
+        return [
+            EventHandler._move_command(agent_id, location_id)
+            for agent_id, _, location_id in planned
+        ]
+
+    @staticmethod
+    def generate_assignment_commands(
+        assignments, env_controller: EnvironmentController
+    ):
+        """Reserve explicit (agent_id, location_id) pairs and return (commands, errors)"""
+        planned, errors = env_controller.apply_assignments(assignments)
+        for error in errors:
+            logger.warning(
+                "Rejected assignment of %s to %s: %s",
+                error["agent_id"],
+                error["location_name"],
+                error["message"],
+            )
+        commands = [
+            EventHandler._move_command(agent_id, location_id)
+            for agent_id, _, location_id in planned
+        ]
+        return commands, errors
+
+    @staticmethod
+    def _move_command(agent_id, location_id):
+        """Format a move command as expected by the Unity client"""
+        return {
+            "messageType": "move_to_location",
+            "agent_id": agent_id,
+            "location_name": location_id,
+        }
 
     @staticmethod
-    def _create_movement_command(agent_id, available_locations, env_controller):
+    def _create_movement_command(agent_id, area, location_id, env_controller):
         """Create and return a movement command for an agent"""
-        # Select a random location
-        random_area, random_location = random.choice(available_locations)
-        
         # Try to reserve the location before sending command
-        if env_controller.prepare_agent_move(agent_id, random_area, random_location):
-            logger.info(f"Instructing agent {agent_id} to move to {random_location}")
+        if env_controller.prepare_agent_move(agent_id, area, location_id):
+            logger.info("Instructing agent %s to move to %s", agent_id, location_id)
             
-            # Format the command as expected by Unity client
-            return {
-                "messageType": "move_to_location",
-                "agent_id": agent_id,
-                "location_name": random_location,
-            }
+            return EventHandler._move_command(agent_id, location_id)
         else:
-            logger.warning(f"Failed to reserve location {random_location} for agent {agent_id}")
+            logger.warning("Failed to reserve location %s for agent %s", location_id, agent_id)
             return None
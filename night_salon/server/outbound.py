@@ -0,0 +1,249 @@
+import asyncio
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from night_salon.server.connection import Connection, Frame
+from night_salon.utils.logger import logger
+
+
+def _move_agent(message) -> Optional[str]:
+    """Agent id of a standalone move_to_location command, else None"""
+    if isinstance(message, dict) and message.get("messageType") == "move_to_location":
+        return message.get("agent_id")
+    return None
+
+
+def _is_command(message) -> bool:
+    return isinstance(message, dict) and message.get("messageType") in (
+        "move_to_location",
+        "batch",
+    )
+
+
+class _Item:
+    __slots__ = ("message", "agent_id", "waiters", "frames")
+
+    def __init__(self, message, agent_id: Optional[str], frames=None):
+        self.message = message
+        self.agent_id = agent_id
+        self.waiters: List[asyncio.Future] = []
+        # Encoded frames by encoding, shared by every queue a broadcast went to
+        self.frames: Optional[Dict[str, Frame]] = frames
+
+
+def _resolve(waiters: List[asyncio.Future], result) -> None:
+    for waiter in waiters:
+        if not waiter.done():
+            waiter.set_result(result)
+
+
+class OutboundQueue:
+    """Bounded per-connection send queue drained by a single writer task
+
+    Producers call `put`, which never blocks, so a slow client cannot stall
+    event processing. Only the writer task touches the connection, which
+    rules out interleaved writes. While queued, a newer move command for an
+    agent replaces the older one in place, and when the queue is full the
+    oldest queued move is evicted; superseded or evicted commands are passed
+    to `on_dropped` so their reservations can be released. Clients that
+    accept batch frames get consecutive commands coalesced into one frame.
+
+    A `waiter` future passed to `put` resolves to the loop time at which the
+    message was written, or None if it was dropped or superseded. Messages
+    put with the same `frames` dict are encoded once per `encoding`, so a
+    broadcast command stays a dict the rules above apply to.
+    """
+
+    def __init__(
+        self,
+        connection: Connection,
+        encode: Callable[[Any], Frame],
+        on_error: Callable[[Connection], None],
+        on_dropped: Optional[Callable[[Dict[str, Any]], None]] = None,
+        supports_batch: bool = False,
+        max_size: int = 1024,
+        max_batch: int = 256,
+        encoding: str = "json",
+    ):
+        self.connection = connection
+        self.supports_batch = supports_batch
+        self.encoding = encoding  # Key for frames shared between queues
+        self.max_size = max_size
+        self.max_batch = max_batch
+        self._encode = encode
+        self._on_error = on_error
+        self._on_dropped = on_dropped
+        self._items: Deque[_Item] = deque()
+        self._moves: Dict[str, _Item] = {}  # Maps agent_id -> queued move item
+        self._ready = asyncio.Event()
+        self._drained = asyncio.Event()  # Set while nothing is queued or in flight
+        self._drained.set()
+        self._closed = False
+        self.sent_frames = 0
+        self.merged = 0
+        self.dropped = 0
+        self.high_water = 0
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    @property
+    def depth(self) -> int:
+        return len(self._items)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "depth": self.depth,
+            "high_water": self.high_water,
+            "sent_frames": self.sent_frames,
+            "merged": self.merged,
+            "dropped": self.dropped,
+        }
+
+    def put(
+        self,
+        message,
+        waiter: Optional[asyncio.Future] = None,
+        frames: Optional[Dict[str, Frame]] = None,
+    ) -> bool:
+        """Queue a message or pre-encoded frame, return False if it was dropped"""
+        waiters = [waiter] if waiter is not None else []
+        if self._closed:
+            _resolve(waiters, None)
+            return False
+
+        agent_id = _move_agent(message)
+        if agent_id is not None:
+            queued = self._moves.get(agent_id)
+            if queued is not None:
+                # Supersede the agent's pending move, keeping its queue position
+                superseded, queued.message = queued.message, message
+                queued.frames = frames
+                _resolve(queued.waiters, None)
+                queued.waiters = waiters
+                self.merged += 1
+                self._drop(superseded, count=False)
+                return True
+
+        if len(self._items) >= self.max_size and not self._evict_oldest_move():
+            self._drop(message)
+            _resolve(waiters, None)
+            return False
+
+        item = _Item(message, agent_id, frames)
+        item.waiters = waiters
+        self._items.append(item)
+        if agent_id is not None:
+            self._moves[agent_id] = item
+        self.high_water = max(self.high_water, len(self._items))
+        self._drained.clear()
+        self._ready.set()
+        return True
+
+    async def flush(self, timeout: float = 1.0) -> bool:
+        """Wait until everything queued so far has been written"""
+        try:
+            await asyncio.wait_for(self._drained.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def close(self) -> None:
+        """Stop the writer; anything still queued is discarded, commands via `on_dropped`"""
+        self._closed = True
+        self._task.cancel()
+        for item in self._items:
+            self._drop(item.message, count=False)  # Not an overflow
+            _resolve(item.waiters, None)
+        self._items.clear()
+        self._moves.clear()
+
+    def _evict_oldest_move(self) -> bool:
+        for item in self._items:
+            if item.agent_id is not None:
+                self._items.remove(item)
+                del self._moves[item.agent_id]
+                self._drop(item.message)
+                _resolve(item.waiters, None)
+                return True
+        return False
+
+    def _drop(self, message, count: bool = True) -> None:
+        if count:
+            self.dropped += 1
+        if self._on_dropped is not None and _is_command(message):
+            self._on_dropped(message)
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        frames = []
+        try:
+            while True:
+                await self._ready.wait()
+                self._ready.clear()
+                while self._items:
+                    frames = self._take_frames()
+                    while frames:
+                        frame, waiters = frames[0]
+                        if isinstance(frame, bytes):
+                            await self.connection.send_bytes(frame)
+                        else:
+                            await self.connection.send_text(frame)
+                        frames.pop(0)
+                        self.sent_frames += 1
+                        _resolve(waiters, loop.time())
+                self._drained.set()
+        except asyncio.CancelledError:
+            for _, waiters in frames:
+                _resolve(waiters, None)
+            raise
+        except Exception as e:
+            logger.error(f"Error writing to client: {str(e)}")
+            for _, waiters in frames:
+                _resolve(waiters, None)
+            self._closed = True
+            self._on_error(self.connection)
+
+    def _take_frames(self) -> List[Tuple[Frame, List[asyncio.Future]]]:
+        """Dequeue everything queued right now and encode it into frames"""
+        items = list(self._items)
+        self._items.clear()
+        self._moves.clear()
+
+        frames = []
+        events = []
+        waiters = []
+        for item in items:
+            message = item.message
+            if self.supports_batch and _is_command(message):
+                if message["messageType"] == "batch":
+                    events.extend(message.get("events", []))
+                else:
+                    events.append(message)
+                waiters.extend(item.waiters)
+                if len(events) >= self.max_batch:
+                    frames.append((self._encode_events(events), waiters))
+                    events, waiters = [], []
+                continue
+
+            if events:
+                frames.append((self._encode_events(events), waiters))
+                events, waiters = [], []
+            if not isinstance(message, (str, bytes)):
+                message = self._encode_item(item)
+            frames.append((message, item.waiters))
+
+        if events:
+            frames.append((self._encode_events(events), waiters))
+        return frames
+
+    def _encode_item(self, item: _Item) -> Frame:
+        if item.frames is None:
+            return self._encode(item.message)
+        frame = item.frames.get(self.encoding)
+        if frame is None:
+            frame = item.frames[self.encoding] = self._encode(item.message)
+        return frame
+
+    def _encode_events(self, events: List[Dict[str, Any]]) -> Frame:
+        if len(events) == 1:
+            return self._encode(events[0])
+        return self._encode({"messageType": "batch", "events": events})
@@ -0,0 +1,130 @@
+import asyncio
+import heapq
+import itertools
+import random
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Set
+
+from night_salon.utils.logger import logger
+
+Dispatch = Callable[[Hashable, List[Any]], Awaitable[None]]
+
+
+class _Entry:
+    __slots__ = ("key", "item", "cancelled")
+
+    def __init__(self, key: Hashable, item: Any):
+        self.key = key
+        self.item = item
+        self.cancelled = False
+
+
+class CommandScheduler:
+    """Heap-based scheduler for delayed commands, independent of message intake
+
+    Items are queued with a due time and a key (the client connection). A
+    single background task sleeps until the earliest due time, pops every
+    item that is due in one wakeup, and hands them to `dispatch` grouped by
+    key in scheduling order. Cancelling a key (e.g. on disconnect) drops all
+    of its pending items without touching the heap.
+    """
+
+    def __init__(
+        self, dispatch: Dispatch, min_delay: float = 0.5, max_delay: float = 1.5
+    ):
+        self.dispatch = dispatch
+        self.min_delay = min_delay
+        self.max_delay = max(max_delay, min_delay)
+        self._heap = []  # (due, sequence, entry)
+        self._sequence = itertools.count()
+        self._by_key: Dict[Hashable, Set[_Entry]] = {}
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def __len__(self):
+        return sum(len(entries) for entries in self._by_key.values())
+
+    def jitter(self) -> float:
+        """Random delay within the configured bounds"""
+        return random.uniform(self.min_delay, self.max_delay)
+
+    def schedule(self, key: Hashable, item: Any, delay: Optional[float] = None):
+        """Queue `item` for `key` after `delay` seconds (jittered when None)"""
+        self._ensure_started()
+        loop = asyncio.get_running_loop()
+        due = loop.time() + (self.jitter() if delay is None else delay)
+        entry = _Entry(key, item)
+        self._by_key.setdefault(key, set()).add(entry)
+
+        earliest = self._heap[0][0] if self._heap else None
+        heapq.heappush(self._heap, (due, next(self._sequence), entry))
+        if earliest is None or due < earliest:
+            self._wakeup.set()
+
+    def cancel(self, key: Hashable) -> List[Any]:
+        """Cancel every pending item for a key, returning the dropped items"""
+        entries = self._by_key.pop(key, ())
+        for entry in entries:
+            entry.cancelled = True
+        return [entry.item for entry in entries]
+
+    def pending(self, key: Hashable) -> int:
+        return len(self._by_key.get(key, ()))
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._heap.clear()
+        self._by_key.clear()
+
+    def _ensure_started(self):
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            self._wakeup.clear()
+            if not self._heap:
+                await self._wakeup.wait()
+                continue
+
+            timeout = self._heap[0][0] - loop.time()
+            if timeout > 0:
+                try:
+                    # Woken early if something is scheduled before the current head
+                    await asyncio.wait_for(self._wakeup.wait(), timeout)
+                    continue
+                except asyncio.TimeoutError:
+                    pass
+
+            await self._dispatch_due(loop.time())
+
+    async def _dispatch_due(self, now: float):
+        """Pop everything that is due and dispatch it, grouped per key"""
+        due: Dict[Hashable, List[Any]] = {}
+        while self._heap and self._heap[0][0] <= now:
+            _, _, entry = heapq.heappop(self._heap)
+            if entry.cancelled:
+                continue
+            entries = self._by_key.get(entry.key)
+            if entries is not None:
+                entries.discard(entry)
+                if not entries:
+                    del self._by_key[entry.key]
+            due.setdefault(entry.key, []).append(entry.item)
+
+        if not due:
+            return
+        results = await asyncio.gather(
+            *(self.dispatch(key, items) for key, items in due.items()),
+            return_exceptions=True,
+        )
+        for result in results:
+            if isinstance(result, Exception):
+                logger.error(f"Error dispatching scheduled commands: {str(result)}")
@@ -1,16 +1,125 @@
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Header, HTTPException, Response, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from night_salon.controllers.environment import EnvironmentController
+from fastapi.responses import PlainTextResponse
+from night_salon.models import MoveAssignmentsRequest
 from night_salon.server.event_handler import EventHandler
-from night_salon.server.websocket_manager import WebSocketManager
-from night_salon.utils.logger import logger
-import json
+from night_salon.server.sharding import shard_for
+from night_salon.server.worlds import (
+    DEFAULT_WORLD,
+    World,
+    WorldRegistry,
+    is_valid_world_id,
+)
+from night_salon.utils.config import Config
+from night_salon.utils.diagnostics import (
+    LoopLagMonitor,
+    ProfileBusyError,
+    Profiler,
+    tracemalloc_snapshot,
+)
+from night_salon.utils.logger import configure_logging, logger
+from night_salon.utils.metrics import REGISTRY
+from typing import Optional
 
 # Define globals first
-env_controller = EnvironmentController()  # Shared environment instance
-websocket_manager = WebSocketManager(env_controller)  # WebSocket manager
+config = Config()
+configure_logging(config)
+EventHandler.trust_event_types(config.trusted_event_types)
+
+# Worlds hosted by this process, created on first connection and evicted when idle
+worlds = WorldRegistry(
+    config,
+    idle_timeout=config.world_idle_timeout,
+    max_worlds=config.max_worlds,
+    memory_limit=int(config.world_memory_limit_mb * 1024 * 1024),
+    sweep_interval=config.world_sweep_interval,
+)
+
+
+def owns_world(world_id: str) -> bool:
+    """Whether this process is the shard responsible for a world"""
+    if config.shard_count <= 1:
+        return True
+    return shard_for(world_id, config.shard_count) == config.shard_index
+
+
+# The world behind plain /ws and the TCP transport; pinned, never evicted.
+# Only its owning shard hosts it; TCP runs unsharded, so it always exists there.
+default_world = (
+    worlds.add(World(DEFAULT_WORLD, config)) if owns_world(DEFAULT_WORLD) else None
+)
+websocket_manager = default_world.websocket_manager if default_world else None
+
+# Gauges read at scrape time from the worlds above
+REGISTRY.gauge("night_salon_worlds", "Worlds hosted by this process").set_function(
+    lambda: len(worlds)
+)
+REGISTRY.gauge(
+    "night_salon_world_memory_bytes", "Estimated memory of all worlds, measured per scrape"
+).set_function(worlds.memory_usage)
+REGISTRY.gauge(
+    "night_salon_connected_clients", "Connected WebSocket and TCP clients"
+).set_function(
+    lambda: sum(len(w.websocket_manager.connected_clients) for w in worlds)
+)
+REGISTRY.gauge("night_salon_agents", "Registered agents").set_function(
+    lambda: sum(len(w.env_controller.agents) for w in worlds)
+)
+REGISTRY.gauge(
+    "night_salon_outbound_queue_depth", "Messages waiting in all outbound queues"
+).set_function(
+    lambda: sum(
+        stats["depth"] for w in worlds for stats in w.websocket_manager.queue_stats()
+    )
+)
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Whether an If-None-Match header lists `etag` (weak tags compare equal)"""
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or etag in (tag[2:] if tag.startswith("W/") else tag for tag in tags)
+
+
+def world_parts(world_id: str, touch: bool = True):
+    """(env_controller, websocket_manager) of a world, for HTTP endpoints
 
-app = FastAPI()
+    Read-only endpoints pass touch=False so polling them does not count as
+    activity, which would keep idle worlds alive and re-snapshotted."""
+    world = worlds.get(world_id)
+    if world is None:
+        raise HTTPException(404, f"Unknown world: {world_id}")
+    if touch:
+        world.touch()
+    return world.env_controller, world.websocket_manager
+
+
+# Debug endpoints and their helpers only exist when DEBUG_ENDPOINTS is on
+loop_lag_monitor = (
+    LoopLagMonitor(config.loop_lag_interval, config.slow_callback_threshold)
+    if config.debug_endpoints
+    else None
+)
+profiler = Profiler() if config.debug_endpoints else None
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await worlds.restore_saved(owns_world)
+    worlds.start()
+    if loop_lag_monitor is not None:
+        loop_lag_monitor.start()
+    try:
+        yield
+    finally:
+        if loop_lag_monitor is not None:
+            await loop_lag_monitor.stop()
+        await worlds.close()
+
+
+app = FastAPI(lifespan=lifespan)
 
 # Middleware must be added right after creating the app instance, before it starts
 app.add_middleware(
@@ -24,14 +133,44 @@ app.add_middleware(
 
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
+    await serve_websocket(websocket, websocket.query_params.get("world", DEFAULT_WORLD))
+
+
+@app.websocket("/ws/{world_id}")
+async def world_websocket_endpoint(websocket: WebSocket, world_id: str):
+    await serve_websocket(websocket, world_id)
+
+
+async def serve_websocket(websocket: WebSocket, world_id: str):
+    if not is_valid_world_id(world_id) or not owns_world(world_id):
+        # Invalid id, or a world another shard owns; the router never sends these
+        logger.warning(f"Refusing connection for world {world_id}")
+        await websocket.close(code=1008)
+        return
+    world = await worlds.open(world_id)
+    if world is None:
+        await websocket.close(code=1013)  # Every world here is in use; try later
+        return
+    websocket_manager = world.websocket_manager
     try:
-        await websocket_manager.connect(websocket)
+        await websocket_manager.connect(
+            websocket,
+            protocol=websocket.query_params.get("protocol"),
+            batch=websocket.query_params.get("batch", "").lower() in ("1", "true"),
+        )
 
         # Main message receiving loop
         while websocket_manager.is_connected(websocket):
             try:
-                data = await websocket.receive_text()
+                message = await websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    raise WebSocketDisconnect(message.get("code", 1000))
+                # Accept both text and binary frames; the codec decodes either
+                data = message.get("text")
+                if data is None:
+                    data = message.get("bytes")
                 await websocket_manager.process_message(websocket, data)
+                world.touch()
             except WebSocketDisconnect:
                 logger.info("Client disconnected during message processing")
                 websocket_manager.disconnect(websocket)
@@ -39,13 +178,10 @@ async def websocket_endpoint(websocket: WebSocket):
             except Exception as e:
                 logger.error(f"Error processing message: {str(e)}", exc_info=True)
                 # Try to send error response if possible
-                try:
-                    if websocket_manager.is_connected(websocket):
-                        await websocket.send_json(
-                            {"status": "error", "message": "Error processing message"}
-                        )
-                except Exception:
-                    pass
+                await websocket_manager._send_response(
+                    websocket, {"status": "error", "message": "Error processing message"}
+                )
+                await websocket_manager.flush(websocket)
                 websocket_manager.disconnect(websocket)
                 break
 
@@ -60,11 +196,15 @@ async def websocket_endpoint(websocket: WebSocket):
         except Exception:
             # We don't need to log this - it's likely the connection is already closed
             pass
+    finally:
+        # Idle time counts from the last client leaving
+        world.touch()
 
 
 @app.get("/send-random-move/{agent_id}")
-async def send_random_move_command(agent_id: str):
+async def send_random_move_command(agent_id: str, world: str = DEFAULT_WORLD):
     """API endpoint to trigger a random move command for an agent"""
+    env_controller, websocket_manager = world_parts(world)
     if not websocket_manager.connected_clients:
         return {"status": "error", "message": "No connected clients"}
 
@@ -79,34 +219,193 @@ async def send_random_move_command(agent_id: str):
 
 
 @app.get("/send-random-move-all")
-async def send_random_move_all():
-    """API endpoint to trigger random moves for all agents"""
+async def send_random_move_all(
+    area: Optional[str] = None,
+    agent_ids: Optional[str] = None,
+    mode: Optional[str] = None,
+    world: str = DEFAULT_WORLD,
+):
+    """API endpoint to trigger random moves for all agents
+
+    Optionally filtered to agents currently in `area` and/or to a
+    comma-separated list of `agent_ids`. Destinations are planned in one
+    pass (`mode` overrides the configured assignment mode) and sent to each
+    client as a single batch frame."""
+    env_controller, websocket_manager = world_parts(world)
     if not websocket_manager.connected_clients:
         return {"status": "error", "message": "No connected clients"}
 
     if not env_controller.agents:
         return {"status": "error", "message": "No agents registered"}
 
-    results = []
-    failures = 0
+    selected = list(env_controller.agents)
+    if agent_ids:
+        wanted = {agent_id.strip() for agent_id in agent_ids.split(",")}
+        selected = [agent_id for agent_id in selected if agent_id in wanted]
+    if area:
+        area_name = area.upper()
+        selected = [
+            agent_id
+            for agent_id in selected
+            if area_name in (
+                env_controller.agents[agent_id].area.name,
+                env_controller.agents[agent_id].area.value,
+            )
+        ]
+    if not selected:
+        return {"status": "error", "message": "No agents match the filter"}
 
-    for agent_id in env_controller.agents:
-        command = EventHandler.generate_random_movement_command(
-            agent_id, env_controller
+    try:
+        commands = await EventHandler.generate_bulk_movement_commands(
+            selected, env_controller, mode
         )
-        if command:
-            result = await websocket_manager.broadcast_command(command)
-            failures += result.get("failed", 0)
-            results.append(
-                {
-                    "agent_id": agent_id,
-                    "command": command,
-                    "sent_to": result.get("sent_to", 0),
-                }
-            )
+    except ValueError as e:
+        return {"status": "error", "message": str(e)}
+    if not commands:
+        return {"status": "error", "message": "No free locations available"}
 
+    result = await websocket_manager.broadcast_commands(commands)
+    failures = result.get("failed", 0) + result.get("timed_out", 0)
     return {
         "status": "success" if failures == 0 else "partial_success",
-        "results": results,
+        "results": commands,
+        "unassigned": len(selected) - len(commands),
+        "sent_to": result.get("sent_to", 0),
         "failures": failures,
     }
+
+
+@app.post("/move-assignments")
+async def send_move_assignments(
+    request: MoveAssignmentsRequest, world: str = DEFAULT_WORLD
+):
+    """API endpoint to send explicit agent -> location moves in one batch"""
+    env_controller, websocket_manager = world_parts(world)
+    if not websocket_manager.connected_clients:
+        return {"status": "error", "message": "No connected clients"}
+
+    commands, errors = EventHandler.generate_assignment_commands(
+        [(item.agent_id, item.location_name) for item in request.assignments],
+        env_controller,
+    )
+    if not commands:
+        return {"status": "error", "message": "No assignments accepted", "errors": errors}
+
+    result = await websocket_manager.broadcast_commands(commands)
+    failures = result.get("failed", 0) + result.get("timed_out", 0)
+    return {
+        "status": "success" if failures == 0 and not errors else "partial_success",
+        "results": commands,
+        "errors": errors,
+        "sent_to": result.get("sent_to", 0),
+        "failures": failures,
+    }
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Server metrics in the Prometheus text exposition format"""
+    await worlds.measure_memory()  # For night_salon_world_memory_bytes
+    return PlainTextResponse(
+        REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
+if config.debug_endpoints:
+
+    @app.get("/debug/profile", response_class=PlainTextResponse)
+    async def profile(seconds: float = 5.0, mode: str = "cprofile", limit: int = 50):
+        """Profile the event loop for `seconds`; pstats text or collapsed stacks"""
+        if not 0 < seconds <= config.max_profile_seconds:
+            raise HTTPException(
+                400, f"seconds must be in (0, {config.max_profile_seconds}]"
+            )
+        try:
+            return await profiler.profile(seconds, mode, limit)
+        except ProfileBusyError as e:
+            raise HTTPException(409, str(e))
+        except ValueError as e:
+            raise HTTPException(400, str(e))
+
+    @app.get("/debug/loop-lag")
+    async def loop_lag():
+        """Event loop lag statistics and recent slow callbacks"""
+        return loop_lag_monitor.report()
+
+    @app.get("/debug/slow-callbacks")
+    async def slow_callbacks(seconds: float = 5.0):
+        """Name callbacks that block the loop, in asyncio debug mode for `seconds`"""
+        if not 0 < seconds <= config.max_profile_seconds:
+            raise HTTPException(
+                400, f"seconds must be in (0, {config.max_profile_seconds}]"
+            )
+        try:
+            callbacks = await loop_lag_monitor.capture_slow_callbacks(seconds)
+        except ProfileBusyError as e:
+            raise HTTPException(409, str(e))
+        return {"seconds": seconds, "slow_callbacks": callbacks}
+
+    @app.get("/debug/tracemalloc")
+    async def tracemalloc_top(limit: int = 20):
+        """Top allocation sites; the first call starts tracing"""
+        return tracemalloc_snapshot(limit, config.tracemalloc_frames)
+
+
+@app.get("/worlds")
+async def list_worlds():
+    """Worlds hosted by this process with their clients, size and memory estimate"""
+    await worlds.measure_memory()
+    return {
+        "worlds": [world.stats() for world in worlds],
+        "memory_bytes": worlds.memory_usage(),
+        "max_worlds": worlds.max_worlds,
+        "memory_limit_bytes": worlds.memory_limit,
+    }
+
+
+@app.delete("/worlds/{world_id}")
+async def delete_world(world_id: str):
+    """Evict a world now, disconnecting its clients"""
+    if world_id in worlds.pinned:
+        raise HTTPException(400, f"World {world_id} cannot be evicted")
+    if not await worlds.evict(world_id):
+        raise HTTPException(404, f"Unknown world: {world_id}")
+    return {"status": "success", "world_id": world_id}
+
+
+@app.get("/connections")
+async def get_connections(world: str = DEFAULT_WORLD):
+    """Outbound queue depth and send counters for each connected client"""
+    _, websocket_manager = world_parts(world, touch=False)
+    return {
+        "connected_clients": len(websocket_manager.connected_clients),
+        "queues": websocket_manager.queue_stats(),
+    }
+
+
+@app.get("/state")
+async def get_state(
+    world: str = DEFAULT_WORLD, if_none_match: Optional[str] = Header(None)
+):
+    """Full environment state, pre-encoded and refreshed at most every
+    STATE_CACHE_INTERVAL seconds; send If-None-Match to get 304 when unchanged"""
+    if world not in worlds:
+        raise HTTPException(404, f"Unknown world: {world}")
+    etag, body = await worlds.get(world).state_cache.get()
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+@app.get("/state/changes")
+async def get_state_changes(
+    since: Optional[int] = None, epoch: Optional[str] = None, world: str = DEFAULT_WORLD
+):
+    """Areas, locations and agents changed after version `since`
+
+    Pass back the `epoch` and `version` of the previous response. The full
+    state is returned ("full": true) on the first call, after a restart, or
+    when the poller fell further behind than the change log reaches."""
+    env_controller, _ = world_parts(world, touch=False)
+    return env_controller.get_changes(since, epoch)
@@ -0,0 +1,256 @@
+"""Multi-process hosting: worlds pinned to shard processes behind a router
+
+Each world id hashes to exactly one shard. Every shard is a full server
+process (see server.py) listening on its own local port and refusing
+worlds it does not own, so a world's state lives in one place. The router
+process owns the public port: it relays `/ws/{world_id}` connections to the
+owning shard and forwards HTTP requests by their `world` query parameter.
+Clients that want to skip the relay hop can ask `/worlds/{world_id}/shard`
+for the shard's address and connect to it directly.
+"""
+
+import asyncio
+import multiprocessing
+import os
+import zlib
+from contextlib import asynccontextmanager
+from typing import List, Optional
+
+import httpx
+import uvicorn
+import websockets
+from fastapi import FastAPI, HTTPException, Request, Response, WebSocket
+
+from night_salon.server.worlds import DEFAULT_WORLD, is_valid_world_id
+from night_salon.utils.logger import logger
+
+SHARD_APP = "night_salon.server.server:app"
+# Not forwarded between router and shards; httpx and uvicorn set their own
+_HOP_HEADERS = frozenset(
+    (
+        "connection",
+        "content-length",
+        "host",
+        "keep-alive",
+        "transfer-encoding",
+        "upgrade",
+    )
+)
+
+
+def shard_for(world_id: str, shard_count: int) -> int:
+    """Stable shard index for a world id, the same in every process"""
+    return zlib.crc32(world_id.encode()) % shard_count
+
+
+def _run_shard(index: int, count: int, host: str, port: int) -> None:
+    # Read by Config when the shard imports server.py
+    os.environ["SHARD_INDEX"] = str(index)
+    os.environ["SHARDS"] = str(count)
+    uvicorn.run(SHARD_APP, host=host, port=port, log_config=None)
+
+
+class ShardSupervisor:
+    """Starts one server process per shard and restarts any that exit
+
+    A restarted shard comes back empty; its Unity clients reconnect and
+    send `setup` again, as after a server restart.
+    """
+
+    def __init__(self, count: int, host: str, base_port: int):
+        self.count = count
+        self.host = host
+        self.base_port = base_port
+        self._context = multiprocessing.get_context("spawn")
+        self._processes: List[Optional[multiprocessing.Process]] = [None] * count
+
+    def url(self, index: int, scheme: str = "http") -> str:
+        return f"{scheme}://{self.host}:{self.base_port + index}"
+
+    def start(self) -> None:
+        for index in range(self.count):
+            self._start(index)
+
+    def _start(self, index: int) -> None:
+        process = self._context.Process(
+            target=_run_shard,
+            args=(index, self.count, self.host, self.base_port + index),
+            name=f"night-salon-shard-{index}",
+            daemon=True,
+        )
+        process.start()
+        self._processes[index] = process
+        logger.info(f"Started shard {index} (pid {process.pid}) on {self.url(index)}")
+
+    def restart_dead(self) -> None:
+        for index, process in enumerate(self._processes):
+            if process is not None and not process.is_alive():
+                logger.error(
+                    f"Shard {index} exited with code {process.exitcode}, restarting"
+                )
+                self._start(index)
+
+    def stop(self, timeout: float = 5.0) -> None:
+        for process in self._processes:
+            if process is not None and process.is_alive():
+                process.terminate()
+        for process in self._processes:
+            if process is not None:
+                process.join(timeout)
+                if process.is_alive():
+                    process.kill()
+        self._processes = [None] * self.count
+
+
+def create_router_app(
+    supervisor: ShardSupervisor, watchdog_interval: float = 1.0
+) -> FastAPI:
+    """Public-facing app that routes every world to its shard"""
+    client = httpx.AsyncClient(timeout=None)
+
+    async def watchdog():
+        while True:
+            await asyncio.sleep(watchdog_interval)
+            supervisor.restart_dead()
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        watchdog_task = asyncio.create_task(watchdog())
+        try:
+            yield
+        finally:
+            watchdog_task.cancel()
+            await client.aclose()
+
+    app = FastAPI(lifespan=lifespan)
+
+    def owner(world_id: str) -> int:
+        if not is_valid_world_id(world_id):
+            raise HTTPException(400, f"Invalid world id: {world_id}")
+        return shard_for(world_id, supervisor.count)
+
+    @app.get("/worlds/{world_id}/shard")
+    async def world_shard(world_id: str):
+        """Where a world lives, for clients that connect to shards directly"""
+        index = owner(world_id)
+        return {
+            "world_id": world_id,
+            "shard": index,
+            "url": supervisor.url(index),
+            "ws_url": f"{supervisor.url(index, 'ws')}/ws/{world_id}",
+        }
+
+    @app.websocket("/ws")
+    async def relay_default(websocket: WebSocket):
+        await relay(websocket, websocket.query_params.get("world", DEFAULT_WORLD))
+
+    @app.websocket("/ws/{world_id}")
+    async def relay_world(websocket: WebSocket, world_id: str):
+        await relay(websocket, world_id)
+
+    async def relay(websocket: WebSocket, world_id: str):
+        """Pipe frames between the client and the owning shard until either closes"""
+        if not is_valid_world_id(world_id):
+            await websocket.close(code=1008)
+            return
+        index = shard_for(world_id, supervisor.count)
+        url = f"{supervisor.url(index, 'ws')}/ws/{world_id}"
+        if websocket.url.query:
+            url = f"{url}?{websocket.url.query}"
+        try:
+            upstream = await websockets.connect(url, max_size=None, compression=None)
+        except (OSError, websockets.WebSocketException) as e:
+            logger.error(f"Shard {index} unavailable for world {world_id}: {e}")
+            await websocket.close(code=1013)  # Try again later
+            return
+
+        await websocket.accept()
+
+        async def client_to_shard():
+            while True:
+                message = await websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    return
+                data = message.get("text")
+                await upstream.send(data if data is not None else message["bytes"])
+
+        async def shard_to_client():
+            async for data in upstream:
+                if isinstance(data, bytes):
+                    await websocket.send_bytes(data)
+                else:
+                    await websocket.send_text(data)
+
+        tasks = [
+            asyncio.create_task(client_to_shard()),
+            asyncio.create_task(shard_to_client()),
+        ]
+        try:
+            await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await upstream.close()
+            try:
+                await websocket.close()
+            except Exception:
+                pass  # Client already gone
+
+    @app.api_route(
+        "/{path:path}", methods=["GET", "POST", "PUT", "PATCH", "DELETE"]
+    )
+    async def forward(path: str, request: Request):
+        """Forward HTTP calls to the shard owning the `world` query parameter
+
+        /worlds/{world_id} paths go to that world's shard; a bare /worlds
+        listing only covers the default world's shard."""
+        world_id = request.query_params.get("world", DEFAULT_WORLD)
+        parts = path.split("/")
+        if len(parts) > 1 and parts[0] == "worlds":
+            world_id = parts[1]
+        index = owner(world_id)
+        headers = {
+            name: value
+            for name, value in request.headers.items()
+            if name.lower() not in _HOP_HEADERS
+        }
+        try:
+            response = await client.request(
+                request.method,
+                f"{supervisor.url(index)}/{path}",
+                params=request.query_params,
+                headers=headers,
+                content=await request.body(),
+            )
+        except httpx.TransportError as e:
+            raise HTTPException(503, f"Shard {index} unavailable: {e}")
+        return Response(
+            content=response.content,
+            status_code=response.status_code,
+            headers={
+                name: value
+                for name, value in response.headers.items()
+                # httpx has already decoded the body
+                if name.lower() not in _HOP_HEADERS and name.lower() != "content-encoding"
+            },
+        )
+
+    return app
+
+
+def run_sharded(config) -> None:
+    """Start the shard processes, then serve the router until interrupted"""
+    supervisor = ShardSupervisor(
+        config.shard_count, config.shard_host, config.shard_base_port
+    )
+    supervisor.start()
+    try:
+        uvicorn.run(
+            create_router_app(supervisor),
+            host=config.host,
+            port=config.port,
+            log_config=None,
+        )
+    finally:
+        supervisor.stop()
@@ -0,0 +1,293 @@
+"""Pre-encoded environment state for HTTP pollers
+
+Serializing a 100k-location world takes longer than a WebSocket message
+should ever wait, so GET /state serves bytes built ahead of time. The
+cache keeps the JSON fragment of every area, location and agent, grouped
+in fixed-size blocks that are joined once, and uses the controller's
+change log (see change_log.py) as its dirty tracking: a refresh
+re-encodes only the keys changed since the cached version and re-joins
+only the blocks they fall in. Published bodies are never modified, only
+replaced, so a response being written is never affected by later changes.
+
+Refreshes happen on request, at most once per `min_interval` seconds; in
+between, readers get the last body, which is at most that old. Encoding
+and joining yield to the event loop every `chunk_size` fragments, then
+whatever changed meanwhile is caught up without yielding, so the published
+body matches exactly one state version.
+"""
+
+import asyncio
+import sys
+import time
+from typing import Dict, List, Optional, Tuple
+
+from night_salon.utils.metrics import REGISTRY
+
+REFRESHES = REGISTRY.counter(
+    "night_salon_state_cache_refreshes_total",
+    "State cache rebuilds by kind",
+    labels=("kind",),
+)
+
+BLOCK_SIZE = 1024  # Fragments joined together; a change re-joins its whole block
+JOIN_BLOCKS = 8  # Blocks re-joined between yields to the event loop
+
+
+async def _cooperatively(steps) -> None:
+    """Run a generator, handing the event loop back at each of its yields"""
+    for _ in steps:
+        await asyncio.sleep(0)
+
+
+def _at_once(steps) -> None:
+    for _ in steps:
+        pass
+
+
+class _FragmentBlocks:
+    """Encoded `"key":value` fragments in insertion order, joined per block
+
+    Removed keys leave an empty slot, so positions never shift and key
+    order matches the source dict, which also only appends."""
+
+    def __init__(self):
+        self._positions: Dict[str, int] = {}
+        self._fragments: List[bytes] = []
+        self._blocks: List[bytes] = []
+        self._dirty = set()  # Block indexes to re-join
+
+    def __len__(self):
+        return len(self._positions)
+
+    def set(self, key: str, fragment: bytes) -> None:
+        position = self._positions.get(key)
+        if position is None:
+            position = self._positions[key] = len(self._fragments)
+            self._fragments.append(fragment)
+        else:
+            self._fragments[position] = fragment
+        self._dirty.add(position // BLOCK_SIZE)
+
+    def remove(self, key: str) -> None:
+        position = self._positions.pop(key, None)
+        if position is not None:
+            self._fragments[position] = b""
+            self._dirty.add(position // BLOCK_SIZE)
+
+    def join(self, limit: Optional[int] = None) -> int:
+        """Re-join up to `limit` dirty blocks; returns how many are left"""
+        missing = len(self._fragments) // BLOCK_SIZE + 1 - len(self._blocks)
+        self._blocks.extend([b""] * max(0, missing))
+        while self._dirty and limit != 0:
+            block = self._dirty.pop()
+            start = block * BLOCK_SIZE
+            self._blocks[block] = b",".join(
+                filter(None, self._fragments[start : start + BLOCK_SIZE])
+            )
+            if limit is not None:
+                limit -= 1
+        return len(self._dirty)
+
+    def parts(self) -> List[bytes]:
+        """Joined blocks separated by commas, ready to concatenate"""
+        parts = []
+        for block in self._blocks:
+            if block:
+                if parts:
+                    parts.append(b",")
+                parts.append(block)
+        return parts
+
+    def memory_usage(self) -> int:
+        return (
+            sys.getsizeof(self._positions)
+            + sys.getsizeof(self._fragments)
+            + sum(map(sys.getsizeof, self._fragments))
+            + sum(map(sys.getsizeof, self._blocks))
+        )
+
+
+class StateCache:
+    """Latest encoded state of one EnvironmentController, with its ETag"""
+
+    def __init__(self, env_controller, codec, min_interval: float = 1.0, chunk_size: int = 500):
+        self.env_controller = env_controller
+        self.codec = codec
+        self.min_interval = min_interval
+        self.chunk_size = chunk_size  # Fragments encoded between yields to the loop
+        self.etag: Optional[str] = None
+        self._parts: Optional[List[bytes]] = None  # Published body, joined on first read
+        self._body: Optional[bytes] = None
+        self._epoch: Optional[str] = None
+        self._version = -1
+        self._refreshed = 0.0  # time.monotonic() of the last refresh
+        self._task: Optional[asyncio.Task] = None
+        self._areas: Dict[str, bytes] = {}  # area_key -> b'"name":...,"valid":...'
+        self._locations: Dict[str, _FragmentBlocks] = {}  # Per area, by location_id
+        self._agents = _FragmentBlocks()
+        self._extras = b""
+
+    @property
+    def stale(self) -> bool:
+        changes = self.env_controller.changes
+        return (changes.epoch, changes.version) != (self._epoch, self._version)
+
+    async def get(self) -> Tuple[str, bytes]:
+        """(etag, body), refreshed first if stale and the rate limit allows"""
+        if self.stale and (
+            self._parts is None or time.monotonic() - self._refreshed >= self.min_interval
+        ):
+            if self._task is None:
+                self._task = asyncio.get_running_loop().create_task(self._refresh())
+            # Shielded so a disconnecting reader does not cancel it for the others
+            await asyncio.shield(self._task)
+        if self._body is None:
+            self._body = b"".join(self._parts)
+        return self.etag, self._body
+
+    def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def memory_usage(self) -> int:
+        """Approximate bytes held by fragments, joined blocks and the body"""
+        return (
+            sum(blocks.memory_usage() for blocks in self._locations.values())
+            + self._agents.memory_usage()
+            + len(self._body or b"")
+        )
+
+    async def _refresh(self) -> None:
+        try:
+            kind = "incremental"
+            while True:
+                changes = self.env_controller.changes
+                epoch, version = changes.epoch, changes.version
+                if self._epoch == epoch and changes.covers(self._version):
+                    changed = list(dict.fromkeys(changes.since(self._version)))
+                    await _cooperatively(self._apply(changed, self.chunk_size))
+                else:
+                    kind = "full"
+                    self._areas, self._locations = {}, {}
+                    self._agents = _FragmentBlocks()
+                    await _cooperatively(self._apply(self._everything(), self.chunk_size))
+                await _cooperatively(self._join(JOIN_BLOCKS))
+
+                # Catch up without yielding on what changed meanwhile
+                changes = self.env_controller.changes
+                if changes.epoch == epoch and changes.covers(version):
+                    _at_once(self._apply(set(changes.since(version))))
+                    _at_once(self._join())
+                    self._publish()
+                    REFRESHES.labels(kind).inc()
+                    return
+                self._epoch = None  # Log truncated while yielding; start over
+        finally:
+            self._task = None
+
+    def _everything(self):
+        """(kind, key) of every part of the state, for a full build"""
+        env_controller = self.env_controller
+        yield "extras", None
+        # Key lists, since the live dicts may grow while the build yields
+        for area_key, area_data in list(env_controller.environment.areas.items()):
+            yield "area", area_key
+            for location_id in list(area_data.locations):
+                yield "location", (area_key, location_id)
+        for agent_id in list(env_controller.agents):
+            yield "agent", agent_id
+
+    def _apply(self, changed, chunk_size: Optional[int] = None):
+        """Re-encode the fragments of changed (kind, key) pairs
+
+        A generator that yields every `chunk_size` pairs when one is given."""
+        env_controller = self.env_controller
+        areas = env_controller.environment.areas
+        for count, (kind, key) in enumerate(changed, 1):
+            if chunk_size and count % chunk_size == 0:
+                yield
+            if kind == "location":
+                area_key, location_id = key
+                area_data = areas.get(area_key)
+                location = area_data.locations.get(location_id) if area_data else None
+                blocks = self._locations.setdefault(area_key, _FragmentBlocks())
+                if location is None:
+                    blocks.remove(location_id)
+                else:
+                    blocks.set(location_id, self._location_fragment(location_id, location))
+            elif kind == "agent":
+                agent = env_controller.agents.get(key)
+                if agent is None:
+                    self._agents.remove(key)
+                else:
+                    self._agents.set(key, self._agent_fragment(key, agent))
+            elif kind == "area":
+                area_data = areas.get(key)
+                if area_data is None:
+                    self._areas.pop(key, None)
+                    self._locations.pop(key, None)
+                else:
+                    self._areas[key] = self._area_fragment(area_data)
+            else:
+                environment = env_controller.environment
+                self._extras = b',"cameras":%s,"items":%s' % (
+                    self.codec.dumps(environment.cameras),
+                    self.codec.dumps(environment.items),
+                )
+
+    def _join(self, limit: Optional[int] = None):
+        """Re-join dirty blocks; a generator yielding every `limit` blocks"""
+        for blocks in [self._agents, *self._locations.values()]:
+            while blocks.join(limit):
+                yield
+
+    def _publish(self) -> None:
+        """Assemble the body from joined blocks; shaped like /state/changes when full"""
+        env_controller = self.env_controller
+        changes = env_controller.changes
+        self._epoch, self._version = changes.epoch, changes.version
+        dumps = self.codec.dumps
+        parts = [b'{"epoch":%s,"version":%d,"full":true,"state":{"areas":{' % (
+            dumps(self._epoch),
+            self._version,
+        )]
+        first = True
+        for area_key, area_data in env_controller.environment.areas.items():
+            if area_key not in self._areas:
+                continue
+            parts.append(
+                b'%s%s:{%s,"agents":%s,"locations":{'
+                % (
+                    b"" if first else b",",
+                    dumps(area_key),
+                    self._areas[area_key],
+                    dumps(list(area_data.agents)),
+                )
+            )
+            blocks = self._locations.get(area_key)
+            if blocks is not None:
+                parts.extend(blocks.parts())
+            parts.append(b"}}")
+            first = False
+        parts.append(b'},"agents":{')
+        parts.extend(self._agents.parts())
+        parts.append(b"}%s}}" % self._extras)
+        self._parts, self._body = parts, None
+        self.etag = f'"{self._epoch}-{self._version}"'
+        self._refreshed = time.monotonic()
+
+    def _area_fragment(self, area_data) -> bytes:
+        return self.codec.dumps(self.env_controller.area_state(area_data))[1:-1]
+
+    def _location_fragment(self, location_id, location) -> bytes:
+        return b"%s:%s" % (
+            self.codec.dumps(location_id),
+            self.codec.dumps(self.env_controller.location_state(location)),
+        )
+
+    def _agent_fragment(self, agent_id, agent) -> bytes:
+        return b"%s:%s" % (
+            self.codec.dumps(agent_id),
+            self.codec.dumps(agent.snapshot_state()),
+        )
@@ -0,0 +1,129 @@
+import asyncio
+import struct
+from typing import Optional
+
+from night_salon.utils.logger import logger
+
+# 4-byte little-endian length prefix, matching the Unity client's BitConverter framing
+LENGTH_PREFIX = struct.Struct("<I")
+
+
+class TcpConnection:
+    """Connection interface over a length-prefixed asyncio stream
+
+    Each frame is a 4-byte little-endian length followed by the payload. Text
+    is sent as UTF-8; both kinds of payload are framed identically. Writes
+    hand the prefix and payload to the transport with `writelines` (no
+    concatenation copy) and only wait for a drain once the transport buffer
+    passes `drain_threshold` bytes.
+    """
+
+    def __init__(
+        self,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+        drain_threshold: int = 256 * 1024,
+    ):
+        self.reader = reader
+        self.writer = writer
+        self.drain_threshold = drain_threshold
+        self.peer = writer.get_extra_info("peername")
+
+    async def accept(self) -> None:
+        """Nothing to negotiate; the stream is usable as soon as it is open"""
+
+    async def send_text(self, data: str) -> None:
+        await self.send_bytes(data.encode("utf-8"))
+
+    async def send_bytes(self, data: bytes) -> None:
+        if self.writer.is_closing():
+            raise ConnectionResetError("TCP connection is closed")
+        self.writer.writelines((LENGTH_PREFIX.pack(len(data)), data))
+        if self.writer.transport.get_write_buffer_size() > self.drain_threshold:
+            await self.writer.drain()
+
+    async def close(self, code: int = 1000) -> None:
+        if not self.writer.is_closing():
+            self.writer.close()
+        try:
+            await self.writer.wait_closed()
+        except (ConnectionError, OSError):
+            pass
+
+
+class TcpTransport:
+    """Native asyncio TCP server that feeds frames into a WebSocketManager
+
+    Lets local Unity instances skip ASGI and WebSocket masking overhead while
+    sharing the manager's event routing and environment state with `/ws`.
+    """
+
+    def __init__(
+        self,
+        websocket_manager,
+        host: str,
+        port: int,
+        read_size: int = 64 * 1024,
+        max_frame_size: int = 16 * 1024 * 1024,
+    ):
+        self.websocket_manager = websocket_manager
+        self.host = host
+        self.port = port
+        self.read_size = read_size
+        self.max_frame_size = max_frame_size
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(
+            self._handle_client, self.host, self.port
+        )
+        logger.info(f"TCP transport listening on {self.host}:{self.port}")
+
+    async def close(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _handle_client(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        connection = TcpConnection(reader, writer)
+        await self.websocket_manager.connect(connection)
+        logger.info(f"TCP client connected from {connection.peer}")
+        try:
+            await self._read_frames(connection)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            logger.info("TCP client connection lost")
+        except Exception as e:
+            logger.error(f"TCP connection error: {str(e)}", exc_info=True)
+        finally:
+            self.websocket_manager.disconnect(connection)
+            await connection.close()
+
+    async def _read_frames(self, connection: TcpConnection) -> None:
+        """Read in large chunks and slice complete frames out with memoryviews"""
+        buffer = bytearray()
+        while self.websocket_manager.is_connected(connection):
+            chunk = await connection.reader.read(self.read_size)
+            if not chunk:
+                return
+            buffer += chunk
+
+            offset = 0
+            with memoryview(buffer) as view:
+                while len(view) - offset >= LENGTH_PREFIX.size:
+                    (length,) = LENGTH_PREFIX.unpack_from(view, offset)
+                    if length > self.max_frame_size:
+                        raise ConnectionError(f"Frame of {length} bytes exceeds limit")
+                    start = offset + LENGTH_PREFIX.size
+                    end = start + length
+                    if end > len(view):
+                        break
+                    with view[start:end] as payload:
+                        await self.websocket_manager.process_message(
+                            connection, payload
+                        )
+                    offset = end
+            # Drop consumed frames; any partial frame stays for the next read
+            del buffer[:offset]
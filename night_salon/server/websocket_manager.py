@@ -1,64 +1,155 @@
-from fastapi import WebSocket, WebSocketDisconnect
 from night_salon.controllers.environment import EnvironmentController
+from night_salon.server.binary_protocol import (
+    PROTOCOL_NAME as BINARY_PROTOCOL,
+    BinaryProtocol,
+    ProtocolError,
+    WireIdTable,
+)
+from night_salon.server.codec import FrameEncoder, get_codec
+from night_salon.server.connection import Connection, Frame
 from night_salon.server.event_handler import EventHandler
+from night_salon.server.outbound import OutboundQueue
+from night_salon.server.scheduler import CommandScheduler
 from night_salon.utils.logger import logger
-import json
+from night_salon.utils.metrics import REGISTRY
 import asyncio
-import random
-from typing import Set, Dict, Any, Optional, List, Union
+import json
+import logging
+import time
+from typing import Set, Dict, Any, Optional, List, Tuple, Union
+
+MESSAGE_DURATION = REGISTRY.histogram(
+    "night_salon_message_duration_seconds",
+    "Time to decode, handle and queue replies for one incoming message",
+    labels=("message_type",),
+)
+# Label values are limited to these so clients can't create unbounded series
+_MESSAGE_TYPES = frozenset(
+    ("setup", "location_reached", "proximity_event", "batch", "invalid")
+)
 
 
 class WebSocketManager:
     """Manages WebSocket connections and event handling"""
 
-    def __init__(self, env_controller: EnvironmentController):
+    def __init__(
+        self,
+        env_controller: EnvironmentController,
+        codec=None,
+        binary_frames: bool = False,
+        command_delay: Tuple[float, float] = (0.5, 1.5),
+        outbound_queue_size: int = 1024,
+        broadcast_deadline: float = 0.5,
+        broadcast_max_misses: int = 3,
+    ):
         self.env_controller = env_controller
-        self.connected_clients: Set[WebSocket] = set()
+        # Sends move commands after a jittered delay without blocking message intake
+        self.scheduler = CommandScheduler(self._dispatch_commands, *command_delay)
+        self.codec = codec or get_codec()
+        # Pre-encodes acks and move commands; binary_frames sends bytes frames
+        self.encoder = FrameEncoder(self.codec, binary_frames)
+        # Small-integer ids for the binary protocol, shared by all binary clients
+        self.wire_ids = WireIdTable()
+        self.binary_protocol = BinaryProtocol(self.wire_ids)
+        self.connected_clients: Set[Connection] = set()
         self._active_connections = {}  # Track connection status
+        self._binary_clients: Set[int] = set()  # ids of binary protocol clients
+        # Per-connection send queues, each drained by its own writer task
+        self.outbound_queue_size = outbound_queue_size
+        self._outbound: Dict[int, OutboundQueue] = {}
+        # Clients missing this many broadcast deadlines in a row are evicted
+        self.broadcast_deadline = broadcast_deadline
+        self.broadcast_max_misses = broadcast_max_misses
+        self._missed_deadlines: Dict[int, Tuple[int, float]] = {}  # (count, last miss)
+
+    async def connect(
+        self, websocket: Connection, protocol: Optional[str] = None, batch: bool = False
+    ) -> None:
+        """Handle new client connection, negotiating the wire protocol
 
-    async def connect(self, websocket: WebSocket) -> None:
-        """Handle new client connection"""
+        `batch` marks clients that accept batch frames, letting the writer
+        coalesce queued commands into one frame."""
         try:
             await websocket.accept()
             self.connected_clients.add(websocket)
             self._active_connections[id(websocket)] = True
-            logger.info("New client connected")
+            if protocol == BINARY_PROTOCOL:
+                self._binary_clients.add(id(websocket))
+            self._outbound[id(websocket)] = OutboundQueue(
+                websocket,
+                encode=lambda message: self._encode_for(websocket, message),
+                on_error=self.disconnect,
+                on_dropped=self._release_dropped_command,
+                supports_batch=batch,
+                max_size=self.outbound_queue_size,
+                encoding=BINARY_PROTOCOL if protocol == BINARY_PROTOCOL else "json",
+            )
+            logger.info(f"New client connected ({protocol or 'json'} protocol)")
         except Exception as e:
             logger.error(f"Error accepting WebSocket connection: {str(e)}")
             # Don't add to connected_clients if accept fails
 
-    def disconnect(self, websocket: WebSocket) -> None:
+    def disconnect(self, websocket: Connection) -> None:
         """Handle client disconnection"""
         if websocket in self.connected_clients:
             self.connected_clients.remove(websocket)
 
         if id(websocket) in self._active_connections:
             self._active_connections.pop(id(websocket))
+        self._binary_clients.discard(id(websocket))
+        self._missed_deadlines.pop(id(websocket), None)
+        # Moves that will never be sent must give their reservations back
+        for command in self.scheduler.cancel(websocket):
+            self._release_dropped_command(command)
+        outbound = self._outbound.pop(id(websocket), None)
+        if outbound is not None:
+            outbound.close()  # Releases through on_dropped
 
         logger.info("Client disconnected")
 
-    def is_connected(self, websocket: WebSocket) -> bool:
+    def is_connected(self, websocket: Connection) -> bool:
         """Check if the websocket is still connected"""
         return (
             id(websocket) in self._active_connections
             and websocket in self.connected_clients
         )
 
-    async def process_message(self, websocket: WebSocket, data: str) -> None:
+    def is_binary(self, websocket: Connection) -> bool:
+        """Whether the client negotiated the binary protocol"""
+        return id(websocket) in self._binary_clients
+
+    async def process_message(self, websocket: Connection, data: Frame) -> None:
         """Process an incoming message from the client"""
+        started = time.perf_counter()
+        event_type = "invalid"
         try:
-            event = json.loads(data)
+            if isinstance(data, bytes) and self.is_binary(websocket):
+                # Binary clients send records in binary frames, JSON in text frames
+                events = self.binary_protocol.decode_frame(data)
+                if len(events) == 1:
+                    event = events[0]
+                else:
+                    event = {"messageType": "batch", "events": events}
+            else:
+                event = self.codec.loads(data)
             event_type = event.get("messageType")
-            event_data = {k: v for k, v in event.items() if k != "messageType"}
-            logger.debug(f"Received event: {event_type}")
+            logger.debug("Received event: %s", event_type)
 
+            # Handlers get the message itself; its messageType tags the event model
             if event_type == "setup":
-                await self._handle_setup_event(websocket, event_data)
+                await self._handle_setup_event(websocket, event)
             elif event_type == "location_reached":
-                await self._handle_location_reached_event(websocket, event_data)
+                await self._handle_location_reached_event(websocket, event)
+            elif event_type == "batch":
+                await self._handle_batch_event(websocket, event)
             else:
-                await self._handle_generic_event(websocket, event_type, event_data)
+                await self._handle_generic_event(websocket, event_type, event)
 
+        except ProtocolError as e:
+            logger.warning(f"Invalid binary frame received: {str(e)}")
+            await self._send_response(
+                websocket, {"status": "error", "message": f"Invalid binary frame: {e}"}
+            )
         except json.JSONDecodeError:
             logger.warning("Invalid JSON received")
             await self._send_response(
@@ -67,30 +158,38 @@ class WebSocketManager:
         except Exception as e:
             logger.error(f"Error processing event: {str(e)}", exc_info=True)
             await self._send_response(websocket, {"status": "error", "message": str(e)})
+        finally:
+            # Clients control messageType, which need not be a (hashable) str
+            if isinstance(event_type, str) and event_type in _MESSAGE_TYPES:
+                label = event_type
+            else:
+                label = "other"
+            MESSAGE_DURATION.labels(label).observe(time.perf_counter() - started)
 
     async def _handle_setup_event(
-        self, websocket: WebSocket, event_data: Dict[str, Any]
+        self, websocket: Connection, event_data: Dict[str, Any]
     ) -> None:
         """Handle setup event and send initial move commands"""
         move_commands = await EventHandler.handle_event(
             "setup", event_data, self.env_controller
         )
+        self._register_wire_ids(event_data)
 
-        # First send success response
-        await self._send_response(websocket, {"status": "success"})
+        # First send success response; binary clients also get their id tables
+        if self.is_binary(websocket):
+            response = {"status": "success", "protocol": BINARY_PROTOCOL}
+            response.update(self.wire_ids.to_dict())
+            await self._send_response(websocket, response)
+        else:
+            await self._send_response(websocket, self.encoder.ack)
 
-        # Then send move commands with delay
-        logger.info(f"Sending {len(move_commands)} initial move commands to client")
+        # Then schedule move commands, each with its own jittered delay
+        logger.info(f"Scheduling {len(move_commands)} initial move commands for client")
         for command in move_commands:
-            if not await self._send_delayed_command(
-                websocket,
-                command,
-                f"agent {command['agent_id']} to {command['location_name']}",
-            ):
-                break
+            self._schedule_command(websocket, command)
 
     async def _handle_location_reached_event(
-        self, websocket: WebSocket, event_data: Dict[str, Any]
+        self, websocket: Connection, event_data: Dict[str, Any]
     ) -> None:
         """Handle location_reached event and send next move command"""
         next_move_command = await EventHandler.handle_event(
@@ -98,80 +197,262 @@ class WebSocketManager:
         )
 
         # Send success response
-        await self._send_response(websocket, {"status": "success"})
+        await self._send_response(websocket, self._ack(websocket))
 
         # Send next move command if one was generated
         if next_move_command and websocket in self.connected_clients:
-            await self._send_delayed_command(
-                websocket,
-                next_move_command,
-                f"agent {next_move_command['agent_id']} to {next_move_command['location_name']}",
+            self._schedule_command(websocket, next_move_command)
+
+    async def _handle_batch_event(
+        self, websocket: Connection, event_data: Dict[str, Any]
+    ) -> None:
+        """Handle a batch of events with one combined ack and one command frame"""
+        events = event_data.get("events", [])
+        move_commands, errors = await EventHandler.handle_batch(
+            events, self.env_controller
+        )
+
+        # One ack for the whole batch
+        await self._send_response(
+            websocket,
+            {
+                "status": "success" if not errors else "partial_success",
+                "processed": len(events) - len(errors),
+                "errors": errors,
+            },
+        )
+
+        # Then all resulting move commands in a single batch frame
+        if move_commands and websocket in self.connected_clients:
+            self._schedule_command(
+                websocket, {"messageType": "batch", "events": move_commands}
             )
 
     async def _handle_generic_event(
-        self, websocket: WebSocket, event_type: str, event_data: Dict[str, Any]
+        self, websocket: Connection, event_type: str, event_data: Dict[str, Any]
     ) -> None:
         """Handle other event types"""
         await EventHandler.handle_event(event_type, event_data, self.env_controller)
-        await self._send_response(websocket, {"status": "success"})
+        await self._send_response(websocket, self._ack(websocket))
+
+    def _register_wire_ids(self, event_data: Dict[str, Any]) -> None:
+        """Assign binary protocol ids to every agent and location in a setup"""
+        for agent_id in event_data.get("agent_ids", []):
+            self.wire_ids.register_agent(agent_id)
+        for area in event_data.get("areas", []):
+            for location_name in area.get("locations", []):
+                self.wire_ids.register_location(location_name)
+
+    def _ack(self, websocket: Connection) -> Frame:
+        """Pre-encoded success ack in the client's protocol"""
+        if self.is_binary(websocket):
+            return self.binary_protocol.ack
+        return self.encoder.ack
+
+    def _encode_for(self, websocket: Connection, message: Dict[str, Any]) -> Frame:
+        """Encode a message in the client's protocol, falling back to JSON"""
+        if self.is_binary(websocket):
+            frame = self.binary_protocol.encode_message(message)
+            if frame is not None:
+                return frame
+        return self.encoder.encode(message)
+
+    def _enqueue(
+        self,
+        websocket: Connection,
+        message,
+        waiter: Optional[asyncio.Future] = None,
+        frames: Optional[Dict[str, Frame]] = None,
+    ) -> bool:
+        """Hand a message or pre-encoded frame to the client's writer task"""
+        outbound = self._outbound.get(id(websocket))
+        if outbound is None or not self.is_connected(websocket):
+            return False
+        if not outbound.put(message, waiter, frames):
+            logger.warning(
+                f"Outbound queue full ({outbound.depth} queued), dropped message"
+            )
+            return False
+        return True
+
+    async def flush(self, websocket: Connection, timeout: float = 1.0) -> bool:
+        """Wait for a client's queued messages to be written"""
+        outbound = self._outbound.get(id(websocket))
+        return outbound is None or await outbound.flush(timeout)
+
+    def queue_stats(self) -> List[Dict[str, Any]]:
+        """Outbound queue depth and counters for every connected client"""
+        return [
+            {"client": client_id, **outbound.stats()}
+            for client_id, outbound in self._outbound.items()
+        ]
+
+    def _release_dropped_command(self, command: Dict[str, Any]) -> None:
+        """Release reservations held by move commands that will never be sent"""
+        if command.get("messageType") == "batch":
+            events = command.get("events", [])
+        else:
+            events = [command]
+        for event in events:
+            agent = self.env_controller.agents.get(event.get("agent_id"))
+            location_id = event.get("location_name")
+            area = self.env_controller.get_area_for_location(location_id)
+            if agent and area:
+                self.env_controller.release_planned_location(agent, area, location_id)
 
     async def _send_response(
-        self, websocket: WebSocket, response: Dict[str, Any]
+        self, websocket: Connection, response: Union[Dict[str, Any], Frame]
     ) -> bool:
-        """Send a response to the client, return True if successful"""
-        try:
-            if self.is_connected(websocket):
-                await websocket.send_json(response)
-                return True
-            else:
-                logger.warning("Attempted to send response to disconnected client")
-        except WebSocketDisconnect:
-            logger.info("Client disconnected during response")
-            self.disconnect(websocket)
-        except Exception as e:
-            logger.error(f"Error sending response: {str(e)}")
-            self.disconnect(websocket)
+        """Queue a response to the client, return True if it was accepted"""
+        if self.is_connected(websocket):
+            return self._enqueue(websocket, response)
+        logger.warning("Attempted to send response to disconnected client")
         return False
 
-    async def _send_delayed_command(
-        self, websocket: WebSocket, command: Dict[str, Any], log_message: str
-    ) -> bool:
-        """Send a command with a random delay, return True if successful"""
-        try:
-            await asyncio.sleep(random.uniform(0.5, 1.5))  # Small delay
+    def _schedule_command(self, websocket: Connection, command: Dict[str, Any]) -> None:
+        """Queue a command to be sent after the scheduler's jittered delay"""
+        self.scheduler.schedule(websocket, command)
 
-            # Check if client is still connected after delay
-            if self.is_connected(websocket):
-                await websocket.send_json(command)
-                logger.info(f"Sent move command for {log_message}")
-                return True
-            else:
-                logger.info("Client disconnected during delay, not sending command")
-        except WebSocketDisconnect:
-            logger.info(f"Client disconnected before sending command")
-            self.disconnect(websocket)
-        except Exception as e:
-            logger.error(f"Error sending command: {str(e)}")
-            self.disconnect(websocket)
-        return False
+    async def _dispatch_commands(
+        self, websocket: Connection, commands: List[Dict[str, Any]]
+    ) -> None:
+        """Queue the commands that came due for one client, in order"""
+        if not self.is_connected(websocket):
+            logger.info("Client disconnected during delay, not sending commands")
+            return
+        log_commands = logger.isEnabledFor(logging.INFO)
+        for command in commands:
+            if self._enqueue(websocket, command) and log_commands:
+                logger.info("Queued move command for %s", self._describe_command(command))
 
-    async def broadcast_command(self, command: Dict[str, Any]) -> Dict[str, Any]:
-        """Send a command to all connected clients"""
-        failed_clients = []
-        successful_sends = 0
+    @staticmethod
+    def _describe_command(command: Dict[str, Any]) -> str:
+        if command.get("messageType") == "batch":
+            return f"{len(command.get('events', []))} batched move commands"
+        return f"agent {command.get('agent_id')} to {command.get('location_name')}"
+
+    async def broadcast_command(
+        self, command: Dict[str, Any], deadline: Optional[float] = None
+    ) -> Dict[str, Any]:
+        """Send a command to all connected clients, waiting at most `deadline`
 
+        The command dict is queued for every client, so queued moves for the
+        same agent are replaced and dropped moves release their reservations;
+        it is encoded at most once per wire protocol, when first written. Clients
+        whose write has not completed by the deadline keep the frame queued
+        but count a miss; after `broadcast_max_misses` consecutive misses
+        they are evicted."""
+        return await self._broadcast(command, deadline)
+
+    async def broadcast_commands(
+        self, commands: List[Dict[str, Any]], deadline: Optional[float] = None
+    ) -> Dict[str, Any]:
+        """Send many commands to all connected clients as one batch frame each"""
+        if len(commands) == 1:
+            return await self._broadcast(commands[0], deadline)
+        result = await self._broadcast(
+            {"messageType": "batch", "events": commands}, deadline
+        )
+        # The commands are returned by the caller; don't echo the whole batch back
+        result["command"] = self._describe_command(result["command"])
+        return result
+
+    async def _broadcast(
+        self, command: Dict[str, Any], deadline: Optional[float]
+    ) -> Dict[str, Any]:
+        deadline = self.broadcast_deadline if deadline is None else deadline
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+
+        frames: Dict[str, Frame] = {}  # Filled by the writers, one per encoding
+        waiters: Dict[Connection, asyncio.Future] = {}
+        failed_clients = []
         for client in list(self.connected_clients):
-            try:
-                await client.send_json(command)
-                successful_sends += 1
-            except Exception as e:
-                logger.error(f"Error sending command to client: {str(e)}")
+            waiter = loop.create_future()
+            if self._enqueue(client, command, waiter, frames):
+                waiters[client] = waiter
+            else:
                 failed_clients.append(client)
-                self.disconnect(client)
 
+        if waiters:
+            await asyncio.wait(list(waiters.values()), timeout=deadline)
+
+        clients = []
+        latencies = []
+        timed_out = 0
+        evicted = 0
+        for client, waiter in waiters.items():
+            if not waiter.done():
+                waiter.cancel()
+                timed_out += 1
+                status = "timeout"
+                if self._record_missed_deadline(client, started):
+                    evicted += 1
+                    status = "evicted"
+                clients.append({"client": id(client), "status": status})
+            elif waiter.result() is None:
+                failed_clients.append(client)
+                clients.append({"client": id(client), "status": "dropped"})
+            else:
+                latency = waiter.result() - started
+                latencies.append(latency)
+                self._missed_deadlines.pop(id(client), None)
+                clients.append(
+                    {
+                        "client": id(client),
+                        "status": "sent",
+                        "latency_ms": round(latency * 1000, 3),
+                    }
+                )
+
+        successful_sends = len(latencies)
         return {
             "status": "success" if successful_sends > 0 else "failure",
             "command": command,
             "sent_to": successful_sends,
             "failed": len(failed_clients),
+            "timed_out": timed_out,
+            "evicted": evicted,
+            "latency_ms": self._latency_summary(latencies),
+            "clients": clients,
+        }
+
+    def _record_missed_deadline(self, websocket: Connection, started: float) -> bool:
+        """Count a missed broadcast deadline, evicting the client past the limit
+
+        Broadcasts that were already in flight when the previous miss was
+        recorded (e.g. fanned out together) count as a single miss."""
+        count, last_miss = self._missed_deadlines.get(id(websocket), (0, float("-inf")))
+        if started >= last_miss:
+            count += 1
+        now = asyncio.get_running_loop().time()
+        self._missed_deadlines[id(websocket)] = (count, now)
+        if count < self.broadcast_max_misses:
+            return False
+
+        logger.warning(
+            f"Evicting client after {count} consecutive missed broadcast deadlines"
+        )
+        self.disconnect(websocket)
+        asyncio.get_running_loop().create_task(self._close_evicted(websocket))
+        return True
+
+    @staticmethod
+    async def _close_evicted(websocket: Connection) -> None:
+        try:
+            await websocket.close(code=1013)
+        except Exception:
+            # The connection is usually already broken when it gets this slow
+            pass
+
+    @staticmethod
+    def _latency_summary(latencies: List[float]) -> Optional[Dict[str, float]]:
+        if not latencies:
+            return None
+        ordered = sorted(latencies)
+        return {
+            "min": round(ordered[0] * 1000, 3),
+            "p50": round(ordered[len(ordered) // 2] * 1000, 3),
+            "max": round(ordered[-1] * 1000, 3),
+            "mean": round(sum(ordered) / len(ordered) * 1000, 3),
         }
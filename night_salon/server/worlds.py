@@ -0,0 +1,482 @@
+"""Isolated simulation worlds, each with its own controller and connections"""
+
+import asyncio
+import os
+import re
+import time
+from typing import Dict, Iterator, Optional
+
+from night_salon.controllers import snapshot
+from night_salon.controllers.environment import EnvironmentController
+from night_salon.controllers.proximity import pairs_within
+from night_salon.server.codec import get_codec
+from night_salon.server.event_handler import EventHandler
+from night_salon.server.state_cache import StateCache
+from night_salon.server.websocket_manager import WebSocketManager
+from night_salon.utils.logger import logger
+from night_salon.utils.metrics import REGISTRY
+
+EVICTIONS = REGISTRY.counter(
+    "night_salon_world_evictions_total",
+    "Worlds evicted from this process by reason",
+    labels=("reason",),
+)
+SNAPSHOTS = REGISTRY.counter(
+    "night_salon_snapshots_total",
+    "World snapshots written, by outcome",
+    labels=("outcome",),
+)
+
+DEFAULT_WORLD = "default"
+# World ids appear in URLs and logs, so keep them short and unambiguous
+WORLD_ID_PATTERN = re.compile(r"^[A-Za-z0-9_.-]{1,64}$")
+
+
+def is_valid_world_id(world_id: str) -> bool:
+    return bool(WORLD_ID_PATTERN.match(world_id))
+
+
+class World:
+    """One Unity scene: environment, connected clients and proximity ticks"""
+
+    def __init__(self, world_id: str, config):
+        self.world_id = world_id
+        self.config = config
+        self.env_controller = self._new_controller()  # Empty until restore()
+        self.websocket_manager = WebSocketManager(
+            self.env_controller,
+            codec=get_codec(config.json_codec),
+            binary_frames=config.binary_frames,
+            command_delay=(config.command_delay_min, config.command_delay_max),
+            outbound_queue_size=config.outbound_queue_size,
+            broadcast_deadline=config.broadcast_deadline,
+            broadcast_max_misses=config.broadcast_max_misses,
+        )
+        # Encoded state for GET /state, refreshed at most every STATE_CACHE_INTERVAL
+        self.state_cache = StateCache(
+            self.env_controller,
+            get_codec(config.json_codec),
+            min_interval=config.state_cache_interval,
+        )
+        self._proximity_task: Optional[asyncio.Task] = None
+        self.created = time.time()
+        self.last_active = time.monotonic()  # Connects, messages and HTTP calls
+        self.memory: Dict[str, int] = {}  # Last memory_usage() estimate
+        self._saved_active = self.last_active  # As of the last save or restore
+
+    def _new_controller(self) -> EnvironmentController:
+        return EnvironmentController(
+            proximity_radius=self.config.proximity_radius,
+            assignment_mode=self.config.assignment_mode,
+            change_log_size=self.config.change_log_size,
+        )
+
+    async def restore(self) -> bool:
+        """Load the world's snapshot, if any, in a worker thread
+
+        Only for a world nobody has used yet: the restored controller
+        replaces the empty one. A bad snapshot leaves the world empty, and
+        Unity's next setup rebuilds it."""
+        path = self.snapshot_path
+        if path is None or not os.path.exists(path):
+            return False
+        try:
+            env_controller = await asyncio.get_running_loop().run_in_executor(
+                None, self._load_controller, path
+            )
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring snapshot for world {self.world_id}: {str(e)}")
+            return False
+        self.env_controller = env_controller
+        self.websocket_manager.env_controller = env_controller
+        self.state_cache.env_controller = env_controller
+        return True
+
+    def _load_controller(self, path: str) -> EnvironmentController:
+        env_controller = self._new_controller()
+        env_controller.restore_snapshot(path)
+        return env_controller
+
+    @property
+    def snapshot_path(self) -> Optional[str]:
+        if not self.config.snapshot_dir:
+            return None
+        return os.path.join(self.config.snapshot_dir, f"{self.world_id}.snap")
+
+    @property
+    def needs_save(self) -> bool:
+        return self.snapshot_path is not None and self._saved_active != self.last_active
+
+    async def save(self) -> bool:
+        """Snapshot the world if it changed; the state is copied on the loop
+        so it is consistent, then encoded and written in a worker thread"""
+        if not self.needs_save:
+            return False
+        active = self.last_active
+        try:
+            capture = snapshot.SnapshotCapture(self.env_controller)
+            await asyncio.get_running_loop().run_in_executor(
+                None, self._write_snapshot, capture, self.snapshot_path
+            )
+        except Exception as e:
+            SNAPSHOTS.labels("error").inc()
+            logger.error(f"Error saving world {self.world_id}: {str(e)}", exc_info=True)
+            return False
+        self._saved_active = active
+        SNAPSHOTS.labels("saved").inc()
+        return True
+
+    @staticmethod
+    def _write_snapshot(capture: snapshot.SnapshotCapture, path: str) -> None:
+        snapshot.write_snapshot(snapshot.encode_capture(capture), path)
+
+    def save_sync(self) -> bool:
+        """Blocking save, for signal handlers where the loop may not run again"""
+        if not self.needs_save:
+            return False
+        self.env_controller.save_snapshot(self.snapshot_path)
+        self._saved_active = self.last_active
+        SNAPSHOTS.labels("saved").inc()
+        return True
+
+    def delete_snapshot(self) -> None:
+        if self.snapshot_path:
+            try:
+                os.remove(self.snapshot_path)
+            except FileNotFoundError:
+                pass
+
+    def touch(self) -> None:
+        self.last_active = time.monotonic()
+
+    @property
+    def is_idle(self) -> bool:
+        """No connected clients; only idle worlds are ever evicted"""
+        return not self.websocket_manager.connected_clients
+
+    def measure_memory(self) -> int:
+        """Refresh the memory estimate and return its total in bytes"""
+        self.memory = self.env_controller.memory_usage()
+        self.memory["state_cache"] = self.state_cache.memory_usage()
+        return sum(self.memory.values())
+
+    def stats(self) -> Dict[str, object]:
+        env_controller = self.env_controller
+        return {
+            "world_id": self.world_id,
+            "created": self.created,
+            "idle_seconds": round(time.monotonic() - self.last_active, 1),
+            "connected_clients": len(self.websocket_manager.connected_clients),
+            "agents": len(env_controller.agents),
+            "locations": sum(
+                len(area.locations)
+                for area in env_controller.environment.areas.values()
+            ),
+            "memory_bytes": sum(self.memory.values()),
+            "memory": self.memory,
+        }
+
+    def start(self) -> None:
+        """Start background work; needs a running event loop"""
+        if self._proximity_task is None:
+            self._proximity_task = asyncio.get_running_loop().create_task(
+                self._proximity_loop()
+            )
+
+    async def close(self) -> None:
+        """Disconnect clients and stop background work"""
+        for connection in list(self.websocket_manager.connected_clients):
+            self.websocket_manager.disconnect(connection)
+            try:
+                await connection.close(code=1001)
+            except Exception:
+                pass  # Already closed by the peer
+        if self._proximity_task is not None:
+            self._proximity_task.cancel()
+            self._proximity_task = None
+        self.state_cache.close()
+        await self.websocket_manager.scheduler.close()
+
+    async def _proximity_loop(self):
+        """Start a proximity tick every `proximity_interval`, skipping one
+        while the previous tick is still running"""
+        loop = asyncio.get_running_loop()
+        tick: Optional[asyncio.Task] = None
+        try:
+            while True:
+                await asyncio.sleep(self.config.proximity_interval)
+                if tick is not None and not tick.done():
+                    logger.warning(
+                        "Proximity tick for world %s overran %.2fs, skipping one",
+                        self.world_id,
+                        self.config.proximity_interval,
+                    )
+                    continue
+                tick = loop.create_task(self._proximity_tick())
+        finally:
+            if tick is not None:
+                tick.cancel()
+
+    async def _proximity_tick(self):
+        """Detect proximity transitions server-side; the grid search runs in
+        a worker thread on positions copied from the store"""
+        env_controller = self.env_controller
+        try:
+            proximity = env_controller.proximity
+            frame = proximity.capture()
+            if frame is None:
+                return
+            pairs = await asyncio.get_running_loop().run_in_executor(
+                None, pairs_within, frame[1], proximity.exit_radius
+            )
+            for event in proximity.finish(frame, pairs):
+                EventHandler._handle_proximity_event(event, env_controller)
+        except Exception as e:
+            logger.error(
+                f"Error in proximity detection for world {self.world_id}: {str(e)}",
+                exc_info=True,
+            )
+
+
+class WorldRegistry:
+    """Worlds hosted by this process, created on demand and evicted when idle
+
+    A world is idle while no client is connected to it. Idle worlds are
+    dropped after `idle_timeout` seconds without activity. When `max_worlds`
+    is reached, or the summed memory estimate exceeds `memory_limit` bytes,
+    idle worlds are evicted least recently active first. Pinned worlds
+    (the default world) are never evicted.
+    """
+
+    def __init__(
+        self,
+        config,
+        idle_timeout: float = 300.0,
+        max_worlds: int = 64,
+        memory_limit: int = 0,
+        sweep_interval: float = 10.0,
+        pinned=(DEFAULT_WORLD,),
+    ):
+        self.config = config
+        self.idle_timeout = idle_timeout
+        self.max_worlds = max_worlds
+        self.memory_limit = memory_limit  # Bytes; 0 disables the limit
+        self.sweep_interval = sweep_interval
+        self.pinned = frozenset(pinned)
+        self._worlds: Dict[str, World] = {}
+        self._loading: Dict[str, asyncio.Task] = {}  # Worlds restoring their snapshot
+        self._sweep_task: Optional[asyncio.Task] = None
+        self._snapshot_task: Optional[asyncio.Task] = None
+
+    def __len__(self):
+        return len(self._worlds)
+
+    def __contains__(self, world_id):
+        return world_id in self._worlds
+
+    def __iter__(self) -> Iterator[World]:
+        return iter(list(self._worlds.values()))
+
+    def get(self, world_id: str) -> Optional[World]:
+        return self._worlds.get(world_id)
+
+    def add(self, world: World) -> World:
+        """Register an already-built world, e.g. the default one at import"""
+        self._worlds[world.world_id] = world
+        return world
+
+    async def open(self, world_id: str) -> Optional[World]:
+        """The world for a new connection, created on demand
+
+        Returns None when the process is full of worlds that are in use."""
+        if (
+            world_id not in self._worlds
+            and world_id not in self._loading
+            and len(self._worlds) + len(self._loading) >= self.max_worlds
+        ):
+            if not await self._evict_lru("capacity"):
+                logger.warning(
+                    f"Cannot create world {world_id}: {len(self._worlds)} worlds in use"
+                )
+                return None
+        # Looked up after evicting, which yields to other connections
+        world = self._worlds.get(world_id)
+        if world is None:
+            loading = self._loading.get(world_id)
+            if loading is None:
+                loading = self._loading[world_id] = asyncio.get_running_loop().create_task(
+                    self._load(world_id)
+                )
+            # Shielded so a connection dropping mid-restore does not cancel it for others
+            world = await asyncio.shield(loading)
+        world.touch()
+        return world
+
+    async def _load(self, world_id: str) -> World:
+        """Create a world, restoring its snapshot off the loop, and start it"""
+        try:
+            world = World(world_id, self.config)
+            restored = await world.restore()
+            self._worlds[world_id] = world
+            world.start()
+            logger.info(f"{'Restored' if restored else 'Created'} world {world_id}")
+            return world
+        finally:
+            self._loading.pop(world_id, None)
+
+    async def restore_saved(self, owns=lambda world_id: True) -> int:
+        """Load every world with a snapshot on disk that `owns` accepts
+
+        Worlds already registered but not yet used, like the default world
+        created at import, are restored in place."""
+        snapshot_dir = self.config.snapshot_dir
+        if not snapshot_dir or not os.path.isdir(snapshot_dir):
+            return 0
+        restored = 0
+        for name in sorted(os.listdir(snapshot_dir)):
+            world_id, extension = os.path.splitext(name)
+            if (
+                extension != ".snap"
+                or world_id in self._loading
+                or not is_valid_world_id(world_id)
+                or not owns(world_id)
+            ):
+                continue
+            world = self._worlds.get(world_id)
+            if world is None:
+                if len(self._worlds) >= self.max_worlds:
+                    logger.warning(f"Not restoring further worlds: {self.max_worlds} loaded")
+                    break
+                world = World(world_id, self.config)
+                if await world.restore():
+                    self.add(world)
+                    restored += 1
+            elif world.is_idle and not world.env_controller.changes.version:
+                restored += await world.restore()
+        return restored
+
+    async def evict(self, world_id: str, reason: str = "manual") -> bool:
+        """Drop a world; its snapshot is kept (and refreshed) unless evicted manually"""
+        world = self._worlds.pop(world_id, None)
+        if world is None:
+            return False
+        await world.close()
+        if reason == "manual":
+            world.delete_snapshot()
+        else:
+            await world.save()
+        EVICTIONS.labels(reason).inc()
+        logger.info(f"Evicted world {world_id} ({reason})")
+        return True
+
+    def memory_usage(self) -> int:
+        """Summed memory estimate from the last measurement"""
+        return sum(sum(world.memory.values()) for world in self._worlds.values())
+
+    async def measure_memory(self) -> int:
+        """Refresh every world's memory estimate, yielding between worlds
+
+        Measuring a large world takes tens of milliseconds, so the loop is
+        handed back after each one. Returns the new total in bytes."""
+        total = 0
+        for world in self:
+            total += world.measure_memory()
+            await asyncio.sleep(0)
+        return total
+
+    async def sweep(self) -> None:
+        """Evict expired idle worlds, then enforce the memory limit, if any"""
+        now = time.monotonic()
+        for world in self:
+            if (
+                world.world_id not in self.pinned
+                and world.is_idle
+                and now - world.last_active >= self.idle_timeout
+            ):
+                await self.evict(world.world_id, "idle")
+
+        if not self.memory_limit:
+            return  # Nothing to enforce; GET /worlds and /metrics measure on demand
+        total = await self.measure_memory()
+        while total > self.memory_limit:
+            evicted = await self._evict_lru("memory")
+            if evicted is None:
+                logger.warning(
+                    f"Worlds use ~{total / 2**20:.2f} MB, over the "
+                    f"{self.memory_limit / 2**20:.2f} MB limit, but none are idle"
+                )
+                break
+            total -= sum(evicted.memory.values())
+
+    async def _evict_lru(self, reason: str) -> Optional[World]:
+        """Evict the least recently active idle world, returning it"""
+        candidates = [
+            world
+            for world in self._worlds.values()
+            if world.world_id not in self.pinned and world.is_idle
+        ]
+        if not candidates:
+            return None
+        world = min(candidates, key=lambda candidate: candidate.last_active)
+        await self.evict(world.world_id, reason)
+        return world
+
+    def start(self) -> None:
+        """Start every world and the periodic sweep; needs a running loop"""
+        for world in self:
+            world.start()
+        loop = asyncio.get_running_loop()
+        if self._sweep_task is None:
+            self._sweep_task = loop.create_task(self._run())
+        if self._snapshot_task is None and self.config.snapshot_dir:
+            os.makedirs(self.config.snapshot_dir, exist_ok=True)
+            self._snapshot_task = loop.create_task(self._run_snapshots())
+
+    async def close(self) -> None:
+        """Stop background work, then save and close every world"""
+        for task in (self._sweep_task, self._snapshot_task):
+            if task is not None:
+                task.cancel()
+        self._sweep_task = self._snapshot_task = None
+        for world in self:
+            await world.close()
+            await world.save()
+        self._worlds.clear()
+
+    async def save(self) -> int:
+        """Snapshot every world changed since its last save"""
+        saved = 0
+        for world in self:
+            if await world.save():
+                saved += 1
+        return saved
+
+    def save_all(self) -> int:
+        """Blocking save of every changed world, for signal handlers"""
+        saved = 0
+        for world in self:
+            try:
+                saved += world.save_sync()
+            except Exception as e:
+                SNAPSHOTS.labels("error").inc()
+                logger.error(f"Error saving world {world.world_id}: {str(e)}", exc_info=True)
+        return saved
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            try:
+                await self.sweep()
+            except Exception as e:
+                logger.error(f"Error sweeping worlds: {str(e)}", exc_info=True)
+
+    async def _run_snapshots(self) -> None:
+        while True:
+            await asyncio.sleep(self.config.snapshot_interval)
+            started = time.perf_counter()
+            saved = await self.save()
+            if saved:
+                logger.info(
+                    f"Saved {saved} world snapshots in "
+                    f"{(time.perf_counter() - started) * 1000:.1f} ms"
+                )
@@ -11,3 +11,80 @@ class Config:
 
         self.host = os.getenv("HOST", "127.0.0.1")
         self.port = int(os.getenv("PORT", "8001"))
+
+        # Server-side proximity detection
+        self.proximity_radius = float(os.getenv("PROXIMITY_RADIUS", "2.0"))
+        self.proximity_interval = float(os.getenv("PROXIMITY_INTERVAL", "0.2"))
+
+        # Wire encoding: "auto" picks orjson when installed, else stdlib json
+        self.json_codec = os.getenv("JSON_CODEC", "auto")
+        self.binary_frames = os.getenv("WS_BINARY_FRAMES", "false").lower() == "true"
+
+        # Optional length-prefixed TCP transport served next to the WebSocket endpoint
+        tcp_port = os.getenv("TCP_PORT")
+        self.tcp_port = int(tcp_port) if tcp_port else None
+        self.tcp_host = os.getenv("TCP_HOST", self.host)
+
+        # Jitter applied to outgoing move commands, in seconds
+        self.command_delay_min = float(os.getenv("COMMAND_DELAY_MIN", "0.5"))
+        self.command_delay_max = float(os.getenv("COMMAND_DELAY_MAX", "1.5"))
+        # Per-client outbound queue bound; the oldest queued move is evicted past it
+        self.outbound_queue_size = int(os.getenv("OUTBOUND_QUEUE_SIZE", "1024"))
+
+        # Broadcasts wait at most this long (seconds) for each client's write;
+        # clients missing it this many times in a row are disconnected
+        self.broadcast_deadline = float(os.getenv("BROADCAST_DEADLINE", "0.5"))
+        self.broadcast_max_misses = int(os.getenv("BROADCAST_MAX_MISSES", "3"))
+
+        # Batch destination assignment: random, greedy (nearest) or auction (min total distance)
+        self.assignment_mode = os.getenv("ASSIGNMENT_MODE", "random")
+
+        # Comma-separated event types that skip pydantic validation (trusted clients only)
+        self.trusted_event_types = [
+            event_type.strip()
+            for event_type in os.getenv("TRUSTED_EVENT_TYPES", "").split(",")
+            if event_type.strip()
+        ]
+
+        # Logging: a background thread does formatting and I/O when LOG_QUEUE is on
+        self.log_level = os.getenv("LOG_LEVEL", "INFO")
+        self.log_queued = os.getenv("LOG_QUEUE", "true").lower() == "true"
+        # Max INFO/DEBUG records per second from any one call site; 0 disables
+        self.log_rate_limit = float(os.getenv("LOG_RATE_LIMIT", "0"))
+        self.log_file = os.getenv("LOG_FILE")
+        self.log_json_file = os.getenv("LOG_JSON_FILE")  # Structured JSON-lines sink
+
+        # Profiling, loop-lag and tracemalloc endpoints under /debug; off by default
+        self.debug_endpoints = os.getenv("DEBUG_ENDPOINTS", "false").lower() == "true"
+        self.loop_lag_interval = float(os.getenv("LOOP_LAG_INTERVAL", "0.1"))
+        self.slow_callback_threshold = float(os.getenv("SLOW_CALLBACK_THRESHOLD", "0.1"))
+        self.max_profile_seconds = float(os.getenv("MAX_PROFILE_SECONDS", "60"))
+        self.tracemalloc_frames = int(os.getenv("TRACEMALLOC_FRAMES", "1"))
+
+        # Multi-process hosting: with SHARDS > 1, main.py runs a router on PORT and
+        # one server process per shard on SHARD_BASE_PORT + index; each world id
+        # lives on exactly one shard. SHARD_INDEX is set for the shard processes.
+        self.shard_count = max(1, int(os.getenv("SHARDS", "1")))
+        self.shard_index = int(os.getenv("SHARD_INDEX", "0"))
+        self.shard_host = os.getenv("SHARD_HOST", "127.0.0.1")
+        self.shard_base_port = int(os.getenv("SHARD_BASE_PORT", str(self.port + 1)))
+
+        # Worlds (/ws/{world_id}) per process: idle ones (no clients) are evicted after
+        # WORLD_IDLE_TIMEOUT seconds, or least recently active first past MAX_WORLDS
+        # or WORLD_MEMORY_LIMIT_MB of estimated memory (0 disables the limit)
+        self.world_idle_timeout = float(os.getenv("WORLD_IDLE_TIMEOUT", "300"))
+        self.max_worlds = int(os.getenv("MAX_WORLDS", "64"))
+        self.world_memory_limit_mb = float(os.getenv("WORLD_MEMORY_LIMIT_MB", "0"))
+        self.world_sweep_interval = float(os.getenv("WORLD_SWEEP_INTERVAL", "10"))
+
+        # Binary world snapshots: every SNAPSHOT_INTERVAL seconds (when changed), on
+        # eviction and on shutdown, written to SNAPSHOT_DIR/{world_id}.snap and
+        # restored when the world is next created. Unset SNAPSHOT_DIR disables them.
+        self.snapshot_dir = os.getenv("SNAPSHOT_DIR")
+        self.snapshot_interval = float(os.getenv("SNAPSHOT_INTERVAL", "60"))
+
+        # Mutations remembered per world for GET /state/changes; pollers further
+        # behind than this many changes get the full state instead
+        self.change_log_size = int(os.getenv("CHANGE_LOG_SIZE", "100000"))
+        # GET /state serves a pre-encoded body rebuilt at most this often (seconds)
+        self.state_cache_interval = float(os.getenv("STATE_CACHE_INTERVAL", "1.0"))
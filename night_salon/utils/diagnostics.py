@@ -0,0 +1,211 @@
+"""Runtime diagnostics: event-loop lag, on-demand profiling, allocation snapshots"""
+
+import asyncio
+import cProfile
+import io
+import logging
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter, deque
+from typing import Any, Deque, Dict, List, Optional
+
+
+class LoopLagMonitor:
+    """Heartbeat task that measures how late the event loop wakes it up
+
+    Every `interval` seconds the task sleeps and records how much longer the
+    sleep took than requested. Lag above `slow_threshold` is kept in a
+    bounded log; each entry marks a callback that blocked the loop that long.
+    Naming the callbacks needs asyncio debug mode, which slows every
+    callback, so it is only switched on for an explicit
+    `capture_slow_callbacks` window.
+    """
+
+    def __init__(
+        self, interval: float = 0.1, slow_threshold: float = 0.1, history: int = 600
+    ):
+        self.interval = interval
+        self.slow_threshold = slow_threshold
+        self.samples: Deque[float] = deque(maxlen=history)
+        self.lag_events: Deque[Dict[str, float]] = deque(maxlen=100)
+        self.slow_callbacks: Deque[Dict[str, Any]] = deque(maxlen=100)
+        self._task: Optional[asyncio.Task] = None
+        self._log_handler = _SlowCallbackHandler(self.slow_callbacks)
+        self._capturing = False
+
+    def start(self) -> None:
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def capture_slow_callbacks(self, seconds: float) -> List[Dict[str, Any]]:
+        """Run the loop in debug mode for `seconds`; callbacks slower than
+        `slow_threshold` in that window, as asyncio reported them"""
+        if self._capturing:
+            raise ProfileBusyError("A slow callback capture is already running")
+        self._capturing = True
+        loop = asyncio.get_running_loop()
+        debug, duration = loop.get_debug(), loop.slow_callback_duration
+        started = time.time()
+        loop.set_debug(True)
+        loop.slow_callback_duration = self.slow_threshold
+        logging.getLogger("asyncio").addHandler(self._log_handler)
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            logging.getLogger("asyncio").removeHandler(self._log_handler)
+            loop.set_debug(debug)
+            loop.slow_callback_duration = duration
+            self._capturing = False
+        return [entry for entry in self.slow_callbacks if entry["at"] >= started]
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - expected)
+            self.samples.append(lag)
+            if lag >= self.slow_threshold:
+                self.lag_events.append({"at": time.time(), "lag_ms": lag * 1000})
+
+    def report(self) -> Dict[str, Any]:
+        ordered = sorted(self.samples)
+        stats = None
+        if ordered:
+            stats = {
+                "samples": len(ordered),
+                "mean_ms": sum(ordered) / len(ordered) * 1000,
+                "p50_ms": ordered[len(ordered) // 2] * 1000,
+                "p99_ms": ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))] * 1000,
+                "max_ms": ordered[-1] * 1000,
+                "current_ms": self.samples[-1] * 1000,
+            }
+        return {
+            "running": self._task is not None and not self._task.done(),
+            "interval_ms": self.interval * 1000,
+            "slow_threshold_ms": self.slow_threshold * 1000,
+            "lag": stats,
+            "lag_events": list(self.lag_events),
+            "slow_callbacks": list(self.slow_callbacks),
+        }
+
+
+class _SlowCallbackHandler(logging.Handler):
+    """Keeps asyncio's "Executing <handle> took N seconds" debug warnings"""
+
+    def __init__(self, sink: Deque[Dict[str, Any]]):
+        super().__init__(logging.WARNING)
+        self.sink = sink
+
+    def emit(self, record):
+        message = record.getMessage()
+        if message.startswith("Executing"):
+            self.sink.append({"at": record.created, "message": message})
+
+
+class ProfileBusyError(RuntimeError):
+    """Raised when a profiling or capture session is requested while one is running"""
+
+
+class Profiler:
+    """Runs one profiling session at a time against the event loop thread
+
+    `cprofile` mode enables cProfile on the loop thread for the duration and
+    returns pstats text. `sample` mode polls the loop thread's stack from a
+    background thread every `sample_interval` seconds and returns collapsed
+    stacks ("outer;inner;leaf count" lines), ready for flame graph tools.
+    """
+
+    def __init__(self, sample_interval: float = 0.005):
+        self.sample_interval = sample_interval
+        self._busy = False
+
+    async def profile(
+        self, seconds: float, mode: str = "cprofile", limit: int = 50
+    ) -> str:
+        if mode not in ("cprofile", "sample"):
+            raise ValueError(f"Unknown profile mode: {mode}")
+        if self._busy:
+            raise ProfileBusyError("A profiling session is already running")
+        self._busy = True
+        try:
+            if mode == "cprofile":
+                return await self._cprofile(seconds, limit)
+            return await self._sample(seconds, limit)
+        finally:
+            self._busy = False
+
+    async def _cprofile(self, seconds: float, limit: int) -> str:
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            profiler.disable()
+        output = io.StringIO()
+        stats = pstats.Stats(profiler, stream=output)
+        stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(limit)
+        return output.getvalue()
+
+    async def _sample(self, seconds: float, limit: int) -> str:
+        target = threading.get_ident()
+        stacks: Counter = Counter()
+        done = threading.Event()
+
+        def sample():
+            while not done.wait(self.sample_interval):
+                frame = sys._current_frames().get(target)
+                names = []
+                while frame is not None:
+                    code = frame.f_code
+                    names.append(f"{code.co_name} ({code.co_filename}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                if names:
+                    stacks[";".join(reversed(names))] += 1
+
+        sampler = threading.Thread(target=sample, name="loop-sampler", daemon=True)
+        sampler.start()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            done.set()
+            await asyncio.get_running_loop().run_in_executor(None, sampler.join)
+        return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common(limit))
+
+
+def tracemalloc_snapshot(limit: int = 20, frames: int = 1) -> Dict[str, Any]:
+    """Top allocation sites by size; starts tracing first if it isn't on yet"""
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(frames)
+        return {"tracing": True, "started": True, "top": []}
+
+    snapshot = tracemalloc.take_snapshot().filter_traces(
+        (tracemalloc.Filter(False, tracemalloc.__file__),)
+    )
+    current, peak = tracemalloc.get_traced_memory()
+    top: List[Dict[str, Any]] = [
+        {
+            "location": str(stat.traceback),
+            "size_kb": stat.size / 1024,
+            "count": stat.count,
+        }
+        for stat in snapshot.statistics("lineno")[:limit]
+    ]
+    return {
+        "tracing": True,
+        "started": False,
+        "current_kb": current / 1024,
+        "peak_kb": peak / 1024,
+        "top": top,
+    }
@@ -1,39 +1,101 @@
+import atexit
+import json
 import logging
+import logging.handlers
+import queue
+import threading
+import time
 from pathlib import Path
-from typing import Optional
+from typing import Dict, List, Optional, Tuple
 import sys
 
 
-def setup_logger(
-    level: int = logging.INFO, log_file: Optional[Path] = None
-) -> logging.Logger:
-    """Configure and return a logger instance with consistent formatting"""
-    logger = logging.getLogger()
-    logger.setLevel(level)
+class ColoredLevelFormatter(logging.Filter):
+    """Adds a colored `[LEVEL]` prefix to records for console output"""
 
-    formatter = logging.Formatter("%(asctime)s %(colored_level)s%(message)s\n")
+    colors = {
+        logging.DEBUG: "\033[36m",  # Cyan
+        logging.INFO: "\033[32m",  # Green
+        logging.WARNING: "\033[33m",  # Yellow
+        logging.ERROR: "\033[31m",  # Red
+        logging.CRITICAL: "\033[35m",  # Magenta
+    }
 
-    # Add color formatter filter
-    class ColoredLevelFormatter(logging.Filter):
-        colors = {
-            logging.DEBUG: "\033[36m",  # Cyan
-            logging.INFO: "\033[32m",  # Green
-            logging.WARNING: "\033[33m",  # Yellow
-            logging.ERROR: "\033[31m",  # Red
-            logging.CRITICAL: "\033[35m",  # Magenta
-        }
+    def filter(self, record):
+        record.colored_level = (
+            f"{self.colors.get(record.levelno, '')}[{record.levelname}]\033[0m "
+        )
+        return True
+
+
+class RateLimitFilter(logging.Filter):
+    """Token bucket per call site for records below WARNING
+
+    Each logging call site (file and line) may emit `rate` records per
+    second with bursts of up to `burst`. Excess records are dropped and the
+    next one let through notes how many similar messages were suppressed.
+    Warnings and errors always pass.
+    """
 
-        def filter(self, record):
-            record.colored_level = (
-                f"{self.colors.get(record.levelno, '')}[{record.levelname}]\033[0m "
-            )
+    def __init__(self, rate: float, burst: Optional[int] = None):
+        super().__init__()
+        self.rate = rate
+        self.burst = burst if burst is not None else max(1, int(rate))
+        self._buckets: Dict[Tuple[str, int], List[float]] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
             return True
 
+        key = (record.pathname, record.lineno)
+        now = time.monotonic()
+        with self._lock:
+            # [tokens, last refill time, suppressed count]
+            bucket = self._buckets.setdefault(key, [float(self.burst), now, 0])
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+            if bucket[0] < 1:
+                bucket[2] += 1
+                return False
+            bucket[0] -= 1
+            suppressed, bucket[2] = bucket[2], 0
+
+        if suppressed:
+            record.msg = f"{record.msg} [{suppressed} similar messages suppressed]"
+        return True
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """One JSON object per record, for log shippers and offline analysis"""
+
+    def format(self, record):
+        entry = {
+            "ts": record.created,
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "module": record.module,
+            "line": record.lineno,
+        }
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry)
+
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def _build_handlers(
+    log_file: Optional[Path], json_log_file: Optional[Path]
+) -> List[logging.Handler]:
+    formatter = logging.Formatter("%(asctime)s %(colored_level)s%(message)s\n")
+
     # Console handler
     console_handler = logging.StreamHandler(sys.stdout)
     console_handler.setFormatter(formatter)
     console_handler.addFilter(ColoredLevelFormatter())
-    logger.addHandler(console_handler)
+    handlers = [console_handler]
 
     # Optional file handler (without colors)
     if log_file:
@@ -42,11 +104,88 @@ def setup_logger(
         )
         file_handler = logging.FileHandler(log_file)
         file_handler.setFormatter(file_formatter)
-        logger.addHandler(file_handler)
+        handlers.append(file_handler)
+
+    # Optional structured sink
+    if json_log_file:
+        json_handler = logging.FileHandler(json_log_file)
+        json_handler.setFormatter(JsonLinesFormatter())
+        handlers.append(json_handler)
+
+    return handlers
+
+
+def setup_logger(
+    level: int = logging.INFO,
+    log_file: Optional[Path] = None,
+    queued: bool = False,
+    rate_limit: float = 0.0,
+    json_log_file: Optional[Path] = None,
+) -> logging.Logger:
+    """Configure and return a logger instance with consistent formatting
+
+    Calling it again replaces the previous configuration. With `queued`,
+    the root logger only enqueues records and a QueueListener thread does
+    the formatting and I/O, so slow terminals or disks don't block the event
+    loop. `rate_limit` caps records per second per call site of the root
+    logger (0 disables).
+    """
+    logger = logging.getLogger()
+    logger.setLevel(level)
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+        handler.close()
+    stop_logging()
+    for log_filter in list(logger.filters):
+        if isinstance(log_filter, RateLimitFilter):
+            logger.removeFilter(log_filter)
+
+    handlers = _build_handlers(log_file, json_log_file)
+
+    if queued:
+        global _listener
+        queue_handler = logging.handlers.QueueHandler(queue.SimpleQueue())
+        _listener = logging.handlers.QueueListener(
+            queue_handler.queue, *handlers, respect_handler_level=True
+        )
+        _listener.start()
+        handlers = [queue_handler]
+
+    for handler in handlers:
+        logger.addHandler(handler)
+    if rate_limit > 0:
+        # Filter on the logger, before enqueueing, so dropped records cost little
+        logger.addFilter(RateLimitFilter(rate_limit))
 
     return logger
 
-    # Setup logging
 
+def stop_logging() -> None:
+    """Flush and stop the background listener, if one is running, and close its handlers"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+
+
+def configure_logging(config) -> logging.Logger:
+    """Apply the logging options from a Config"""
+    level = logging.getLevelName(config.log_level.upper())
+    known = isinstance(level, int)  # Unknown names come back as "Level X"
+    configured = setup_logger(
+        level=level if known else logging.INFO,
+        log_file=Path(config.log_file) if config.log_file else None,
+        queued=config.log_queued,
+        rate_limit=config.log_rate_limit,
+        json_log_file=Path(config.log_json_file) if config.log_json_file else None,
+    )
+    if not known:
+        configured.warning(f"Unknown LOG_LEVEL {config.log_level!r}, using INFO")
+    return configured
+
+
+atexit.register(stop_logging)
 
 logger = setup_logger()
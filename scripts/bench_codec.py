@@ -0,0 +1,61 @@
+"""Compare the stdlib and orjson codecs on typical WebSocket traffic
+
+Usage: python -m scripts.bench_codec [--iterations N]
+"""
+
+import argparse
+import timeit
+
+from night_salon.server.codec import CODECS, FrameEncoder, orjson
+
+MOVE_COMMAND = {
+    "messageType": "move_to_location",
+    "agent_id": "agent_042",
+    "location_name": "ConferenceRoom_Seat_07",
+}
+LOCATION_REACHED = (
+    '{"messageType":"location_reached","agent_id":"agent_042",'
+    '"location_name":"ConferenceRoom_Seat_07","coordinates":[12.5,0.0,-3.25]}'
+)
+MOVE_BATCH = {"messageType": "batch", "events": [MOVE_COMMAND] * 100}
+
+
+def bench(label, func, iterations):
+    seconds = timeit.timeit(func, number=iterations)
+    print(f"  {label:<32} {seconds / iterations * 1e6:8.3f} us/op")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--iterations", type=int, default=200_000)
+    args = parser.parse_args()
+    iterations = args.iterations
+
+    names = [name for name in CODECS if name != "orjson" or orjson is not None]
+    if orjson is None:
+        print("orjson is not installed, only benchmarking the stdlib codec\n")
+
+    for name in names:
+        codec = CODECS[name]()
+        encoder = FrameEncoder(codec)
+        print(f"{name}:")
+        bench(
+            "decode location_reached", lambda: codec.loads(LOCATION_REACHED), iterations
+        )
+        bench("encode move_to_location", lambda: codec.dumps(MOVE_COMMAND), iterations)
+        bench(
+            "encode move (cached fragments)",
+            lambda: encoder.move_to_location("agent_042", "ConferenceRoom_Seat_07"),
+            iterations,
+        )
+        bench("encode ack", lambda: codec.dumps({"status": "success"}), iterations)
+        bench(
+            "encode 100-command batch",
+            lambda: codec.dumps(MOVE_BATCH),
+            iterations // 100,
+        )
+        print()
+
+
+if __name__ == "__main__":
+    main()
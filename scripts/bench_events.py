@@ -0,0 +1,104 @@
+"""Per-event parsing and dispatch overhead, before and after the event registry
+
+"legacy" replays the old path: copy the message without messageType, build
+a dict of lambdas, validate by calling the model constructor, then pick the
+handler with an if/elif chain. "registry" validates through the prebuilt
+discriminated union, and "trusted" skips pydantic for the event type.
+Handlers are not run, so only the per-event overhead is measured.
+
+Usage: python -m scripts.bench_events [--iterations N]
+"""
+
+import argparse
+import timeit
+
+from night_salon.models import (
+    EVENT_ADAPTER,
+    LocationReachedEvent,
+    ProximityEvent,
+    SetupEvent,
+)
+from night_salon.server.event_handler import EVENT_HANDLERS, EventHandler
+
+MESSAGES = {
+    "location_reached": {
+        "messageType": "location_reached",
+        "agent_id": "agent_042",
+        "location_name": "ConferenceRoom_Seat_07",
+        "coordinates": [12.5, 0.0, -3.25],
+    },
+    "proximity_event": {
+        "messageType": "proximity_event",
+        "agent_id": "agent_042",
+        "target_id": "agent_017",
+        "event_type": "enter",
+        "distance": 1.75,
+    },
+}
+
+
+def legacy(event):
+    event_type = event.get("messageType")
+    data = {k: v for k, v in event.items() if k != "messageType"}
+    event_map = {
+        "setup": lambda: SetupEvent(
+            type="setup",
+            agent_ids=data.get("agent_ids", []),
+            areas=data.get("areas", []),
+            cameras=data.get("cameras", []),
+            items=data.get("items", []),
+        ),
+        "location_reached": lambda: LocationReachedEvent(
+            type="location_reached",
+            agent_id=data["agent_id"],
+            location_name=data["location_name"],
+            coordinates=data.get("coordinates") or [],
+        ),
+        "proximity_event": lambda: ProximityEvent(
+            type="proximity_event",
+            agent_id=data["agent_id"],
+            target_id=data["target_id"],
+            event_type=data["event_type"],
+            distance=data["distance"],
+        ),
+    }
+    parsed = event_map[event_type]() if event_type in event_map else None
+    if event_type == "setup":
+        return parsed
+    elif event_type == "location_reached":
+        return parsed
+    elif event_type == "proximity_event":
+        return parsed
+
+
+def registry(event):
+    event_type = event.get("messageType")
+    EVENT_HANDLERS.get(event_type)
+    return EventHandler._create_event_object(event_type, event)
+
+
+def bench(label, func, iterations):
+    seconds = timeit.timeit(func, number=iterations)
+    print(f"  {label:<12} {seconds / iterations * 1e6:8.3f} us/event")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--iterations", type=int, default=100_000)
+    args = parser.parse_args()
+
+    for event_type, message in MESSAGES.items():
+        # All three paths must agree on the parsed event
+        assert legacy(message) == EVENT_ADAPTER.validate_python(message)
+        print(f"{event_type}:")
+        bench("legacy", lambda: legacy(message), args.iterations)
+        EventHandler.trust_event_types(())
+        bench("registry", lambda: registry(message), args.iterations)
+        EventHandler.trust_event_types([event_type])
+        bench("trusted", lambda: registry(message), args.iterations)
+        EventHandler.trust_event_types(())
+        print()
+
+
+if __name__ == "__main__":
+    main()
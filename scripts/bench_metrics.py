@@ -0,0 +1,44 @@
+"""Cost of recording metrics, which stay enabled in production
+
+Usage: python -m scripts.bench_metrics [--iterations N]
+"""
+
+import argparse
+import timeit
+
+from night_salon.utils.metrics import MetricsRegistry
+
+
+def bench(label, statement, namespace, iterations):
+    seconds = timeit.timeit(statement, globals=namespace, number=iterations)
+    print(f"  {label:<36} {seconds / iterations * 1e9:8.1f} ns/op")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--iterations", type=int, default=2_000_000)
+    args = parser.parse_args()
+
+    registry = MetricsRegistry()
+    labelled = registry.counter("bench_total", "Counter", labels=("result",))
+    histogram = registry.histogram("bench_seconds", "Histogram", labels=("type",))
+    namespace = {
+        "counter": registry.counter("bench_plain_total", "Counter"),
+        "labelled": labelled,
+        "child": labelled.labels("reserved"),
+        "histogram": histogram,
+        "observer": histogram.labels("location_reached"),
+    }
+
+    for label, statement in (
+        ("counter.inc()", "counter.inc()"),
+        ("cached child.inc()", "child.inc()"),
+        ("counter.labels(v).inc()", 'labelled.labels("reserved").inc()'),
+        ("cached child.observe(x)", "observer.observe(0.0007)"),
+        ("histogram.labels(v).observe(x)", 'histogram.labels("x").observe(0.0007)'),
+    ):
+        bench(label, statement, namespace, args.iterations)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,237 @@
+"""WebSocket load generator that behaves like M Unity clients
+
+Each connection sends a `setup` with its own agents and locations, then
+answers every `move_to_location` for one of its agents with a
+`location_reached` after a simulated travel time. Reports throughput,
+command round-trip latency (location_reached sent -> next move_to_location
+received, which includes the server's COMMAND_DELAY jitter; run the server
+with COMMAND_DELAY_MIN=0 COMMAND_DELAY_MAX=0 to measure processing alone),
+ack latency and error counts.
+
+Usage: python -m scripts.load_test --connections 10 --agents 100 --duration 30
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+from collections import deque
+from typing import Dict, List
+
+import websockets
+
+AREAS = [
+    "HALLWAY",
+    "CONFERENCE_ROOM",
+    "WATER_COOLER",
+    "SMOKING_AREA",
+    "CUBICLES",
+    "BATHROOM",
+]
+
+
+class Stats:
+    def __init__(self):
+        self.sent = 0
+        self.received = 0
+        self.commands = 0
+        self.arrivals = 0
+        self.errors = 0
+        self.connection_errors = 0
+        self.command_latencies: List[float] = []
+        self.ack_latencies: List[float] = []
+
+    def summary(self, elapsed: float) -> Dict[str, object]:
+        return {
+            "elapsed_s": round(elapsed, 2),
+            "messages_sent": self.sent,
+            "messages_received": self.received,
+            "arrivals_per_s": round(self.arrivals / elapsed, 1),
+            "commands_per_s": round(self.commands / elapsed, 1),
+            "command_rtt_ms": percentiles(self.command_latencies),
+            "ack_rtt_ms": percentiles(self.ack_latencies),
+            "error_responses": self.errors,
+            "connection_errors": self.connection_errors,
+        }
+
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+
+    def at(fraction):
+        return round(
+            ordered[min(len(ordered) - 1, int(len(ordered) * fraction))] * 1000, 2
+        )
+
+    return {
+        "count": len(ordered),
+        "p50": at(0.5),
+        "p90": at(0.9),
+        "p99": at(0.99),
+        "max": at(1.0),
+    }
+
+
+class SimulatedClient:
+    """One connection's worth of agents walking between locations"""
+
+    def __init__(self, index: int, args: argparse.Namespace, stats: Stats):
+        self.index = index
+        self.args = args
+        self.stats = stats
+        self.agent_ids = [f"c{index}_agent_{i}" for i in range(args.agents)]
+        self.owned = set(self.agent_ids)
+        self.areas = [
+            {
+                "area_name": area,
+                "locations": [f"c{index}_{area}_{j}" for j in range(args.locations)],
+            }
+            for area in AREAS[: args.areas]
+        ]
+        self.last_arrival: Dict[str, float] = {}  # agent_id -> send time of its arrival
+        self.ack_sent: deque = deque()  # Send times of messages awaiting an ack
+        self.tasks = set()
+
+    async def run(self, stop_at: float) -> None:
+        try:
+            async with websockets.connect(self.args.url, max_size=None) as websocket:
+                await self.send(
+                    websocket,
+                    {
+                        "messageType": "setup",
+                        "agent_ids": self.agent_ids,
+                        "areas": self.areas,
+                        "cameras": [],
+                        "items": [],
+                    },
+                )
+                now = time.perf_counter()
+                for agent_id in self.agent_ids:
+                    self.last_arrival[agent_id] = now
+                await self.receive(websocket, stop_at)
+        except (OSError, websockets.WebSocketException) as e:
+            self.stats.connection_errors += 1
+            print(f"connection {self.index}: {e}")
+        finally:
+            for task in self.tasks:
+                task.cancel()
+
+    async def send(self, websocket, message) -> None:
+        self.ack_sent.append(time.perf_counter())
+        await websocket.send(json.dumps(message))
+        self.stats.sent += 1
+
+    async def receive(self, websocket, stop_at: float) -> None:
+        while True:
+            remaining = stop_at - time.monotonic()
+            if remaining <= 0:
+                return
+            try:
+                raw = await asyncio.wait_for(websocket.recv(), remaining)
+            except asyncio.TimeoutError:
+                return
+            self.stats.received += 1
+            message = json.loads(raw)
+            if "status" in message:
+                self.handle_ack(message)
+                continue
+
+            if message.get("messageType") == "batch":
+                commands = message.get("events", [])
+            else:
+                commands = [message]
+            for command in commands:
+                if command.get("messageType") == "move_to_location":
+                    self.handle_command(websocket, command)
+
+    def handle_ack(self, message) -> None:
+        if self.ack_sent:
+            self.stats.ack_latencies.append(
+                time.perf_counter() - self.ack_sent.popleft()
+            )
+        if message.get("status") == "error":
+            self.stats.errors += 1
+
+    def handle_command(self, websocket, command) -> None:
+        agent_id = command.get("agent_id")
+        if agent_id not in self.owned:
+            return  # Broadcast meant for another client's agents
+        self.stats.commands += 1
+        sent_at = self.last_arrival.pop(agent_id, None)
+        if sent_at is not None:
+            self.stats.command_latencies.append(time.perf_counter() - sent_at)
+        task = asyncio.ensure_future(self.travel(websocket, command))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def travel(self, websocket, command) -> None:
+        await asyncio.sleep(random.uniform(self.args.travel_min, self.args.travel_max))
+        agent_id = command["agent_id"]
+        # Stamp before sending; the reply can arrive while send() is suspended
+        self.last_arrival[agent_id] = time.perf_counter()
+        try:
+            await self.send(
+                websocket,
+                {
+                    "messageType": "location_reached",
+                    "agent_id": agent_id,
+                    "location_name": command["location_name"],
+                    "coordinates": [
+                        random.uniform(-50, 50),
+                        0.0,
+                        random.uniform(-50, 50),
+                    ],
+                },
+            )
+        except websockets.ConnectionClosed:
+            return
+        self.stats.arrivals += 1
+
+
+async def report_progress(stats: Stats, started: float, interval: float) -> None:
+    while True:
+        await asyncio.sleep(interval)
+        elapsed = time.monotonic() - started
+        print(
+            f"[{elapsed:6.1f}s] sent={stats.sent} received={stats.received} "
+            f"arrivals/s={stats.arrivals / elapsed:.1f} errors={stats.errors}"
+        )
+
+
+async def main_async(args: argparse.Namespace) -> None:
+    stats = Stats()
+    started = time.monotonic()
+    stop_at = started + args.duration
+    clients = [SimulatedClient(index, args, stats) for index in range(args.connections)]
+    progress = asyncio.ensure_future(report_progress(stats, started, args.progress))
+    try:
+        await asyncio.gather(*(client.run(stop_at) for client in clients))
+    finally:
+        progress.cancel()
+    print(json.dumps(stats.summary(time.monotonic() - started), indent=2))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--url", default="ws://127.0.0.1:8001/ws")
+    parser.add_argument("--connections", type=int, default=1)
+    parser.add_argument("--agents", type=int, default=20, help="agents per connection")
+    parser.add_argument(
+        "--areas", type=int, default=len(AREAS), choices=range(1, len(AREAS) + 1)
+    )
+    parser.add_argument("--locations", type=int, default=10, help="locations per area")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds")
+    parser.add_argument("--travel-min", type=float, default=0.5, help="seconds")
+    parser.add_argument("--travel-max", type=float, default=2.0, help="seconds")
+    parser.add_argument("--progress", type=float, default=5.0, help="report interval")
+    args = parser.parse_args()
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,334 @@
+"""Scaling benchmarks for EnvironmentController and EventHandler
+
+Builds a world per size (LOCATIONS:AGENTS, locations spread evenly over
+the Area types) through the real `setup` handler, then times the hot
+operations against it:
+
+  _handle_setup                     whole setup, on a fresh controller
+  get_available_locations           one area scan
+  generate_random_movement_command  sample and reserve a destination
+  release_planned_location          drop the agent's reservations
+  _update_agent_location            arrive at the reserved destination
+  get_environment_state             full state dump
+
+Each round walks a batch of agents through generate -> release ->
+generate -> arrive, so the world stays in a steady state between rounds.
+Times are per call; the median over rounds is what gets compared.
+
+Results are written as JSON. With --baseline, every size/operation is
+compared to a stored run: a median more than --threshold times slower, or
+a log-log slope against world size more than --slope-tolerance steeper,
+is reported as a regression and the exit status is 1.
+
+Usage:
+  python -m tests.benchmark_environment --output baseline.json
+  python -m tests.benchmark_environment --baseline baseline.json --output current.json
+  python -m tests.benchmark_environment --sizes 10:10,1000:100 --repeat 3
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import math
+import platform
+import statistics
+import sys
+import time
+import timeit
+from typing import Callable, Dict, List, Tuple
+
+from night_salon.controllers.environment import EnvironmentController
+from night_salon.models import EVENT_ADAPTER, Area
+from night_salon.server.event_handler import EventHandler
+from night_salon.utils.logger import setup_logger
+
+DEFAULT_SIZES = "10:10,100:10,1000:100,10000:1000,100000:10000"
+OPERATIONS = (
+    "_handle_setup",
+    "get_available_locations",
+    "generate_random_movement_command",
+    "release_planned_location",
+    "_update_agent_location",
+    "get_environment_state",
+)
+
+
+def parse_sizes(value: str) -> List[Tuple[int, int]]:
+    sizes = []
+    for item in value.split(","):
+        locations, _, agents = item.partition(":")
+        sizes.append((int(locations), int(agents or locations)))
+    return sizes
+
+
+def setup_message(locations: int, agents: int) -> dict:
+    areas = list(Area)
+    per_area = [locations // len(areas)] * len(areas)
+    for index in range(locations % len(areas)):
+        per_area[index] += 1
+    return {
+        "messageType": "setup",
+        "agent_ids": [f"agent_{i}" for i in range(agents)],
+        "areas": [
+            {
+                "area_name": area.value,
+                "locations": [f"{area.value}_{j}" for j in range(count)],
+            }
+            for area, count in zip(areas, per_area)
+            if count
+        ],
+        "cameras": [],
+        "items": [],
+    }
+
+
+def summarize(per_call: List[float]) -> Dict[str, float]:
+    """Per-call seconds over rounds, as microseconds"""
+    return {
+        "median_us": statistics.median(per_call) * 1e6,
+        "min_us": min(per_call) * 1e6,
+        "rounds": len(per_call),
+    }
+
+
+def time_calls(func: Callable[[], object], repeat: int) -> List[float]:
+    """Per-call seconds for a side-effect free call, one entry per round"""
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    return [seconds / number for seconds in timer.repeat(repeat, number)]
+
+
+def time_each(func: Callable, items) -> float:
+    """Mean seconds of func(item) over items"""
+    started = time.perf_counter()
+    for item in items:
+        func(item)
+    return (time.perf_counter() - started) / max(1, len(items))
+
+
+def bench_setup(
+    message: dict, repeat: int, loop
+) -> Tuple[List[float], EnvironmentController]:
+    event = EVENT_ADAPTER.validate_python(message)
+    per_call = []
+    env = None
+    for _ in range(repeat):
+        env = EnvironmentController()
+        started = time.perf_counter()
+        loop.run_until_complete(EventHandler._handle_setup(event, env))
+        per_call.append(time.perf_counter() - started)
+    return per_call, env
+
+
+def bench_movement(
+    env: EnvironmentController, batch: int, repeat: int
+) -> Dict[str, List[float]]:
+    """Walk agent batches through generate -> release -> generate -> arrive"""
+    agent_ids = list(env.agents)
+    timings = {
+        "generate_random_movement_command": [],
+        "release_planned_location": [],
+        "_update_agent_location": [],
+    }
+    generated = 0
+    attempted = 0
+
+    def generate(agent_id):
+        nonlocal generated, attempted
+        attempted += 1
+        if EventHandler.generate_random_movement_command(agent_id, env):
+            generated += 1
+
+    def arrive(agent_id):
+        for location_id in env.get_reservations(agent_id):
+            agent = env.agents[agent_id]
+            env._update_agent_location(
+                agent, env.get_area_for_location(location_id), location_id
+            )
+            agent.state["current_location"] = location_id
+
+    for round_index in range(repeat):
+        start = (round_index * batch) % len(agent_ids)
+        window = (agent_ids * 2)[start : start + min(batch, len(agent_ids))]
+        agents = [env.agents[agent_id] for agent_id in window]
+        timings["generate_random_movement_command"].append(time_each(generate, window))
+        timings["release_planned_location"].append(
+            time_each(env.release_planned_location, agents)
+        )
+        for agent_id in window:
+            EventHandler.generate_random_movement_command(agent_id, env)
+        timings["_update_agent_location"].append(time_each(arrive, window))
+    timings["generated_ratio"] = generated / max(1, attempted)
+    return timings
+
+
+def run_size(locations: int, agents: int, args, loop) -> Dict[str, object]:
+    operations = {}
+    per_call, env = bench_setup(setup_message(locations, agents), args.repeat, loop)
+    operations["_handle_setup"] = summarize(per_call)
+
+    areas = itertools.cycle([area for area in Area if env._get_area_key(area)])
+    operations["get_available_locations"] = summarize(
+        time_calls(lambda: env.get_available_locations(next(areas)), args.repeat)
+    )
+
+    movement = bench_movement(env, args.batch, args.repeat)
+    generated_ratio = movement.pop("generated_ratio")
+    for name, per_call in movement.items():
+        operations[name] = summarize(per_call)
+
+    operations["get_environment_state"] = summarize(
+        time_calls(env.get_environment_state, args.repeat)
+    )
+    return {
+        "locations": locations,
+        "agents": agents,
+        # Below 1.0 the world ran out of free locations and failures were timed
+        "generated_ratio": round(generated_ratio, 3),
+        "operations": operations,
+    }
+
+
+def scaling_slope(results: Dict[str, dict], operation: str):
+    """Least-squares slope of log(time) over log(locations), or None"""
+    points = [
+        (
+            math.log(entry["locations"]),
+            math.log(entry["operations"][operation]["median_us"]),
+        )
+        for entry in results.values()
+        if operation in entry["operations"]
+        and entry["operations"][operation]["median_us"] > 0
+    ]
+    if len({x for x, _ in points}) < 2:
+        return None
+    mean_x = sum(x for x, _ in points) / len(points)
+    mean_y = sum(y for _, y in points) / len(points)
+    numerator = sum((x - mean_x) * (y - mean_y) for x, y in points)
+    denominator = sum((x - mean_x) ** 2 for x, _ in points)
+    return numerator / denominator
+
+
+def compare(
+    current: dict, baseline: dict, threshold: float, slope_tolerance: float
+) -> List[str]:
+    """Print a comparison table and return the regressions found"""
+    regressions = []
+    print(
+        f"\n{'size':<14} {'operation':<34} {'baseline':>11} {'current':>11} {'ratio':>7}"
+    )
+    for size, entry in current["results"].items():
+        base_entry = baseline["results"].get(size)
+        if base_entry is None:
+            continue
+        for operation, stats in entry["operations"].items():
+            base_stats = base_entry["operations"].get(operation)
+            if base_stats is None:
+                continue
+            ratio = stats["median_us"] / max(base_stats["median_us"], 1e-9)
+            flag = ""
+            if ratio > threshold:
+                flag = "  REGRESSION"
+                regressions.append(f"{size} {operation}: {ratio:.2f}x slower")
+            print(
+                f"{size:<14} {operation:<34} {base_stats['median_us']:9.2f}us "
+                f"{stats['median_us']:9.2f}us {ratio:6.2f}x{flag}"
+            )
+
+    print(f"\n{'operation':<34} {'baseline slope':>15} {'current slope':>14}")
+    for operation in OPERATIONS:
+        shared = {
+            size: entry
+            for size, entry in current["results"].items()
+            if size in baseline["results"]
+        }
+        current_slope = scaling_slope(shared, operation)
+        baseline_slope = scaling_slope(
+            {size: baseline["results"][size] for size in shared}, operation
+        )
+        if current_slope is None or baseline_slope is None:
+            continue
+        flag = ""
+        if current_slope - baseline_slope > slope_tolerance:
+            flag = "  REGRESSION"
+            regressions.append(
+                f"{operation}: scaling slope {baseline_slope:.2f} -> {current_slope:.2f}"
+            )
+        print(f"{operation:<34} {baseline_slope:15.2f} {current_slope:14.2f}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "--sizes", default=DEFAULT_SIZES, help="comma separated LOCATIONS:AGENTS"
+    )
+    parser.add_argument("--repeat", type=int, default=5, help="rounds per operation")
+    parser.add_argument(
+        "--batch", type=int, default=1000, help="agents moved per movement round"
+    )
+    parser.add_argument("--output", help="write results as JSON")
+    parser.add_argument("--baseline", help="JSON results to compare against")
+    parser.add_argument(
+        "--threshold", type=float, default=1.3, help="allowed slowdown ratio"
+    )
+    parser.add_argument(
+        "--slope-tolerance",
+        type=float,
+        default=0.2,
+        help="allowed increase of the log-log scaling slope",
+    )
+    args = parser.parse_args()
+
+    # Per-call info logging would dominate the timings
+    setup_logger(level=logging.ERROR)
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+
+    results = {}
+    for locations, agents in parse_sizes(args.sizes):
+        entry = run_size(locations, agents, args, loop)
+        results[f"{locations}x{agents}"] = entry
+        print(f"{locations} locations, {agents} agents:")
+        for operation, stats in entry["operations"].items():
+            print(
+                f"  {operation:<34} {stats['median_us']:10.2f} us/call "
+                f"(min {stats['min_us']:.2f})"
+            )
+        if entry["generated_ratio"] < 1:
+            print(f"  destinations found for {entry['generated_ratio']:.0%} of moves")
+    loop.close()
+
+    report = {
+        "meta": {
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "repeat": args.repeat,
+            "batch": args.batch,
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nWrote {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.threshold, args.slope_tolerance)
+        if regressions:
+            print("\nRegressions:")
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(1)
+        print("\nNo regressions")
+
+
+if __name__ == "__main__":
+    main()